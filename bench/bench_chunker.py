@@ -0,0 +1,208 @@
+"""
+Benchmark e verificação de equivalência do chunker.
+
+Roda a implementação atual de chunk_markdown e a implementação original
+(que re-tokenizava o buffer a cada emit) sobre o mesmo corpus, confere que a
+saída é idêntica arquivo a arquivo e mostra o tempo de cada uma.
+
+O corpus padrão é sintético (docs de referência com blocos de código longos);
+--docs inclui também os .md de uma pasta real (ex: ./docs).
+
+Uso:
+    python bench/bench_chunker.py
+    python bench/bench_chunker.py --docs ./docs --files 40
+"""
+
+import argparse
+import random
+import re
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Garante que o root do projeto está no path ao rodar como script direto
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from ingest import chunker
+from ingest.chunker import chunk_markdown
+
+
+# ── Implementação original (referência) ──────────────────────────────────────
+def _legacy_count(text: str) -> int:
+    return len(chunker._encoder.encode(text))
+
+
+def legacy_chunk_markdown(filepath: Path) -> list[dict]:
+    source_file = filepath.name
+    collection = filepath.parent.name
+
+    text = filepath.read_text(encoding="utf-8")
+    paragraphs = [p.strip() for p in re.split(r"\n{2,}", text) if p.strip()]
+
+    result: list[dict] = []
+    chunk_index = 0
+    current_header = ""
+    chunk_header = ""
+    buf: list[str] = []
+    buf_tokens = 0
+
+    def emit():
+        nonlocal chunk_index
+        if not buf:
+            return
+        body = "\n\n".join(buf)
+        if chunk_header and not body.startswith(chunk_header):
+            full = f"{chunk_header}\n\n{body}"
+        else:
+            full = body
+        result.append(
+            {
+                "text": full.strip(),
+                "source_file": source_file,
+                "collection": collection,
+                "chunk_index": chunk_index,
+                "type": "markdown",
+                "source_path": f"{collection}/{source_file}",
+            }
+        )
+        chunk_index += 1
+
+    def rollover():
+        nonlocal buf, buf_tokens
+        new_buf: list[str] = []
+        new_tokens = 0
+        for part in reversed(buf):
+            t = _legacy_count(part)
+            if new_tokens + t > chunker.CHUNK_OVERLAP:
+                break
+            new_buf.insert(0, part)
+            new_tokens += t
+        buf = new_buf
+        buf_tokens = new_tokens
+
+    for para in paragraphs:
+        if chunker._HEADER_RE.match(para):
+            current_header = para.splitlines()[0]
+
+        para_tokens = _legacy_count(para)
+
+        if para_tokens > chunker.CHUNK_SIZE:
+            if buf:
+                emit()
+                rollover()
+                chunk_header = current_header
+            for line in para.splitlines():
+                line = line.strip()
+                if not line:
+                    continue
+                line_tokens = _legacy_count(line)
+                if buf_tokens + line_tokens > chunker.CHUNK_SIZE and buf:
+                    emit()
+                    rollover()
+                    chunk_header = current_header
+                buf.append(line)
+                buf_tokens += line_tokens
+        else:
+            if buf_tokens + para_tokens > chunker.CHUNK_SIZE:
+                emit()
+                rollover()
+                chunk_header = current_header
+            buf.append(para)
+            buf_tokens += para_tokens
+
+    if buf:
+        emit()
+
+    return result
+
+
+# ── Corpus sintético ─────────────────────────────────────────────────────────
+_WORDS = (
+    "nota fiscal produto parceiro financeiro boleto dashboard ordem produção "
+    "apontamento empresa tabela campo CODPROD NUNOTA CODPARC TGFCAB TGFITE TGFPRO "
+    "configurar liberar faturar reabrir estoque centro resultado natureza"
+).split()
+
+
+def _sentence(rng: random.Random, n: int) -> str:
+    return " ".join(rng.choice(_WORDS) for _ in range(n)).capitalize() + "."
+
+
+def _synthetic_doc(rng: random.Random) -> str:
+    parts = [f"# Guia {_sentence(rng, 3)}"]
+    for s in range(rng.randint(4, 10)):
+        parts.append(f"## Seção {s + 1} — {_sentence(rng, 4)}")
+        for _ in range(rng.randint(2, 8)):
+            parts.append(" ".join(_sentence(rng, rng.randint(6, 30)) for _ in range(rng.randint(1, 6))))
+        if rng.random() < 0.5:
+            # Bloco de código longo, maior que CHUNK_SIZE: exercita o split por linha
+            lines = [
+                f"SELECT CAB.NUNOTA, ITE.CODPROD, ITE.QTDNEG FROM TGFCAB CAB JOIN TGFITE ITE "
+                f"ON ITE.NUNOTA = CAB.NUNOTA WHERE CAB.CODPARC = {rng.randint(1, 9999)}"
+                for _ in range(rng.randint(40, 160))
+            ]
+            parts.append("```sql\n" + "\n".join(lines) + "\n```")
+    return "\n\n".join(parts) + "\n"
+
+
+def _write_corpus(root: Path, n_files: int, seed: int) -> list[Path]:
+    rng = random.Random(seed)
+    collection = root / "sintetico"
+    collection.mkdir(parents=True)
+    files = []
+    for i in range(n_files):
+        path = collection / f"doc-{i:03d}.md"
+        path.write_text(_synthetic_doc(rng), encoding="utf-8")
+        files.append(path)
+    return files
+
+
+def _time(fn, path: Path) -> tuple[list[dict], float]:
+    start = time.perf_counter()
+    out = fn(path)
+    return out, time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark/equivalência do chunker")
+    parser.add_argument("--files", type=int, default=20, help="Arquivos sintéticos a gerar")
+    parser.add_argument("--docs", type=Path, help="Pasta docs/ real a incluir no corpus")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        files = _write_corpus(Path(tmp), args.files, args.seed)
+        if args.docs:
+            files += sorted(args.docs.glob("*/*.md"))
+
+        print(f"\n{'arquivo':<36} {'KB':>6} {'chunks':>6} {'original':>10} {'atual':>10} {'speedup':>8}")
+        print("─" * 80)
+
+        mismatches = 0
+        total_legacy = total_new = 0.0
+        for path in files:
+            expected, t_legacy = _time(legacy_chunk_markdown, path)
+            got, t_new = _time(chunk_markdown, path)
+            total_legacy += t_legacy
+            total_new += t_new
+
+            status = "" if got == expected else "  ✗ DIFERENTE"
+            mismatches += bool(status)
+            name = f"{path.parent.name}/{path.name}"
+            print(
+                f"{name[-36:]:<36} {path.stat().st_size / 1024:>6.1f} {len(got):>6} "
+                f"{t_legacy * 1000:>8.1f}ms {t_new * 1000:>8.1f}ms {t_legacy / t_new:>7.1f}x{status}"
+            )
+
+    print("─" * 80)
+    print(f"{'TOTAL':<51} {total_legacy * 1000:>8.1f}ms {total_new * 1000:>8.1f}ms {total_legacy / total_new:>7.1f}x")
+
+    if mismatches:
+        print(f"\n✗ {mismatches} arquivo(s) com saída diferente da implementação original.")
+        sys.exit(1)
+    print(f"\n✓ Saída idêntica à implementação original em {len(files)} arquivos.")
+
+
+if __name__ == "__main__":
+    main()
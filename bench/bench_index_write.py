@@ -0,0 +1,112 @@
+"""
+Benchmark de escrita do índice — caminho antigo (linha a linha) x bulk.
+
+Compara, sobre chunks sintéticos com vetores aleatórios de 384 dimensões:
+  - legado: dois execute() por chunk e struct.pack de uma list[float]
+  - bulk:   insert_chunks() com executemany, ndarray.tobytes() e PRAGMAs relaxados
+
+Uso:
+    python bench/bench_index_write.py              # 20 000 chunks
+    python bench/bench_index_write.py --chunks 100000
+"""
+
+import argparse
+import struct
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Garante que o root do projeto está no path ao rodar como script direto
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import numpy as np
+
+from ingest import index_builder
+
+
+def _synthetic_chunks(n: int, rng: np.random.Generator) -> tuple[list[dict], np.ndarray]:
+    vectors = rng.standard_normal((n, index_builder.EMBEDDING_DIM), dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    chunks = [
+        {
+            "text": f"Trecho sintético {i} sobre notas fiscais, boletos e ordens de produção.",
+            "source_file": f"doc-{i // 20}.md",
+            "collection": f"colecao-{i % 4}",
+            "chunk_index": i % 20,
+            "type": "markdown",
+        }
+        for i in range(n)
+    ]
+    return chunks, vectors
+
+
+def _legacy_write(con, chunks: list[dict], vectors: np.ndarray) -> None:
+    """Réplica do build_index original: dois INSERTs e um struct.pack por chunk."""
+    for chunk, vector in zip(chunks, vectors.tolist()):
+        cur = con.execute(
+            """
+            INSERT INTO chunks (text, source_file, collection, chunk_index, type, source_path, content_hash)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            """,
+            (
+                chunk["text"],
+                chunk["source_file"],
+                chunk["collection"],
+                chunk["chunk_index"],
+                chunk["type"],
+                f"{chunk['collection']}/{chunk['source_file']}",
+                index_builder.chunk_hash(chunk["text"]),
+            ),
+        )
+        con.execute(
+            "INSERT INTO embeddings (rowid, embedding, collection, type) VALUES (?, ?, ?, ?)",
+            (cur.lastrowid, struct.pack(f"{len(vector)}f", *vector), chunk["collection"], chunk["type"]),
+        )
+    con.commit()
+
+
+def _bulk_write(con, chunks: list[dict], vectors: np.ndarray, batch_size: int) -> None:
+    index_builder.bulk_mode(con, rebuild=True)
+    for i in range(0, len(chunks), batch_size):
+        index_builder.insert_chunks(con, chunks[i : i + batch_size], vectors[i : i + batch_size])
+        con.commit()
+    index_builder.finalize_index(con)
+
+
+def _run(write, db_path: Path) -> float:
+    index_builder.DB_PATH = db_path
+    con = index_builder.open_index(rebuild=True)
+    start = time.perf_counter()
+    write(con)
+    elapsed = time.perf_counter() - start
+    con.close()
+    return elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark de escrita do índice")
+    parser.add_argument("--chunks", type=int, default=20_000, help="Número de chunks sintéticos")
+    parser.add_argument("--batch-size", type=int, default=index_builder.WRITE_BATCH_SIZE)
+    args = parser.parse_args()
+
+    chunks, vectors = _synthetic_chunks(args.chunks, np.random.default_rng(42))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy = _run(lambda con: _legacy_write(con, chunks, vectors), Path(tmp) / "legacy.db")
+        bulk = _run(
+            lambda con: _bulk_write(con, chunks, vectors, args.batch_size),
+            Path(tmp) / "bulk.db",
+        )
+
+    n = len(chunks)
+    print(f"\nEscrita de {n} chunks ({index_builder.EMBEDDING_DIM} dims)")
+    print("─" * 52)
+    print(f"  {'legado (linha a linha)':<28} {legacy:>7.2f}s  {n / legacy:>9,.0f} linhas/s")
+    print(f"  {'bulk (executemany)':<28} {bulk:>7.2f}s  {n / bulk:>9,.0f} linhas/s")
+    print(f"  {'speedup':<28} {legacy / bulk:>7.1f}x")
+    print("─" * 52)
+
+
+if __name__ == "__main__":
+    main()
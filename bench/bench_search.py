@@ -0,0 +1,293 @@
+"""
+Benchmark de qualidade e latência da busca, de ponta a ponta.
+
+Gera o corpus sintético de bench/search_corpus.py, passa pelo pipeline real
+(chunk_markdown → embed_chunks → build_index) num índice temporário e roda
+as queries rotuladas pelo corpo da tool search_docs. Mede:
+
+  - qualidade: recall@1, recall@3, recall@k e MRR por modo de busca
+    (um hit é relevante se vem do arquivo esperado e contém a seção esperada)
+  - latência: p50/p95/p99 por chamada (sem o cache de queries, por padrão)
+  - tamanho da resposta: tokens estimados por chamada (ver --max-tokens)
+  - índice: tamanho em disco; ingestão: tempo e throughput por etapa
+
+O resultado vai para um JSON; com --baseline, compara com uma execução
+anterior e sai com código 1 se recall ou MRR piorarem além da tolerância.
+Toda mudança de desempenho no chunker, no formato do índice ou na busca
+deve rodar este benchmark antes e depois.
+
+Roda offline com o modelo já baixado no cache do fastembed (--offline).
+
+Uso:
+    python bench/bench_search.py
+    python bench/bench_search.py --vector-format int8 --baseline bench/results/antes.json
+    python bench/bench_search.py --scale 200 --repeat 5 --offline
+"""
+
+import argparse
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+# Garante que o root do projeto está no path ao rodar como script direto
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from bench.search_corpus import labelled_queries, write_corpus
+
+RESULTS_DIR = Path(__file__).parent / "results"
+MODES = ("auto", "hybrid", "vector", "lexical")
+_HIT_RE = re.compile(r"^### \[\d+\] (?P<source_file>.+?) — (?P<collection>\S+) \(")
+
+
+def _parse_hits(output: str) -> list[dict]:
+    """Extrai (source_file, text) de cada resultado formatado por search_docs."""
+    hits = []
+    for part in output.split("\n\n---\n\n")[1:]:
+        header, _, text = part.partition("\n\n")
+        match = _HIT_RE.match(header)
+        if match:
+            hits.append({"source_file": match["source_file"], "text": text})
+    return hits
+
+
+def _first_relevant(hits: list[dict], expected: dict) -> int | None:
+    """Posição (1-based) do primeiro hit relevante, ou None."""
+    for rank, hit in enumerate(hits, 1):
+        if hit["source_file"] == expected["source_file"] and expected["section"] in hit["text"]:
+            return rank
+    return None
+
+
+def _percentiles(samples: list[float]) -> dict:
+    import numpy as np
+
+    ms = np.array(samples) * 1000
+    return {
+        "mean": round(float(ms.mean()), 3),
+        "p50": round(float(np.percentile(ms, 50)), 3),
+        "p95": round(float(np.percentile(ms, 95)), 3),
+        "p99": round(float(np.percentile(ms, 99)), 3),
+    }
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=Path(__file__).parent,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _compare(result: dict, baseline: dict, tolerance: float) -> int:
+    """Mostra as diferenças para a execução de referência; retorna o nº de regressões."""
+    print(f"\nComparação com a referência ({baseline.get('commit') or '?'}, {baseline.get('timestamp')}):")
+    regressions = 0
+    for mode, current in result["modes"].items():
+        before = baseline.get("modes", {}).get(mode)
+        if before is None:
+            continue
+        for metric in ("recall@1", "recall@k", "mrr"):
+            delta = current[metric] - before[metric]
+            flag = ""
+            if delta < -tolerance:
+                flag = "  ✗ REGRESSÃO"
+                regressions += 1
+            print(f"  {mode:<8} {metric:<9} {before[metric]:.3f} → {current[metric]:.3f} ({delta:+.3f}){flag}")
+        p50_before, p50_now = before["latency_ms"]["p50"], current["latency_ms"]["p50"]
+        print(f"  {mode:<8} {'p50 (ms)':<9} {p50_before:.2f} → {p50_now:.2f}")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark de qualidade/latência da busca")
+    parser.add_argument("--scale", type=int, default=0, help="Documentos extras só de preenchimento")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=3, help="Passadas cronometradas por query")
+    parser.add_argument("--modes", default=",".join(MODES), help="Modos de busca, separados por vírgula")
+    parser.add_argument("--vector-format", choices=["float", "int8", "bit"], default="float")
+    parser.add_argument("--no-sidecar", action="store_true", help="KNN pelo vec0, sem a matriz em memória")
+    parser.add_argument("--shards", action="store_true", help="Busca nos shards por coleção (src/shards.py)")
+    parser.add_argument("--rerank", action="store_true", help="Ativa o re-ranking por cross-encoder")
+    parser.add_argument("--diversify", action="store_true", help="Ativa a diversificação (MMR)")
+    parser.add_argument("--max-tokens", type=int, help="Orçamento de tokens da resposta de search_docs")
+    parser.add_argument("--with-cache", action="store_true", help="Mede com o cache de queries ativo")
+    parser.add_argument("--offline", action="store_true", help="Não acessa a rede (modelo já em cache)")
+    parser.add_argument(
+        "--quantized-query", action="store_true", help="Queries pela variante int8 do modelo (EMBED_QUERY_MODEL)"
+    )
+    parser.add_argument("--output", type=Path, help="Arquivo JSON de saída (padrão: bench/results/)")
+    parser.add_argument("--baseline", type=Path, help="JSON de uma execução anterior para comparar")
+    parser.add_argument("--tolerance", type=float, default=0.02, help="Queda máxima aceita em recall/MRR")
+    args = parser.parse_args()
+    modes = [m.strip() for m in args.modes.split(",") if m.strip()]
+
+    tmp = Path(tempfile.mkdtemp(prefix="bench-search-"))
+    docs = tmp / "docs"
+    write_corpus(docs, scale=args.scale, seed=args.seed)
+
+    # Configurado antes dos imports: os módulos leem o ambiente ao carregar
+    os.environ["SANKHYA_DB_PATH"] = str(tmp / "index.db")
+    if args.offline:
+        os.environ["EMBED_OFFLINE"] = "1"
+        os.environ["HF_HUB_OFFLINE"] = "1"
+    if args.quantized_query:
+        os.environ["EMBED_QUERY_MODEL"] = "quantized"
+    if args.no_sidecar:
+        os.environ["VECTOR_SIDECAR"] = "0"
+    if args.shards:
+        os.environ["INDEX_SHARDS"] = "1"
+
+    from ingest import embedder, index_builder
+    from ingest.chunker import chunk_markdown
+    from src import embedding, matrix_index, reranker, server
+    from src.passages import estimate_tokens
+    from src.query_cache import QueryCache
+
+    files = sorted(docs.glob("*/*.md"))
+    corpus_bytes = sum(f.stat().st_size for f in files)
+
+    # ── Ingestão ─────────────────────────────────────────────────────────────
+    t0 = time.perf_counter()
+    chunks = [c for f in files for c in chunk_markdown(f)]
+    t_chunk = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    embedded = embedder.embed_chunks(chunks)
+    t_embed = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    index_builder.build_index(embedded, fmt=args.vector_format)
+    t_index = time.perf_counter() - t0
+    index_chunks = sum(row["total"] for row in index_builder.index_stats())
+
+    # O servidor reaproveita o modelo já carregado pela ingestão (src/embedding.py),
+    # exceto com --quantized-query, que carrega a variante quantizada
+    if not args.with_cache:
+        server._query_cache = QueryCache(embedding.vectors_id(embedding.QUERY_MODEL), maxsize=0)
+    if args.rerank:
+        # Como no warm-up do servidor: sem o modelo carregado, a busca não re-ranqueia
+        reranker.get_model()
+
+    # ── Busca ────────────────────────────────────────────────────────────────
+    queries = labelled_queries()
+    k = args.top_k
+    results: dict[str, dict] = {}
+    for mode in modes:
+        def search_args(q: dict) -> tuple:
+            return (q["query"], None, k, None, mode, args.rerank, args.diversify, args.max_tokens)
+
+        for q in queries:  # aquecimento (conexões, statements, caches do SQLite)
+            server._search_docs(*search_args(q))
+
+        ranks: list[int | None] = []
+        latencies: list[float] = []
+        output_tokens: list[int] = []
+        for rep in range(max(1, args.repeat)):
+            for q in queries:
+                t0 = time.perf_counter()
+                output = server._search_docs(*search_args(q))
+                latencies.append(time.perf_counter() - t0)
+                if rep == 0:
+                    ranks.append(_first_relevant(_parse_hits(output), q))
+                    output_tokens.append(estimate_tokens(output))
+
+        results[mode] = {
+            "recall@1": round(sum(r == 1 for r in ranks if r) / len(ranks), 4),
+            "recall@3": round(sum(r <= 3 for r in ranks if r) / len(ranks), 4),
+            "recall@k": round(sum(1 for r in ranks if r) / len(ranks), 4),
+            "mrr": round(sum(1 / r for r in ranks if r) / len(ranks), 4),
+            "latency_ms": _percentiles(latencies),
+            "output_tokens": round(sum(output_tokens) / len(output_tokens), 1),
+            "misses": [q["query"] for q, r in zip(queries, ranks) if r is None],
+        }
+
+    server._index.close()
+    server._shards.close()
+    index_bytes = Path(os.environ["SANKHYA_DB_PATH"]).stat().st_size
+    shutil.rmtree(tmp, ignore_errors=True)
+
+    result = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "config": {
+            "scale": args.scale,
+            "seed": args.seed,
+            "top_k": k,
+            "repeat": args.repeat,
+            "vector_format": args.vector_format,
+            # Com VECTOR_SIDECAR=auto, índices quantizados não têm a matriz
+            "vector_sidecar": matrix_index.export_enabled(args.vector_format),
+            "shards": args.shards,
+            "query_model": embedding.model_id(embedding.QUERY_MODEL),
+            "query_cache": args.with_cache,
+            "rerank": args.rerank,
+            "diversify": args.diversify,
+            "max_tokens": args.max_tokens,
+        },
+        "corpus": {
+            "files": len(files),
+            "bytes": corpus_bytes,
+            "chunks": len(chunks),
+            "duplicates_dropped": len(chunks) - index_chunks,
+            "queries": len(queries),
+        },
+        "ingest": {
+            "chunk_s": round(t_chunk, 3),
+            "embed_s": round(t_embed, 3),
+            "index_s": round(t_index, 3),
+            "chunks_per_s": round(len(chunks) / (t_chunk + t_embed + t_index), 1),
+            "mb_per_s": round(corpus_bytes / 1024 / 1024 / (t_chunk + t_embed + t_index), 3),
+        },
+        "index": {"bytes": index_bytes, "vector_format": args.vector_format},
+        "modes": results,
+    }
+
+    # ── Relatório ────────────────────────────────────────────────────────────
+    print(
+        f"\nCorpus: {len(files)} arquivos, {corpus_bytes / 1024:.0f} KB, {len(chunks)} chunks, "
+        f"{len(queries)} queries  |  índice {args.vector_format}: {index_bytes / 1024:.0f} KB"
+    )
+    print(
+        f"Ingestão: chunking {t_chunk:.2f}s, embeddings {t_embed:.2f}s, índice {t_index:.2f}s "
+        f"({result['ingest']['chunks_per_s']} chunks/s)\n"
+    )
+    print(
+        f"{'modo':<8} {'R@1':>6} {'R@3':>6} {f'R@{k}':>6} {'MRR':>6} "
+        f"{'p50':>9} {'p95':>9} {'p99':>9} {'tokens':>7}"
+    )
+    print("─" * 74)
+    for mode, r in results.items():
+        lat = r["latency_ms"]
+        print(
+            f"{mode:<8} {r['recall@1']:>6.3f} {r['recall@3']:>6.3f} {r['recall@k']:>6.3f} {r['mrr']:>6.3f} "
+            f"{lat['p50']:>7.2f}ms {lat['p95']:>7.2f}ms {lat['p99']:>7.2f}ms {r['output_tokens']:>7.0f}"
+        )
+
+    output = args.output or RESULTS_DIR / f"search-{datetime.now():%Y%m%d-%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(result, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"\nResultado salvo em {output}")
+
+    if args.baseline:
+        regressions = _compare(result, json.loads(args.baseline.read_text(encoding="utf-8")), args.tolerance)
+        if regressions:
+            print(f"\n✗ {regressions} métrica(s) de qualidade pioraram além de {args.tolerance}.")
+            sys.exit(1)
+        print("\n✓ Qualidade dentro da tolerância.")
+
+
+if __name__ == "__main__":
+    main()
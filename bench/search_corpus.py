@@ -0,0 +1,220 @@
+"""
+Corpus sintético no estilo da documentação do Sankhya, com queries rotuladas.
+
+Cada documento tem seções com um fato específico; cada query aponta para a
+seção (arquivo + título) que a responde. Parágrafos de preenchimento gerados
+com vocabulário do domínio fazem os documentos render vários chunks e servem
+de distratores. `scale` acrescenta documentos só de preenchimento, para
+medir como a qualidade e a latência se comportam com um índice maior.
+"""
+
+import random
+from pathlib import Path
+
+# (coleção, arquivo, título, [(título da seção, corpo, [queries])])
+DOCUMENTS = [
+    (
+        "boletos-emissao",
+        "emissao-boletos.md",
+        "Emissão de boletos",
+        [
+            (
+                "Gerar boletos em lote",
+                "Na tela Movimentação Financeira, selecione os títulos a receber, clique em "
+                "Outras Opções e escolha Gerar Boletos. O sistema gera um arquivo PDF por "
+                "parceiro e registra o nosso número em TGFFIN.NOSSONUM.",
+                ["como emitir boletos em lote", "gerar vários boletos de uma vez"],
+            ),
+            (
+                "Configurar a conta bancária para boletos",
+                "Em Cadastro de Contas Bancárias informe a carteira, o convênio e o layout "
+                "CNAB 240 ou CNAB 400. Sem a carteira preenchida o botão Gerar Boletos fica "
+                "desabilitado.",
+                ["onde configuro carteira e convênio do banco", "layout CNAB 240"],
+            ),
+            (
+                "Remessa e retorno bancário",
+                "O arquivo de remessa é gerado em Financeiro > Remessa Bancária. O retorno é "
+                "importado na mesma tela e baixa automaticamente os títulos liquidados.",
+                ["importar arquivo de retorno do banco", "baixa automática de títulos pagos"],
+            ),
+        ],
+    ),
+    (
+        "boletos-emissao",
+        "exportar-xml-nfe.md",
+        "Exportação de XMLs de NF-e",
+        [
+            (
+                "Exportar XMLs por período",
+                "Acesse Portal de Vendas, filtre as notas pela data de faturamento e use a "
+                "opção Exportar XML. Os arquivos são compactados em um ZIP com a chave de "
+                "acesso como nome.",
+                ["como exportar xml das notas fiscais do mês", "baixar XML de NF-e em lote"],
+            ),
+            (
+                "Enviar XML ao contador",
+                "A rotina Envio Automático de XML manda os arquivos por e-mail ao contador "
+                "cadastrado no parâmetro EMAILCONTADOR, todo dia 5.",
+                ["mandar xml para o contador por email", "EMAILCONTADOR"],
+            ),
+        ],
+    ),
+    (
+        "dashboards-html5",
+        "criar-dashboard.md",
+        "Criação de dashboards HTML5",
+        [
+            (
+                "Criar um componente HTML5",
+                "No Construtor de Componentes de BI, escolha o tipo HTML5, envie o arquivo ZIP "
+                "com index.html e os scripts, e vincule as variáveis do componente.",
+                ["como criar um dashboard html5", "subir zip com index.html no construtor de BI"],
+            ),
+            (
+                "Passar parâmetros para o dashboard",
+                "Os parâmetros do componente ficam disponíveis no JavaScript pela função "
+                "getParam. Use o prefixo P_ no nome, por exemplo P_CODEMP.",
+                ["ler parâmetro no javascript do dashboard", "getParam P_CODEMP"],
+            ),
+        ],
+    ),
+    (
+        "dashboards-html5",
+        "otimizar-queries.md",
+        "Otimização de queries para dashboards",
+        [
+            (
+                "Evitar consultas lentas no dashboard",
+                "Filtre sempre por DTNEG com índice e evite funções sobre colunas no WHERE. "
+                "Consultas acima de 30 segundos são canceladas pelo servidor de BI.",
+                ["dashboard lento como otimizar a consulta", "consulta cancelada após 30 segundos"],
+            ),
+            (
+                "Usar a view de itens faturados",
+                "A view VGF_ITENS_FATURADOS já junta TGFCAB e TGFITE com os campos de "
+                "faturamento e é mais rápida que o JOIN manual.",
+                ["VGF_ITENS_FATURADOS", "juntar TGFCAB e TGFITE mais rápido"],
+            ),
+        ],
+    ),
+    (
+        "reabertura-ops",
+        "reabrir-op.md",
+        "Reabertura de ordens de produção",
+        [
+            (
+                "Reabrir uma OP finalizada",
+                "Em Operações de Produção, localize a OP pelo número IDIPROC, clique com o "
+                "botão direito e escolha Reabrir. Só é possível se não houver nota de "
+                "entrada gerada a partir da OP.",
+                ["como reabrir ordem de produção finalizada", "IDIPROC reabrir"],
+            ),
+            (
+                "Erro ORA-01403 ao reabrir",
+                "O erro ORA-01403 indica que a atividade final da OP foi excluída. Recrie a "
+                "atividade em TPRIATV antes de reabrir.",
+                ["ORA-01403", "erro no data found ao reabrir OP"],
+            ),
+        ],
+    ),
+    (
+        "reabertura-ops",
+        "corrigir-apontamentos.md",
+        "Correção de apontamentos",
+        [
+            (
+                "Corrigir quantidade apontada",
+                "Estorne o apontamento em Apontamento de Produção e lance novamente com a "
+                "quantidade correta. O estoque do produto acabado é ajustado no estorno.",
+                ["apontamento com quantidade errada como corrigir", "estornar apontamento de produção"],
+            ),
+            (
+                "Perdas no apontamento",
+                "Informe as perdas no campo QTDPERDA; elas baixam o estoque dos componentes "
+                "sem gerar produto acabado.",
+                ["registrar perda na produção", "QTDPERDA"],
+            ),
+        ],
+    ),
+    (
+        "faturamento",
+        "faturar-pedido.md",
+        "Faturamento de pedidos",
+        [
+            (
+                "Faturar pedido de venda",
+                "Na Central de Vendas selecione o pedido e clique em Faturar. Escolha a TOP "
+                "de venda de destino; o sistema gera a nota com o NUNOTA novo e vincula o "
+                "pedido de origem em TGFVAR.",
+                ["como faturar um pedido de venda", "gerar nota a partir do pedido"],
+            ),
+            (
+                "Confirmar a nota",
+                "Após o faturamento a nota fica pendente. Use Confirmar para atualizar o "
+                "estoque e o financeiro; a nota confirmada tem STATUSNOTA igual a L.",
+                ["nota pendente não atualizou estoque", "STATUSNOTA L"],
+            ),
+        ],
+    ),
+    (
+        "faturamento",
+        "tipos-operacao.md",
+        "Tipos de operação (TOP)",
+        [
+            (
+                "Configurar uma TOP",
+                "Em Tipos de Operação defina se a TOP movimenta estoque, gera financeiro e "
+                "exige aprovação. As alterações criam uma nova versão com DHALTER.",
+                ["configurar tipo de operação que movimenta estoque", "versão da TOP DHALTER"],
+            ),
+        ],
+    ),
+]
+
+_FILLER = (
+    "nota fiscal produto parceiro financeiro empresa tabela campo configuração rotina "
+    "usuário permissão relatório estoque centro resultado natureza vendedor comprador "
+    "pedido cotação tela botão filtro campo obrigatório cadastro integração"
+).split()
+
+
+def _sentence(rng: random.Random, n: int) -> str:
+    return " ".join(rng.choice(_FILLER) for _ in range(n)).capitalize() + "."
+
+
+def _filler(rng: random.Random, paragraphs: int) -> list[str]:
+    return [
+        " ".join(_sentence(rng, rng.randint(8, 20)) for _ in range(rng.randint(2, 5)))
+        for _ in range(paragraphs)
+    ]
+
+
+def write_corpus(root: Path, scale: int = 0, seed: int = 7) -> None:
+    """Grava o corpus em <root>/<coleção>/<arquivo>.md (o layout de docs/)."""
+    rng = random.Random(seed)
+    for collection, filename, title, sections in DOCUMENTS:
+        parts = [f"# {title}", *_filler(rng, 2)]
+        for heading, body, _ in sections:
+            parts += [f"## {heading}", body, *_filler(rng, rng.randint(4, 10))]
+        path = root / collection / filename
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text("\n\n".join(parts) + "\n", encoding="utf-8")
+
+    for i in range(scale):
+        parts = [f"# Documento complementar {i}"]
+        for s in range(rng.randint(3, 8)):
+            parts += [f"## Tópico {s + 1}", *_filler(rng, rng.randint(2, 6))]
+        path = root / "complementar" / f"doc-{i:04d}.md"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text("\n\n".join(parts) + "\n", encoding="utf-8")
+
+
+def labelled_queries() -> list[dict]:
+    """Queries com a resposta esperada: {query, source_file, section}."""
+    return [
+        {"query": query, "source_file": filename, "section": heading}
+        for _, filename, _, sections in DOCUMENTS
+        for heading, _, queries in sections
+        for query in queries
+    ]
@@ -5,7 +5,7 @@ const path = require("path");
 const packageDir = path.join(__dirname, "..");
 const serverScript = path.join(packageDir, "src", "server.py");
 
-const proc = spawn("uv", ["run", "python", serverScript], {
+const proc = spawn("uv", ["run", "python", serverScript, ...process.argv.slice(2)], {
   cwd: packageDir,
   stdio: "inherit",
 });
@@ -0,0 +1,122 @@
+"""
+Hook de build do hatch: escolhe os arquivos do índice que entram no pacote.
+
+src/data fica fora da seleção normal (pyproject.toml) e o hook inclui um
+único corpus. Com shards (src/shards.py, manifesto em src/data/shards), o
+servidor só lê os shards: entram o manifesto e os arquivos listados nele, e
+o index.db — que a ingestão mantém para as atualizações incrementais — fica
+de fora. Sem shards, entra o index.db, obrigatório.
+
+A matriz de vetores exportada ao lado de cada banco (src/matrix_index.py)
+depende de VECTOR_SIDECAR na ingestão, então entra no pacote só quando
+existe. Se existe, precisa estar completa e corresponder ao banco (mesmo
+carimbo): senão o build falha, em vez de gerar um pacote cuja matriz o
+servidor ignoraria. O mesmo vale para o índice IVF (src/ivf.py,
+ANN_INDEX=ivf): se o manifesto da matriz o declara, o .ivf.npz tem de estar
+presente.
+
+A matriz é float32 mesmo para índices int8 ou bit; ao lado de um índice
+quantizado (exportada com VECTOR_SIDECAR=1) ela anula a economia de espaço,
+e o build avisa.
+"""
+
+import json
+import sqlite3
+from pathlib import Path
+
+from hatchling.builders.hooks.plugin.interface import BuildHookInterface
+
+DATA_DIR = "src/data"
+# Mesmos nomes e chaves de src/matrix_index.py, src/ivf.py e src/shards.py (o hook
+# roda sem as dependências do projeto)
+SIDECAR_SUFFIXES = (".vectors.npy", ".rows.npy", ".vectors.json")
+IVF_SUFFIX = ".ivf.npz"
+SIDECAR_META_KEY = "vectors_sidecar"
+FORMAT_META_KEY = "vector_format"
+SHARDS_DIR = "shards"
+SHARD_MANIFEST = "manifest.json"
+
+
+def _index_meta(db_path: Path, key: str) -> str | None:
+    con = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        row = con.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    except sqlite3.OperationalError:
+        return None
+    finally:
+        con.close()
+    return row[0] if row else None
+
+
+def _shard_files(data_dir: Path) -> list[Path] | None:
+    """Manifesto e bancos dos shards, ou None se o índice não é dividido."""
+    directory = data_dir / SHARDS_DIR
+    try:
+        manifest = json.loads((directory / SHARD_MANIFEST).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    entries = manifest.get("collections", {})
+    if not entries:
+        return None
+    files = [directory / entry["file"] for entry in entries.values()]
+    missing = [path.name for path in files if not path.exists()]
+    if missing:
+        raise RuntimeError(
+            f"Shards listados em {DATA_DIR}/{SHARDS_DIR}/{SHARD_MANIFEST} não existem: "
+            f"{', '.join(sorted(missing))}. Refaça a ingestão (--shards on ou off)."
+        )
+    return [directory / SHARD_MANIFEST, *files]
+
+
+class CustomBuildHook(BuildHookInterface):
+    def initialize(self, version: str, build_data: dict) -> None:
+        root = Path(self.root)
+        data_dir = root / DATA_DIR
+        files = _shard_files(data_dir)
+        if files is None:
+            db_path = data_dir / "index.db"
+            if not db_path.exists():
+                # A instalação editável (uv run) lê src/data no lugar: o índice pode vir depois
+                if version == "editable":
+                    return
+                raise RuntimeError(f"Índice não encontrado em {DATA_DIR}/index.db. Rode a ingestão antes do build.")
+            files = [db_path]
+        for db_path in [path for path in files if path.suffix == ".db"]:
+            files += self._sidecars(db_path)
+
+        for path in files:
+            build_data["force_include"][str(path)] = path.relative_to(root).as_posix()
+
+    def _sidecars(self, db_path: Path) -> list[Path]:
+        """Matriz de vetores (e IVF) de `db_path`, validada contra o banco."""
+        stem = db_path.with_suffix("")
+        paths = [stem.with_name(stem.name + suffix) for suffix in SIDECAR_SUFFIXES]
+        present = [path for path in paths if path.exists()]
+        if not present:
+            return []
+        where = db_path.relative_to(self.root).as_posix()
+        hint = f"Refaça a ingestão ou apague os arquivos {stem.name}.vectors.* e {stem.name}.rows.npy."
+        if len(present) != len(paths):
+            missing = sorted(path.name for path in paths if path not in present)
+            raise RuntimeError(f"Matriz de vetores de {where} incompleta: faltam {', '.join(missing)}. {hint}")
+
+        manifest = json.loads(paths[2].read_text(encoding="utf-8"))
+        if manifest.get("stamp") != _index_meta(db_path, SIDECAR_META_KEY):
+            raise RuntimeError(f"Matriz de vetores desatualizada em relação a {where}. {hint}")
+        fmt = _index_meta(db_path, FORMAT_META_KEY) or "float"
+        if fmt != "float":
+            size = paths[0].stat().st_size / 2**20
+            self.app.display_warning(
+                f"Matriz float32 de {size:.1f} MB ao lado de {where} ({fmt}): o pacote perde a "
+                f"economia da quantização. Para deixá-la de fora, apague os arquivos "
+                f"{stem.name}.vectors.* e {stem.name}.rows.npy (a busca usa o vec0)."
+            )
+        if manifest.get("ann", {}).get("type") == "ivf":
+            ivf = stem.with_name(stem.name + IVF_SUFFIX)
+            if not ivf.exists():
+                raise RuntimeError(
+                    f"A matriz de vetores de {where} usa o IVF, mas {ivf.name} não existe. "
+                    "Refaça a ingestão (--ann ivf) ou exporte sem o IVF (--ann none)."
+                )
+            paths.append(ivf)
+        return paths
@@ -14,36 +14,53 @@ _encoder = tiktoken.get_encoding("cl100k_base")
 _HEADER_RE = re.compile(r"^#{1,3} .+", re.MULTILINE)
 
 
-def _count(text: str) -> int:
-    return len(_encoder.encode(text))
+def _count_batch(texts: list[str]) -> list[int]:
+    """Conta tokens de vários textos numa única chamada (tokenização em paralelo)."""
+    if not texts:
+        return []
+    return [len(tokens) for tokens in _encoder.encode_batch(texts)]
 
 
 def chunk_markdown(filepath: str | Path) -> list[dict]:
     """
     Divide um arquivo .md em chunks semânticos.
 
+    Cada parágrafo (ou linha, em parágrafos maiores que CHUNK_SIZE) é
+    tokenizado uma única vez; o buffer carrega a contagem de tokens de cada
+    parte, de modo que emit/rollover não re-tokenizam nada.
+
     Retorna lista de dicts com:
-      text, source_file, collection, chunk_index, type
+      text, source_file, collection, chunk_index, type, source_path
     """
     filepath = Path(filepath)
     source_file = filepath.name
     collection = filepath.parent.name
+    source_path = f"{collection}/{source_file}"
 
     text = filepath.read_text(encoding="utf-8")
     paragraphs = [p.strip() for p in re.split(r"\n{2,}", text) if p.strip()]
+    para_counts = _count_batch(paragraphs)
+
+    # Linhas dos parágrafos grandes (ex: blocos de código longos), tokenizadas em lote
+    oversized = [i for i, n in enumerate(para_counts) if n > CHUNK_SIZE]
+    para_lines: dict[int, list[str]] = {
+        i: [line.strip() for line in paragraphs[i].splitlines() if line.strip()] for i in oversized
+    }
+    flat_counts = iter(_count_batch([line for i in oversized for line in para_lines[i]]))
+    line_counts = {i: [next(flat_counts) for _ in para_lines[i]] for i in oversized}
 
     result: list[dict] = []
     chunk_index = 0
     current_header = ""   # último header visto
     chunk_header = ""     # header ativo quando o chunk atual começou
-    buf: list[str] = []
+    buf: list[tuple[str, int]] = []   # (parte, tokens)
     buf_tokens = 0
 
     def emit():
         nonlocal chunk_index
         if not buf:
             return
-        body = "\n\n".join(buf)
+        body = "\n\n".join(part for part, _ in buf)
         # Garante contexto do header no início do chunk
         if chunk_header and not body.startswith(chunk_header):
             full = f"{chunk_header}\n\n{body}"
@@ -56,6 +73,7 @@ def chunk_markdown(filepath: str | Path) -> list[dict]:
                 "collection": collection,
                 "chunk_index": chunk_index,
                 "type": "markdown",
+                "source_path": source_path,
             }
         )
         chunk_index += 1
@@ -63,23 +81,23 @@ def chunk_markdown(filepath: str | Path) -> list[dict]:
     def rollover():
         """Mantém os últimos CHUNK_OVERLAP tokens no buffer para o próximo chunk."""
         nonlocal buf, buf_tokens
-        new_buf: list[str] = []
+        kept: list[tuple[str, int]] = []
         new_tokens = 0
-        for part in reversed(buf):
-            t = _count(part)
+        for part, t in reversed(buf):
             if new_tokens + t > CHUNK_OVERLAP:
                 break
-            new_buf.insert(0, part)
+            kept.append((part, t))
             new_tokens += t
-        buf = new_buf
+        kept.reverse()
+        buf = kept
         buf_tokens = new_tokens
 
-    for para in paragraphs:
+    for i, para in enumerate(paragraphs):
         # Rastreia o header da seção atual
         if _HEADER_RE.match(para):
             current_header = para.splitlines()[0]
 
-        para_tokens = _count(para)
+        para_tokens = para_counts[i]
 
         # Parágrafo maior que CHUNK_SIZE (ex: bloco de código longo): split por linha
         if para_tokens > CHUNK_SIZE:
@@ -87,23 +105,19 @@ def chunk_markdown(filepath: str | Path) -> list[dict]:
                 emit()
                 rollover()
                 chunk_header = current_header
-            for line in para.splitlines():
-                line = line.strip()
-                if not line:
-                    continue
-                line_tokens = _count(line)
+            for line, line_tokens in zip(para_lines[i], line_counts[i]):
                 if buf_tokens + line_tokens > CHUNK_SIZE and buf:
                     emit()
                     rollover()
                     chunk_header = current_header
-                buf.append(line)
+                buf.append((line, line_tokens))
                 buf_tokens += line_tokens
         else:
             if buf_tokens + para_tokens > CHUNK_SIZE:
                 emit()
                 rollover()
                 chunk_header = current_header
-            buf.append(para)
+            buf.append((para, para_tokens))
             buf_tokens += para_tokens
 
     if buf:
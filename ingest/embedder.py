@@ -1,28 +1,114 @@
 import logging
-from typing import Generator
+import os
+from collections import deque
+from itertools import chain, islice
+from typing import Iterable, Iterator
 
-from fastembed import TextEmbedding
+import numpy as np
+
+from src import embedding
 
 logger = logging.getLogger(__name__)
 
-MODEL_NAME = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
-BATCH_SIZE = 100
+BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "100"))
+# Processos de embedding (paralelismo de dados do fastembed); 1 = processo único, 0 = todos os núcleos
+WORKERS = int(os.getenv("EMBED_WORKERS", "1"))
+# Threads intra-op do ONNX Runtime (EMBED_THREADS, ver src/embedding.py). Só valem com
+# WORKERS = 1: o fastembed fixa 1 thread em cada um dos seus processos de trabalho
+THREADS = embedding.THREADS
+# Quantos lotes são lidos de uma vez para ordenar os textos por tamanho
+SORT_WINDOW = 16
 
-_model: TextEmbedding | None = None
 
+def _batches(items: Iterable, size: int) -> Iterator[list]:
+    it = iter(items)
+    while batch := list(islice(it, size)):
+        yield batch
 
-def _get_model() -> TextEmbedding:
-    global _model
-    if _model is None:
-        logger.info(f"Carregando modelo de embedding: {MODEL_NAME}")
-        _model = TextEmbedding(model_name=MODEL_NAME)
-        logger.info("Modelo carregado.")
-    return _model
 
+def _as_array(embedding: bytes | list[float] | np.ndarray) -> np.ndarray:
+    """Converte um embedding já existente (bytes do sqlite-vec ou lista) para float32."""
+    if isinstance(embedding, bytes):
+        return np.frombuffer(embedding, dtype=np.float32)
+    return np.asarray(embedding, dtype=np.float32)
 
-def _batches(lst: list, size: int) -> Generator[list, None, None]:
-    for i in range(0, len(lst), size):
-        yield lst[i : i + size]
+
+def embed_stream(
+    chunks: Iterable[dict],
+    batch_size: int = BATCH_SIZE,
+    workers: int = WORKERS,
+    threads: int | None = THREADS,
+) -> Iterator[tuple[list[dict], np.ndarray]]:
+    """
+    Gera embeddings em streaming: consome os chunks sob demanda e produz
+    (lote de chunks, matriz float32 [len(lote), 384], linhas com norma 1) a
+    cada `batch_size`, na ordem de entrada.
+
+    Os textos são lidos em janelas de SORT_WINDOW lotes e ordenados por
+    tamanho antes de ir para o modelo, o que reduz o padding dentro de cada
+    lote do ONNX. Todo o stream passa por uma única chamada a model.embed, de
+    modo que, com workers > 1, o pool de processos do fastembed é criado uma
+    só vez. Chunks que já trazem 'embedding' (reaproveitado do índice) não
+    passam pelo modelo. A memória fica limitada a uma janela (mais o
+    read-ahead dos workers).
+    """
+    parallel = None if workers == 1 else workers
+    if parallel is not None and threads:
+        logger.warning(
+            f"EMBED_THREADS={threads} ignorado com {workers or 'todos os'} workers: "
+            "o fastembed usa 1 thread por processo de trabalho."
+        )
+        threads = None
+    windows: deque[tuple[list[dict], list[int]]] = deque()
+
+    def texts() -> Iterator[str]:
+        for window in _batches(chunks, batch_size * SORT_WINDOW):
+            todo = sorted(
+                (i for i, c in enumerate(window) if "embedding" not in c),
+                key=lambda i: len(window[i]["text"]),
+            )
+            windows.append((window, todo))
+            for i in todo:
+                yield window[i]["text"]
+
+    # Só carrega o modelo se houver ao menos um texto a embedar
+    pending_texts = texts()
+    first = next(pending_texts, None)
+    if first is None:
+        vectors: Iterator[np.ndarray] = iter(())
+    else:
+        # Com workers, cada processo carrega o próprio modelo: o do processo principal fica lazy
+        model = embedding.get_model(threads=threads, lazy_load=parallel is not None)
+        vectors = iter(
+            model.embed(chain([first], pending_texts), batch_size=batch_size, parallel=parallel)
+        )
+    ahead: deque[np.ndarray] = deque()
+    exhausted = False
+
+    while True:
+        # As janelas só entram na fila quando o modelo puxa seus textos
+        if not windows and not exhausted:
+            vector = next(vectors, None)
+            if vector is None:
+                exhausted = True
+            else:
+                ahead.append(vector)
+        if not windows:
+            if exhausted:
+                break
+            continue
+
+        window, todo = windows.popleft()
+        rows: list[np.ndarray | None] = [
+            _as_array(c["embedding"]) if "embedding" in c else None for c in window
+        ]
+        for i in todo:
+            rows[i] = ahead.popleft() if ahead else next(vectors)
+
+        for start in range(0, len(window), batch_size):
+            batch_rows = rows[start : start + batch_size]
+            # Vetores reaproveitados do índice já vêm normalizados; normalizar de novo não os altera
+            yield window[start : start + batch_size], embedding.normalize(np.vstack(batch_rows))
 
 
 def embed_chunks(chunks: list[dict]) -> list[dict]:
@@ -31,23 +117,20 @@ def embed_chunks(chunks: list[dict]) -> list[dict]:
 
     Recebe lista de dicts com campo 'text'.
     Retorna a mesma lista com campo 'embedding: list[float]' adicionado.
+    Para corpora grandes, prefira embed_stream (memória constante).
     """
     if not chunks:
         return []
 
-    model = _get_model()
     result = list(chunks)  # cópia para não mutar o input
 
     total = len(result)
     logger.info(f"Gerando embeddings para {total} chunks em batches de {BATCH_SIZE}...")
 
     processed = 0
-    for batch in _batches(result, BATCH_SIZE):
-        texts = [c["text"] for c in batch]
-        embeddings = list(model.embed(texts))
-
-        for chunk, embedding in zip(batch, embeddings):
-            chunk["embedding"] = embedding.tolist()
+    for batch, vectors in embed_stream(result, BATCH_SIZE):
+        for chunk, vector in zip(batch, vectors):
+            chunk["embedding"] = vector.tolist()
 
         processed += len(batch)
         logger.info(f"  {processed}/{total} chunks processados")
@@ -1,7 +1,16 @@
 import base64
+import hashlib
 import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
+from typing import Iterable, Iterator
 
+import openai
 from dotenv import load_dotenv
 from openai import OpenAI
 
@@ -9,13 +18,23 @@ load_dotenv()
 
 logger = logging.getLogger(__name__)
 
+VISION_MODEL = "gpt-4o"
+CONCURRENCY = int(os.getenv("IMAGE_CONCURRENCY", "4"))
+MAX_RETRIES = int(os.getenv("IMAGE_MAX_RETRIES", "6"))
+CACHE_PATH = Path(
+    os.getenv("IMAGE_CACHE_PATH", str(Path(__file__).parent / ".cache" / "image_descriptions.db"))
+)
+
 _client: OpenAI | None = None
+_client_lock = threading.Lock()
 
 
 def _get_client() -> OpenAI:
     global _client
-    if _client is None:
-        _client = OpenAI()
+    with _client_lock:
+        if _client is None:
+            # Retentativas ficam a cargo de _create_with_retry (backoff compartilhado)
+            _client = OpenAI(max_retries=0)
     return _client
 
 SUPPORTED_EXTENSIONS = {".png", ".jpg", ".jpeg", ".webp", ".gif"}
@@ -28,6 +47,105 @@ _PROMPT = (
     "valores visíveis que possam ser úteis para responder dúvidas de usuários."
 )
 
+# Muda sempre que o prompt ou o modelo mudam — invalida o cache de descrições
+PROMPT_VERSION = hashlib.sha256(f"{VISION_MODEL}\n{_PROMPT}".encode("utf-8")).hexdigest()[:16]
+
+
+# ── Cache persistente de descrições ──────────────────────────────────────────
+class _DescriptionCache:
+    """Descrições já geradas, por (hash da imagem, versão do prompt)."""
+
+    def __init__(self, path: Path) -> None:
+        self._path = path
+        self._con: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._con is None:
+            self._path.parent.mkdir(parents=True, exist_ok=True)
+            self._con = sqlite3.connect(self._path, check_same_thread=False)
+            self._con.execute("""
+                CREATE TABLE IF NOT EXISTS descriptions (
+                    image_hash     TEXT NOT NULL,
+                    prompt_version TEXT NOT NULL,
+                    description    TEXT NOT NULL,
+                    PRIMARY KEY (image_hash, prompt_version)
+                )
+            """)
+        return self._con
+
+    def get(self, image_hash: str) -> str | None:
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT description FROM descriptions WHERE image_hash = ? AND prompt_version = ?",
+                (image_hash, PROMPT_VERSION),
+            ).fetchone()
+        return row[0] if row else None
+
+    def put(self, image_hash: str, description: str) -> None:
+        with self._lock:
+            con = self._connect()
+            con.execute(
+                "INSERT OR REPLACE INTO descriptions (image_hash, prompt_version, description) VALUES (?, ?, ?)",
+                (image_hash, PROMPT_VERSION, description),
+            )
+            con.commit()
+
+
+_cache = _DescriptionCache(CACHE_PATH)
+
+
+# ── Backoff compartilhado entre as threads ───────────────────────────────────
+class _RateLimitGate:
+    """Quando uma requisição recebe 429, todas as threads esperam o mesmo intervalo."""
+
+    def __init__(self) -> None:
+        self._until = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self) -> None:
+        with self._lock:
+            delay = self._until - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def pause(self, seconds: float) -> None:
+        with self._lock:
+            self._until = max(self._until, time.monotonic() + seconds)
+
+
+_gate = _RateLimitGate()
+
+
+def _retry_after(exc: openai.APIStatusError) -> float | None:
+    value = exc.response.headers.get("retry-after") if exc.response is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def _create_with_retry(**kwargs):
+    """chat.completions.create com backoff exponencial (e jitter) em 429, 5xx e falhas de rede."""
+    for attempt in range(MAX_RETRIES + 1):
+        _gate.wait()
+        try:
+            return _get_client().chat.completions.create(**kwargs)
+        except openai.RateLimitError as exc:
+            if attempt == MAX_RETRIES:
+                raise
+            delay = _retry_after(exc)
+            if delay is None:
+                delay = min(60.0, 2.0 ** attempt) + random.random()
+            _gate.pause(delay)
+            logger.info(f"  429 da API — aguardando {delay:.1f}s (tentativa {attempt + 1}/{MAX_RETRIES})")
+        except (openai.InternalServerError, openai.APIConnectionError) as exc:
+            if attempt == MAX_RETRIES:
+                raise
+            delay = min(60.0, 2.0 ** attempt) + random.random()
+            logger.info(f"  {type(exc).__name__} — nova tentativa em {delay:.1f}s")
+            time.sleep(delay)
+
 
 def describe_image(filepath: str | Path) -> dict:
     """
@@ -36,8 +154,11 @@ def describe_image(filepath: str | Path) -> dict:
     A imagem deve estar dentro de uma pasta 'images/' que fica dentro de uma
     pasta de coleção. Exemplo: docs/dashboards-html5/images/tela.png
 
+    Descrições já geradas para a mesma imagem (mesmo conteúdo) e a mesma
+    versão do prompt vêm do cache em disco, sem chamar a API.
+
     Retorna dict com:
-      text, source_file, collection, chunk_index, type
+      text, source_file, collection, chunk_index, type, source_path
     """
     filepath = Path(filepath)
 
@@ -49,34 +170,42 @@ def describe_image(filepath: str | Path) -> dict:
     source_file = filepath.name
     collection = filepath.parent.parent.name
 
-    logger.info(f"Descrevendo imagem: {source_file} (coleção: {collection})")
-
-    # Codifica a imagem em base64
-    image_data = base64.standard_b64encode(filepath.read_bytes()).decode("utf-8")
-    mime_type = _get_mime_type(filepath.suffix.lower())
-
-    response = _get_client().chat.completions.create(
-        model="gpt-4o",
-        messages=[
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "image_url",
-                        "image_url": {
-                            "url": f"data:{mime_type};base64,{image_data}",
-                            "detail": "high",
+    raw = filepath.read_bytes()
+    image_hash = hashlib.sha256(raw).hexdigest()
+
+    description = _cache.get(image_hash)
+    if description is not None:
+        logger.info(f"Descrição em cache: {source_file} (coleção: {collection})")
+    else:
+        logger.info(f"Descrevendo imagem: {source_file} (coleção: {collection})")
+
+        # Codifica a imagem em base64
+        image_data = base64.standard_b64encode(raw).decode("utf-8")
+        mime_type = _get_mime_type(filepath.suffix.lower())
+
+        response = _create_with_retry(
+            model=VISION_MODEL,
+            messages=[
+                {
+                    "role": "user",
+                    "content": [
+                        {
+                            "type": "image_url",
+                            "image_url": {
+                                "url": f"data:{mime_type};base64,{image_data}",
+                                "detail": "high",
+                            },
                         },
-                    },
-                    {"type": "text", "text": _PROMPT},
-                ],
-            }
-        ],
-        max_tokens=1024,
-    )
+                        {"type": "text", "text": _PROMPT},
+                    ],
+                }
+            ],
+            max_tokens=1024,
+        )
 
-    description = response.choices[0].message.content.strip()
-    logger.info(f"  → {len(description)} caracteres gerados")
+        description = response.choices[0].message.content.strip()
+        _cache.put(image_hash, description)
+        logger.info(f"  → {len(description)} caracteres gerados")
 
     return {
         "text": description,
@@ -84,9 +213,33 @@ def describe_image(filepath: str | Path) -> dict:
         "collection": collection,
         "chunk_index": 0,
         "type": "image_description",
+        "source_path": f"{collection}/images/{source_file}",
     }
 
 
+def describe_images(
+    filepaths: Iterable[str | Path], concurrency: int = CONCURRENCY
+) -> Iterator[tuple[Path, dict | Exception]]:
+    """
+    Descreve várias imagens em paralelo (até `concurrency` requisições simultâneas).
+
+    Gera (caminho, chunk) à medida que cada descrição fica pronta — ou
+    (caminho, exceção) se a imagem falhou mesmo após as retentativas.
+    """
+    paths = [Path(p) for p in filepaths]
+    if not paths:
+        return
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="vision") as pool:
+        futures = {pool.submit(describe_image, path): path for path in paths}
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                yield path, future.result()
+            except Exception as exc:
+                yield path, exc
+
+
 def _get_mime_type(ext: str) -> str:
     return {
         ".png": "image/png",
@@ -1,77 +1,834 @@
+import hashlib
 import logging
+import os
+import re
+import shutil
 import sqlite3
-import struct
+import time
 from pathlib import Path
 
+import numpy as np
 import sqlite_vec
 
+from src import embedding, ivf, matrix_index, shards
+from src.embedding import EMBEDDING_DIM
+from src.vectors import (
+    VECTOR_FORMATS,
+    column_type,
+    dequantize_int8,
+    quantize,
+    quantize_int8,
+    sql_constructor,
+)
+
 logger = logging.getLogger(__name__)
 
-DB_PATH = Path(__file__).parent.parent / "src" / "data" / "index.db"
-EMBEDDING_DIM = 384  # paraphrase-multilingual-MiniLM-L12-v2
+DB_PATH = Path(os.getenv("SANKHYA_DB_PATH") or Path(__file__).parent.parent / "src" / "data" / "index.db")
+SCHEMA_VERSION = "5"
+WRITE_BATCH_SIZE = 1000  # chunks por executemany em build_index
+DEFAULT_VECTOR_FORMAT = "float"
+# Similaridade de cosseno a partir da qual um chunk é quase idêntico a outro
+# da mesma coleção e tipo (e, confirmado pelo texto, não é gravado); 0 desativa a deduplicação
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.97"))
+# Índice aproximado exportado com a matriz de vetores (none ou ivf; ver src/ivf.py)
+ANN_INDEX = os.getenv("ANN_INDEX", "none")
+# Grava também um arquivo por coleção em src/data/shards (ver src/shards.py)
+INDEX_SHARDS = os.getenv("INDEX_SHARDS", "0") == "1"
+_DEDUP_NEIGHBORS = 4  # vizinhos consultados (alguns podem ser de arquivos prestes a mudar)
+# Além do cosseno, o texto: Jaccard mínimo entre os trigramas de palavras dos dois chunks
+_DEDUP_JACCARD = 0.8
+_WORD_RE = re.compile(r"\w+")
+
+_SCHEMA = """
+    CREATE TABLE meta (
+        key   TEXT PRIMARY KEY,
+        value TEXT NOT NULL
+    );
+
+    -- Um registro por arquivo de origem (markdown ou imagem), com o hash do
+    -- conteúdo: a ingestão incremental só reprocessa o que mudou
+    CREATE TABLE files (
+        path         TEXT PRIMARY KEY,   -- <coleção>/<arquivo> ou <coleção>/images/<arquivo>
+        collection   TEXT NOT NULL,
+        source_file  TEXT NOT NULL,
+        type         TEXT NOT NULL,
+        content_hash TEXT NOT NULL
+    );
+
+    CREATE TABLE chunks (
+        id           INTEGER PRIMARY KEY,  -- == embeddings.rowid
+        text         TEXT    NOT NULL,
+        source_file  TEXT    NOT NULL,
+        collection   TEXT    NOT NULL,
+        chunk_index  INTEGER NOT NULL,
+        type         TEXT    NOT NULL,
+        source_path  TEXT    NOT NULL,     -- == files.path
+        content_hash TEXT    NOT NULL      -- hash do texto do chunk
+    );
+
+    CREATE INDEX chunks_source_path ON chunks (source_path);
+    CREATE INDEX chunks_content_hash ON chunks (content_hash);
+{position_index}
+
+    -- Deduplicação: `path` teve chunks descartados por serem quase idênticos
+    -- a chunks de `of_path`. Se of_path mudar ou sumir, path é reprocessado.
+    CREATE TABLE duplicates (
+        path    TEXT NOT NULL,
+        of_path TEXT NOT NULL,
+        PRIMARY KEY (path, of_path)
+    ) WITHOUT ROWID;
+
+    CREATE INDEX duplicates_of_path ON duplicates (of_path);
+
+    -- collection e type como colunas de metadados: os filtros de search_docs
+    -- são aplicados dentro da busca KNN. Não como partition key: o vec0
+    -- pré-aloca blocos de 1024 vetores por partição, o que multiplica o
+    -- tamanho do arquivo com coleções pequenas e torna a busca sem filtro
+    -- mais lenta (um scan por partição)
+    CREATE VIRTUAL TABLE embeddings USING vec0(
+        embedding  {embedding_type},
+        collection TEXT,
+        type       TEXT
+    );
+
+    -- Índice textual (BM25) sobre chunks.text, para termos exatos
+    -- (nomes de tabela, códigos de campo, mensagens de erro)
+    CREATE VIRTUAL TABLE chunks_fts USING fts5(
+        text,
+        content='chunks',
+        content_rowid='id',
+        tokenize="unicode61 remove_diacritics 2 tokenchars '_'"
+    );
+
+    -- Mantém o FTS5 (external content) sincronizado com chunks
+    CREATE TRIGGER chunks_ai AFTER INSERT ON chunks BEGIN
+        INSERT INTO chunks_fts (rowid, text) VALUES (new.id, new.text);
+    END;
+    CREATE TRIGGER chunks_ad AFTER DELETE ON chunks BEGIN
+        INSERT INTO chunks_fts (chunks_fts, rowid, text) VALUES ('delete', old.id, old.text);
+    END;
+"""
+
+# Formato 'bit': cópia int8 dos vetores para re-ranking dos candidatos da busca binária
+_RESCORE_SCHEMA = """
+    CREATE TABLE vectors_int8 (
+        id        INTEGER PRIMARY KEY,   -- == chunks.id
+        embedding BLOB    NOT NULL
+    );
+"""
+
+
+# Vizinhos de um chunk no arquivo (get_context / expand do servidor) numa
+# única busca por intervalo de chunk_index
+_POSITION_INDEX = """
+    CREATE INDEX IF NOT EXISTS chunks_position ON chunks (collection, source_file, chunk_index);
+"""
+
+_INSERT_CHUNK_SQL = """
+    INSERT INTO chunks
+        (id, text, source_file, collection, chunk_index, type, source_path, content_hash)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+"""
+_INSERT_EMBEDDING_SQL = (
+    "INSERT INTO embeddings (rowid, embedding, collection, type) VALUES (?, {constructor}(?), ?, ?)"
+)
+
+
+def _as_matrix(embeddings: list) -> np.ndarray:
+    """Empilha embeddings (list[float], ndarray ou bytes float32) numa matriz float32."""
+    return np.vstack([
+        np.frombuffer(e, dtype=np.float32) if isinstance(e, bytes) else np.asarray(e, dtype=np.float32)
+        for e in embeddings
+    ])
+
+
+def vector_format(con: sqlite3.Connection) -> str:
+    row = con.execute("SELECT value FROM meta WHERE key = 'vector_format'").fetchone()
+    return row[0] if row else DEFAULT_VECTOR_FORMAT
+
 
+def chunk_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
 
-def _serialize(embedding: list[float]) -> bytes:
-    return struct.pack(f"{len(embedding)}f", *embedding)
 
+def _default_source_path(chunk: dict) -> str:
+    if chunk["type"] == "image_description":
+        return f"{chunk['collection']}/images/{chunk['source_file']}"
+    return f"{chunk['collection']}/{chunk['source_file']}"
 
-def build_index(chunks: list[dict]) -> None:
+
+def _connect(path: Path | None = None) -> sqlite3.Connection:
+    con = sqlite3.connect(path or DB_PATH)
+    con.enable_load_extension(True)
+    sqlite_vec.load(con)
+    con.enable_load_extension(False)
+    return con
+
+
+def _create(con: sqlite3.Connection, fmt: str) -> None:
+    con.executescript(
+        _SCHEMA.format(
+            embedding_type=column_type(fmt, EMBEDDING_DIM), position_index=_POSITION_INDEX
+        )
+    )
+    if fmt == "bit":
+        con.executescript(_RESCORE_SCHEMA)
+    con.executemany(
+        "INSERT INTO meta (key, value) VALUES (?, ?)",
+        [("schema_version", SCHEMA_VERSION), ("vector_format", fmt)],
+    )
+    embedding.record_model(con)
+    con.commit()
+
+
+def open_index(rebuild: bool = False, fmt: str | None = None, partial: bool = False) -> sqlite3.Connection:
     """
-    Constrói (ou reconstrói do zero) o índice vetorial em data/index.db.
+    Abre o índice para escrita, criando-o se necessário.
 
-    Recebe lista de chunks já com campo 'embedding: list[float]'.
+    `fmt` é o formato dos vetores (float, int8 ou bit); None mantém o do
+    índice existente (ou float, num índice novo). Com rebuild=True — ou se o
+    índice existente for de um schema anterior, de outro formato de vetores
+    ou de outro modelo de embedding — o arquivo é apagado e recriado do zero.
+
+    `partial` indica uma ingestão que só reprocessa parte do corpus (uma
+    coleção): aí um rebuild implícito apagaria as demais coleções, então
+    levanta ValueError em vez de reconstruir.
     """
+    if fmt is not None and fmt not in VECTOR_FORMATS:
+        raise ValueError(f"Formato de vetores inválido: {fmt}. Use: {VECTOR_FORMATS}")
+
     DB_PATH.parent.mkdir(parents=True, exist_ok=True)
 
+    if DB_PATH.exists() and not rebuild:
+        con = _connect()
+        try:
+            row = con.execute("SELECT value FROM meta WHERE key = 'schema_version'").fetchone()
+        except sqlite3.OperationalError:
+            row = None
+        if row is None or row[0] != SCHEMA_VERSION:
+            reason = "Índice em formato anterior"
+        elif fmt is not None and vector_format(con) != fmt:
+            reason = f"Formato dos vetores mudou ({vector_format(con)} → {fmt})"
+        elif embedding.index_model(con) != (embedding.MODEL_NAME, EMBEDDING_DIM):
+            reason = f"Modelo de embedding mudou ({embedding.index_model(con)[0]})"
+        else:
+            # Índices criados depois do schema atual entram sem rebuild
+            con.executescript(_POSITION_INDEX)
+            embedding.record_model(con)
+            con.commit()
+            return con
+        con.close()
+        if partial:
+            raise ValueError(
+                f"{reason}: o índice precisa ser reconstruído com todas as coleções. "
+                "Rode a ingestão sem --collection."
+            )
+        logger.info(f"{reason} — rebuild completo.")
+
     # Remove o banco anterior para rebuild completo
     if DB_PATH.exists():
         DB_PATH.unlink()
         logger.info("Índice anterior removido.")
 
-    con = sqlite3.connect(DB_PATH)
-    con.enable_load_extension(True)
-    sqlite_vec.load(con)
-    con.enable_load_extension(False)
+    con = _connect()
+    _create(con, fmt or DEFAULT_VECTOR_FORMAT)
+    return con
 
-    con.executescript(f"""
-        CREATE TABLE chunks (
-            id          INTEGER PRIMARY KEY,
-            text        TEXT    NOT NULL,
-            source_file TEXT    NOT NULL,
-            collection  TEXT    NOT NULL,
-            chunk_index INTEGER NOT NULL,
-            type        TEXT    NOT NULL
-        );
-
-        CREATE VIRTUAL TABLE embeddings USING vec0(
-            embedding FLOAT[{EMBEDDING_DIM}]
-        );
-    """)
 
-    logger.info(f"Inserindo {len(chunks)} chunks no índice...")
+def file_hashes(con: sqlite3.Connection, collection: str | None = None) -> dict[str, str]:
+    """Retorna {path: content_hash} dos arquivos já indexados (opcionalmente de uma coleção)."""
+    if collection:
+        rows = con.execute(
+            "SELECT path, content_hash FROM files WHERE collection = ?", (collection,)
+        )
+    else:
+        rows = con.execute("SELECT path, content_hash FROM files")
+    return dict(rows.fetchall())
 
-    for chunk in chunks:
-        cur = con.execute(
-            """
-            INSERT INTO chunks (text, source_file, collection, chunk_index, type)
-            VALUES (?, ?, ?, ?, ?)
+
+def cached_embeddings(con: sqlite3.Connection, hashes: list[str]) -> dict[str, np.ndarray]:
+    """
+    Retorna {content_hash: embedding float32} para chunks cujo texto já está indexado.
+
+    Nos formatos quantizados o vetor volta dequantizado do int8 — quantizá-lo
+    de novo reproduz o mesmo valor armazenado.
+    """
+    fmt = vector_format(con)
+    source = "vectors_int8 v ON v.id" if fmt == "bit" else "embeddings v ON v.rowid"
+    found: dict[str, np.ndarray] = {}
+    for h in set(hashes):
+        row = con.execute(
+            f"""
+            SELECT v.embedding
+            FROM chunks c JOIN {source} = c.id
+            WHERE c.content_hash = ?
+            LIMIT 1
             """,
+            (h,),
+        ).fetchone()
+        if row is None:
+            continue
+        if fmt == "float":
+            found[h] = np.frombuffer(row[0], dtype=np.float32)
+        else:
+            found[h] = dequantize_int8(row[0])
+    return found
+
+
+def remove_file(con: sqlite3.Connection, path: str) -> int:
+    """Remove um arquivo de origem e todos os seus chunks/embeddings. Retorna nº de chunks."""
+    ids = [r[0] for r in con.execute("SELECT id FROM chunks WHERE source_path = ?", (path,))]
+    con.executemany("DELETE FROM embeddings WHERE rowid = ?", [(i,) for i in ids])
+    if vector_format(con) == "bit":
+        con.executemany("DELETE FROM vectors_int8 WHERE id = ?", [(i,) for i in ids])
+    con.execute("DELETE FROM chunks WHERE source_path = ?", (path,))
+    con.execute("DELETE FROM files WHERE path = ?", (path,))
+    con.execute("DELETE FROM duplicates WHERE path = ?", (path,))
+    return len(ids)
+
+
+def dependent_files(con: sqlite3.Connection, paths: set[str]) -> set[str]:
+    """Arquivos com chunks descartados como duplicatas de `paths` (transitivamente)."""
+    found: set[str] = set()
+    frontier = set(paths)
+    while frontier:
+        placeholders = ",".join("?" * len(frontier))
+        rows = con.execute(
+            f"SELECT DISTINCT path FROM duplicates WHERE of_path IN ({placeholders})",
+            list(frontier),
+        )
+        frontier = {r[0] for r in rows} - found - set(paths)
+        found |= frontier
+    return found
+
+
+def near_duplicates(
+    con: sqlite3.Connection,
+    chunks: list[dict],
+    vectors: np.ndarray,
+    threshold: float = DEDUP_THRESHOLD,
+    ignore_path=None,
+) -> list[str | None]:
+    """
+    Para cada chunk, o source_path de um chunk quase idêntico (cosseno >=
+    `threshold` e mesmo texto, ver _same_text) da mesma coleção e tipo — já
+    no índice ou anterior no mesmo lote —, ou None se o chunk é novo.
+
+    `ignore_path(path)` exclui vizinhos de arquivos que serão substituídos.
+    """
+    fmt = vector_format(con)
+    query_vectors = quantize(vectors, fmt)
+    knn_sql = f"""
+        SELECT e.rowid, e.embedding, c.source_path, c.text
+        FROM (
+            SELECT rowid, embedding
+            FROM embeddings
+            WHERE embedding MATCH {sql_constructor(fmt)}(?) AND k = ?
+              AND collection = ? AND type = ?
+        ) e
+        JOIN chunks c ON c.id = e.rowid
+    """
+    unit = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    result: list[str | None] = []
+    kept: dict[tuple[str, str], list[int]] = {}
+
+    for i, chunk in enumerate(chunks):
+        group = (chunk["collection"], chunk["type"])
+        match = None
+
+        earlier = kept.get(group, [])
+        if earlier:
+            sims = unit[earlier] @ unit[i]
+            for j in np.argsort(-sims):
+                if sims[j] < threshold:
+                    break
+                other = chunks[earlier[j]]
+                if _same_text(chunk["text"], other["text"]):
+                    match = other.get("source_path") or _default_source_path(other)
+                    break
+
+        if match is None:
+            rows = [
+                r
+                for r in con.execute(knn_sql, (query_vectors[i].tobytes(), _DEDUP_NEIGHBORS, *group))
+                if ignore_path is None or not ignore_path(r[2])
+            ]
+            if rows:
+                stored = _stored_vectors(con, fmt, rows)
+                stored /= np.maximum(np.linalg.norm(stored, axis=1, keepdims=True), 1e-12)
+                sims = stored @ unit[i]
+                for j in np.argsort(-sims):
+                    if sims[j] < threshold:
+                        break
+                    if _same_text(chunk["text"], rows[j][3]):
+                        match = rows[j][2]
+                        break
+
+        if match is None:
+            kept.setdefault(group, []).append(i)
+        result.append(match)
+    return result
+
+
+def _same_text(text: str, other: str) -> bool:
+    """Confirma no texto uma duplicata apontada pelo cosseno.
+
+    O embedding mal distingue trechos que diferem só num identificador
+    (CODPROD × CODPARC); descartar um deles tiraria o identificador da busca
+    textual. Exige que toda palavra de `text` exista em `other` e que os
+    trigramas de palavras dos dois tenham Jaccard >= _DEDUP_JACCARD.
+    """
+    words = _WORD_RE.findall(text.lower())
+    other_words = _WORD_RE.findall(other.lower())
+    if not set(words) <= set(other_words):
+        return False
+    shingles = {tuple(words[i : i + 3]) for i in range(max(1, len(words) - 2))}
+    other_shingles = {tuple(other_words[i : i + 3]) for i in range(max(1, len(other_words) - 2))}
+    return len(shingles & other_shingles) / len(shingles | other_shingles) >= _DEDUP_JACCARD
+
+
+def _stored_vectors(con: sqlite3.Connection, fmt: str, rows: list[tuple]) -> np.ndarray:
+    """Vetores float32 (dequantizados, se for o caso) das linhas (rowid, embedding, ...) do KNN."""
+    if fmt == "float":
+        return np.vstack([np.frombuffer(r[1], dtype=np.float32) for r in rows])
+    if fmt == "int8":
+        return np.vstack([dequantize_int8(r[1]) for r in rows])
+    placeholders = ",".join("?" * len(rows))
+    by_id = dict(
+        con.execute(f"SELECT id, embedding FROM vectors_int8 WHERE id IN ({placeholders})", [r[0] for r in rows])
+    )
+    return np.vstack([dequantize_int8(by_id[r[0]]) for r in rows])
+
+
+def insert_unique(
+    con: sqlite3.Connection,
+    chunks: list[dict],
+    vectors: np.ndarray,
+    threshold: float = DEDUP_THRESHOLD,
+    ignore_path=None,
+) -> int:
+    """
+    insert_chunks que descarta chunks quase idênticos a outros já indexados
+    (ver near_duplicates) e registra a dependência em `duplicates`.
+    Retorna o número de chunks descartados.
+    """
+    if threshold <= 0 or not chunks:
+        insert_chunks(con, chunks, vectors)
+        return 0
+
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    matches = near_duplicates(con, chunks, vectors, threshold, ignore_path)
+    keep = [i for i, match in enumerate(matches) if match is None]
+    insert_chunks(con, [chunks[i] for i in keep], vectors[keep])
+
+    links = {
+        (chunk.get("source_path") or _default_source_path(chunk), match)
+        for chunk, match in zip(chunks, matches)
+        if match is not None
+    }
+    con.executemany(
+        "INSERT OR IGNORE INTO duplicates (path, of_path) VALUES (?, ?)",
+        [(path, of_path) for path, of_path in links if path != of_path],
+    )
+    return len(chunks) - len(keep)
+
+
+def record_file(
+    con: sqlite3.Connection, path: str, collection: str, source_file: str, doc_type: str, content_hash: str
+) -> None:
+    con.execute(
+        """
+        INSERT OR REPLACE INTO files (path, collection, source_file, type, content_hash)
+        VALUES (?, ?, ?, ?, ?)
+        """,
+        (path, collection, source_file, doc_type, content_hash),
+    )
+
+
+def insert_chunks(
+    con: sqlite3.Connection, chunks: list[dict], vectors: np.ndarray | None = None
+) -> None:
+    """
+    Insere chunks no índice em lote (executemany). Os vetores vêm de `vectors`
+    (matriz float32, uma linha por chunk) ou, na falta dela, do campo
+    'embedding' de cada chunk (list[float] ou bytes no formato sqlite-vec).
+
+    chunks.id e embeddings.rowid recebem sempre o mesmo valor.
+    """
+    if not chunks:
+        return
+    if vectors is None:
+        vectors = _as_matrix([c["embedding"] for c in chunks])
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    fmt = vector_format(con)
+    # Matriz já no formato do índice: cada linha vira bytes sem conversão por elemento
+    stored = quantize(vectors, fmt)
+
+    first_id = con.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM chunks").fetchone()[0]
+    ids = range(first_id, first_id + len(chunks))
+
+    con.executemany(
+        _INSERT_CHUNK_SQL,
+        [
             (
+                row_id,
                 chunk["text"],
                 chunk["source_file"],
                 chunk["collection"],
                 chunk["chunk_index"],
                 chunk["type"],
-            ),
+                chunk.get("source_path") or _default_source_path(chunk),
+                chunk.get("content_hash") or chunk_hash(chunk["text"]),
+            )
+            for row_id, chunk in zip(ids, chunks)
+        ],
+    )
+    con.executemany(
+        _INSERT_EMBEDDING_SQL.format(constructor=sql_constructor(fmt)),
+        [
+            (row_id, vector.tobytes(), chunk["collection"], chunk["type"])
+            for row_id, chunk, vector in zip(ids, chunks, stored)
+        ],
+    )
+    if fmt == "bit":
+        con.executemany(
+            "INSERT INTO vectors_int8 (id, embedding) VALUES (?, ?)",
+            [(row_id, vector.tobytes()) for row_id, vector in zip(ids, quantize_int8(vectors))],
         )
-        row_id = cur.lastrowid
 
+
+def bulk_mode(con: sqlite3.Connection, rebuild: bool) -> None:
+    """
+    Relaxa journal/sync durante a escrita. Num rebuild o arquivo é novo (uma
+    falha é resolvida rodando de novo), então journal e fsync são desligados;
+    na ingestão incremental o journal é mantido para não corromper o índice.
+    """
+    if rebuild:
+        con.execute("PRAGMA journal_mode = OFF")
+        con.execute("PRAGMA synchronous = OFF")
+    else:
+        con.execute("PRAGMA synchronous = NORMAL")
+    con.execute("PRAGMA temp_store = MEMORY")
+    con.execute("PRAGMA cache_size = -65536")
+
+
+def ann_index(con: sqlite3.Connection) -> str:
+    """Índice aproximado escolhido para este índice (meta), ou o padrão ANN_INDEX."""
+    row = con.execute("SELECT value FROM meta WHERE key = 'ann_index'").fetchone()
+    return row[0] if row else ANN_INDEX
+
+
+def export_vectors(con: sqlite3.Connection, ann: str | None = None, db_path: Path | None = None) -> None:
+    """
+    Exporta todos os vetores para a matriz float32 ao lado do índice (src/matrix_index.py).
+
+    Nos formatos quantizados a matriz recebe os vetores int8 dequantizados —
+    os mesmos que o re-ranking do vec0 usaria. `ann` ("none" ou "ivf") escolhe
+    o índice aproximado; None mantém o da última exportação. `db_path` é o
+    arquivo ao lado do qual a matriz é gravada (padrão: DB_PATH).
+
+    Sem exportação (VECTOR_SIDECAR=0, ou índice quantizado com o padrão
+    auto), apaga a matriz anterior se ela já não vale para o índice (nada de
+    arquivos desatualizados no pacote, ver hatch_build.py).
+    """
+    fmt = vector_format(con)
+    if not matrix_index.export_enabled(fmt):
+        if matrix_index.current_stamp(con) is None:
+            _remove_sidecars(db_path or DB_PATH)
+        return
+    ann = ann or ann_index(con)
+    if ann not in matrix_index.ANN_TYPES:
+        raise ValueError(f"Índice aproximado inválido: {ann}. Use: {matrix_index.ANN_TYPES}")
+    con.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('ann_index', ?)", (ann,))
+
+    source = "vectors_int8 v ON v.id" if fmt == "bit" else "embeddings v ON v.rowid"
+    (count,) = con.execute(f"SELECT COUNT(*) FROM chunks c JOIN {source} = c.id").fetchone()
+    # Preenchida linha a linha: com milhões de chunks, não há cópia intermediária
+    matrix = np.empty((count, EMBEDDING_DIM), dtype=np.float32)
+    ids, collections, types = [], [], []
+    rows = con.execute(
+        f"SELECT c.id, c.collection, c.type, v.embedding FROM chunks c JOIN {source} = c.id"
+    )
+    for i, (chunk_id, collection, doc_type, blob) in enumerate(rows):
+        if fmt == "float":
+            matrix[i] = np.frombuffer(blob, dtype=np.float32)
+        else:
+            matrix[i] = dequantize_int8(blob)
+        ids.append(chunk_id)
+        collections.append(collection)
+        types.append(doc_type)
+
+    t0 = time.perf_counter()
+    matrix_index.export(con, db_path or DB_PATH, ids, collections, types, matrix, ann=ann)
+    logger.info(
+        f"Matriz de vetores exportada: {count} × {EMBEDDING_DIM} float32"
+        + (f", índice IVF em {time.perf_counter() - t0:.1f}s." if ann == "ivf" else ".")
+    )
+
+
+def finalize_index(con: sqlite3.Connection, ann: str | None = None, db_path: Path | None = None) -> None:
+    """Compacta o índice após a escrita: otimiza o FTS5, atualiza estatísticas e faz VACUUM."""
+    con.commit()
+    export_vectors(con, ann, db_path)
+    logger.info("Otimizando índice (FTS5 optimize, ANALYZE, VACUUM)...")
+    con.execute("INSERT INTO chunks_fts (chunks_fts) VALUES ('optimize')")
+    con.execute("ANALYZE")
+    con.commit()
+    con.execute("PRAGMA journal_mode = DELETE")
+    con.execute("PRAGMA synchronous = FULL")
+    con.execute("VACUUM")
+
+
+def shard_mode(con: sqlite3.Connection) -> bool:
+    """Se este índice exporta shards por coleção (meta), ou o padrão INDEX_SHARDS."""
+    row = con.execute("SELECT value FROM meta WHERE key = 'shards'").fetchone()
+    return row[0] == "on" if row else INDEX_SHARDS
+
+
+def _collection_digests(con: sqlite3.Connection) -> dict[str, tuple[int, str]]:
+    """{coleção: (nº de chunks, digest dos chunks e arquivos)} — muda quando a coleção muda."""
+    digests: dict = {}
+    counts: dict[str, int] = {}
+    rows = con.execute("SELECT collection, id, content_hash FROM chunks ORDER BY collection, id")
+    for collection, chunk_id, content_hash in rows:
+        digests.setdefault(collection, hashlib.sha256()).update(f"{chunk_id}:{content_hash}\n".encode())
+        counts[collection] = counts.get(collection, 0) + 1
+    for collection, path, content_hash in con.execute(
+        "SELECT collection, path, content_hash FROM files ORDER BY collection, path"
+    ):
+        digests.setdefault(collection, hashlib.sha256()).update(f"{path}:{content_hash}\n".encode())
+    return {name: (counts.get(name, 0), digest.hexdigest()) for name, digest in digests.items()}
+
+
+def _remove_sidecars(path: Path) -> None:
+    for file in (*matrix_index.sidecar_paths(path), ivf.ivf_path(path)):
+        file.unlink(missing_ok=True)
+
+
+def _remove_shard(path: Path) -> None:
+    path.unlink(missing_ok=True)
+    _remove_sidecars(path)
+
+
+def _write_shard(path: Path, collection: str, fmt: str, ann: str) -> None:
+    """Grava o shard de uma coleção copiando suas linhas do index.db (já commitado)."""
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.unlink(missing_ok=True)
+    con = _connect(tmp)
+    bulk_mode(con, rebuild=True)
+    _create(con, fmt)
+    con.execute("ATTACH DATABASE ? AS src", (str(DB_PATH),))
+    con.execute("INSERT INTO meta (key, value) VALUES ('shard_collection', ?)", (collection,))
+    con.execute(
+        """
+        INSERT INTO chunks
+            (id, text, source_file, collection, chunk_index, type, source_path, content_hash)
+        SELECT id, text, source_file, collection, chunk_index, type, source_path, content_hash
+        FROM src.chunks WHERE collection = ? ORDER BY id
+        """,
+        (collection,),
+    )
+    con.execute("INSERT INTO files SELECT * FROM src.files WHERE collection = ?", (collection,))
+    con.execute(
+        f"""
+        INSERT INTO embeddings (rowid, embedding, collection, type)
+        SELECT e.rowid, {sql_constructor(fmt)}(e.embedding), e.collection, e.type
+        FROM src.embeddings e
+        WHERE e.rowid IN (SELECT id FROM chunks)
+        """
+    )
+    if fmt == "bit":
         con.execute(
-            "INSERT INTO embeddings (rowid, embedding) VALUES (?, ?)",
-            (row_id, _serialize(chunk["embedding"])),
+            "INSERT INTO vectors_int8 SELECT * FROM src.vectors_int8 WHERE id IN (SELECT id FROM chunks)"
+        )
+    con.commit()
+    con.execute("DETACH DATABASE src")
+    # A matriz leva o nome final do shard; o carimbo fica no arquivo temporário
+    finalize_index(con, ann, db_path=path)
+    con.close()
+    os.replace(tmp, path)
+
+
+def _write_npmignore(enabled: bool) -> None:
+    """
+    Com shards, tira o index.db e sua matriz do pacote npm (`files` leva src/
+    inteiro, mas respeita o .npmignore de subdiretórios) — o mesmo corte que
+    hatch_build.py faz no wheel: o servidor só lê os shards.
+    """
+    path = DB_PATH.parent / ".npmignore"
+    if not enabled:
+        path.unlink(missing_ok=True)
+        return
+    names = [DB_PATH, *matrix_index.sidecar_paths(DB_PATH), ivf.ivf_path(DB_PATH)]
+    path.write_text(
+        "# Gerado pela ingestão (--shards on): o pacote leva só os shards\n"
+        + "".join(f"{p.name}\n" for p in names)
+        + f"{DB_PATH.name}-*\n",
+        encoding="utf-8",
+    )
+
+
+def export_shards(con: sqlite3.Connection, enabled: bool | None = None) -> None:
+    """
+    Grava um shard por coleção e o manifesto em src/data/shards (src/shards.py).
+
+    Só as coleções cujo digest mudou desde a última exportação são regravadas;
+    shards de coleções removidas são apagados. `enabled` None mantém a escolha
+    registrada no índice; False apaga os shards existentes.
+
+    Os shards reutilizam os ids do index.db, que continua sendo a fonte da
+    ingestão incremental mas deixa de ir para os pacotes (hatch_build.py).
+    """
+    enabled = shard_mode(con) if enabled is None else enabled
+    con.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('shards', ?)", ("on" if enabled else "off",))
+    con.commit()
+    _write_npmignore(enabled)
+    directory = shards.shards_dir(DB_PATH)
+    if not enabled:
+        if directory.exists():
+            shutil.rmtree(directory)
+            logger.info(f"Shards removidos: {directory}")
+        return
+
+    directory.mkdir(parents=True, exist_ok=True)
+    fmt, ann = vector_format(con), ann_index(con)
+    previous = shards.read_manifest(directory) or {}
+    # Outro modelo, formato de vetores ou índice aproximado: todos os shards são regravados
+    same_layout = (
+        previous.get("embedding_model") == embedding.MODEL_NAME
+        and previous.get("vector_format") == fmt
+        and previous.get("ann_index") == ann
+    )
+    entries = previous.get("collections", {}) if same_layout else {}
+
+    collections: dict[str, dict] = {}
+    written = 0
+    for collection, (count, digest) in sorted(_collection_digests(con).items()):
+        path = shards.shard_path(directory, collection)
+        entry = entries.get(collection)
+        if not (entry and entry["digest"] == digest and path.exists()):
+            _write_shard(path, collection, fmt, ann)
+            written += 1
+        collections[collection] = {"file": path.name, "chunks": count, "digest": digest}
+
+    for collection in entries.keys() - collections.keys():
+        _remove_shard(shards.shard_path(directory, collection))
+
+    shards.write_manifest(
+        directory,
+        {
+            "schema_version": SCHEMA_VERSION,
+            "embedding_model": embedding.MODEL_NAME,
+            "vector_format": fmt,
+            "ann_index": ann,
+            "collections": collections,
+        },
+    )
+    logger.info(f"Shards: {written} de {len(collections)} coleções regravados em {directory}")
+
+
+class IndexWriter:
+    """
+    Grava no índice os lotes produzidos pelo pipeline em streaming.
+
+    Cada arquivo de origem é substituído por inteiro: as linhas antigas são
+    removidas quando o primeiro chunk novo chega, e o hash do arquivo só é
+    registrado depois que o último chunk foi gravado — uma ingestão
+    interrompida reprocessa o arquivo na próxima execução. Há um commit por
+    lote, então o índice pode ser consultado enquanto é preenchido.
+    """
+
+    def __init__(
+        self,
+        con: sqlite3.Connection,
+        replacing: set[str] | None = None,
+        dedup_threshold: float = DEDUP_THRESHOLD,
+    ) -> None:
+        self.con = con
+        self.written = 0
+        self.duplicates = 0
+        self.dedup_threshold = dedup_threshold
+        self._expected: dict[str, tuple[tuple, int]] = {}
+        self._started: set[str] = set()
+        # Arquivos que esta execução vai substituir ou remover: enquanto as
+        # linhas antigas existirem, não servem de referência para a deduplicação
+        self._stale = set(replacing or ())
+
+    def expect_file(
+        self, path: str, collection: str, source_file: str, doc_type: str, content_hash: str, n_chunks: int
+    ) -> None:
+        """Anuncia um arquivo cujos `n_chunks` chunks virão nos próximos lotes."""
+        record = (path, collection, source_file, doc_type, content_hash)
+        if n_chunks == 0:
+            remove_file(self.con, path)
+            self._stale.discard(path)
+            record_file(self.con, *record)
+            self.con.commit()
+            return
+        self._expected[path] = (record, n_chunks)
+
+    def write_batch(self, chunks: list[dict], vectors: np.ndarray) -> None:
+        for path in {c["source_path"] for c in chunks} - self._started:
+            remove_file(self.con, path)
+            self._started.add(path)
+            self._stale.discard(path)
+
+        dropped = insert_unique(
+            self.con, chunks, vectors, self.dedup_threshold, ignore_path=self._stale.__contains__
         )
+        self.written += len(chunks) - dropped
+        self.duplicates += dropped
+
+        for chunk in chunks:
+            path = chunk["source_path"]
+            record, remaining = self._expected[path]
+            if remaining == 1:
+                record_file(self.con, *record)
+                del self._expected[path]
+                self._started.discard(path)
+            else:
+                self._expected[path] = (record, remaining - 1)
+
+        self.con.commit()
+
+
+def build_index(
+    chunks: list[dict],
+    fmt: str = DEFAULT_VECTOR_FORMAT,
+    dedup_threshold: float = DEDUP_THRESHOLD,
+    ann: str | None = None,
+) -> None:
+    """
+    Constrói (ou reconstrói do zero) o índice vetorial em data/index.db.
+
+    Recebe lista de chunks já com campo 'embedding: list[float]'.
+    `fmt` define o formato de armazenamento dos vetores (float, int8 ou bit).
+    Chunks quase idênticos (cosseno >= dedup_threshold) são gravados uma vez só.
+    `ann` escolhe o índice aproximado exportado com a matriz (none ou ivf).
+    """
+    con = open_index(rebuild=True, fmt=fmt)
+    bulk_mode(con, rebuild=True)
+
+    logger.info(f"Inserindo {len(chunks)} chunks no índice...")
+    dropped = 0
+    for i in range(0, len(chunks), WRITE_BATCH_SIZE):
+        batch = chunks[i : i + WRITE_BATCH_SIZE]
+        dropped += insert_unique(con, batch, _as_matrix([c["embedding"] for c in batch]), dedup_threshold)
+    if dropped:
+        logger.info(f"{dropped} chunks quase idênticos descartados.")
+
+    # Registra os arquivos de origem (sem hash de conteúdo: a próxima
+    # ingestão incremental reprocessa estes arquivos uma vez)
+    seen: set[str] = set()
+    for chunk in chunks:
+        path = chunk.get("source_path") or _default_source_path(chunk)
+        if path not in seen:
+            seen.add(path)
+            record_file(con, path, chunk["collection"], chunk["source_file"], chunk["type"], "")
 
     con.commit()
+    finalize_index(con, ann)
+    export_shards(con)
     con.close()
 
     logger.info(f"Índice salvo em: {DB_PATH}")
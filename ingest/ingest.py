@@ -2,12 +2,15 @@
 Pipeline de ingestão — uso exclusivo do mantenedor.
 
 Uso:
-    python ingest/ingest.py                        # rebuild completo
+    python ingest/ingest.py                        # incremental (só arquivos novos/alterados)
+    python ingest/ingest.py --rebuild              # rebuild completo
     python ingest/ingest.py --collection dashboards-html5  # só uma coleção
+    python ingest/ingest.py --shards on            # também um arquivo por coleção (src/shards.py)
     python ingest/ingest.py --stats                # estatísticas do índice atual
 """
 
 import argparse
+import hashlib
 import logging
 import os
 import sys
@@ -56,12 +59,54 @@ def _collect_files(collection_filter: str | None) -> tuple[list[Path], list[Path
     return markdowns, images
 
 
-def _run_ingest(collection_filter: str | None) -> None:
+def _source_path(path: Path) -> str:
+    """Chave do arquivo no índice: <coleção>/<arquivo> ou <coleção>/images/<arquivo>."""
+    if path.suffix.lower() in IMAGE_EXTENSIONS:
+        return f"{path.parent.parent.name}/images/{path.name}"
+    return f"{path.parent.name}/{path.name}"
+
+
+def _file_hash(path: Path) -> str:
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+def _run_ingest(
+    collection_filter: str | None,
+    rebuild: bool = False,
+    image_workers: int | None = None,
+    embed_workers: int | None = None,
+    embed_batch_size: int | None = None,
+    embed_threads: int | None = None,
+    vector_format: str | None = None,
+    dedup: bool = True,
+    ann: str | None = None,
+    shards: bool | None = None,
+) -> None:
     from ingest.chunker import chunk_markdown
-    from ingest.embedder import embed_chunks
-    from ingest.image_describer import describe_image
-    from ingest.index_builder import build_index, index_stats
+    from ingest.embedder import BATCH_SIZE, THREADS, WORKERS, embed_stream
+    from ingest.image_describer import CONCURRENCY, describe_images
+    from ingest.index_builder import (
+        DEDUP_THRESHOLD,
+        IndexWriter,
+        bulk_mode,
+        cached_embeddings,
+        chunk_hash,
+        dependent_files,
+        ann_index,
+        export_shards,
+        export_vectors,
+        file_hashes,
+        finalize_index,
+        index_stats,
+        open_index,
+        remove_file,
+    )
+    from src import matrix_index
 
+    image_workers = image_workers or CONCURRENCY
+    embed_workers = WORKERS if embed_workers is None else embed_workers
+    embed_batch_size = embed_batch_size or BATCH_SIZE
+    embed_threads = embed_threads or THREADS
     start = time.perf_counter()
 
     markdowns, images = _collect_files(collection_filter)
@@ -72,38 +117,123 @@ def _run_ingest(collection_filter: str | None) -> None:
 
     logger.info(f"Arquivos encontrados: {len(markdowns)} markdowns, {len(images)} imagens")
 
-    all_chunks: list[dict] = []
-
-    # ── Markdowns ────────────────────────────────────────────────────────────
-    for md in markdowns:
-        logger.info(f"  [md] {md.parent.name}/{md.name}")
-        chunks = chunk_markdown(md)
-        logger.info(f"       → {len(chunks)} chunks")
-        all_chunks.extend(chunks)
-
-    # ── Imagens ──────────────────────────────────────────────────────────────
-    for img in images:
-        logger.info(f"  [img] {img.parent.parent.name}/{img.name}")
-        try:
-            chunk = describe_image(img)
-            all_chunks.append(chunk)
-            logger.info(f"        → descrição gerada ({len(chunk['text'])} chars)")
-        except Exception as exc:
-            logger.warning(f"        ✗ Falha ao descrever imagem: {exc}")
-
-    if not all_chunks:
-        logger.error("Nenhum chunk gerado. Abortando.")
+    # Com --collection, o rebuild reprocessa só a coleção e preserva as demais
+    full_rebuild = rebuild and not collection_filter
+    try:
+        con = open_index(rebuild=full_rebuild, fmt=vector_format, partial=bool(collection_filter))
+    except ValueError as exc:
+        logger.error(str(exc))
         sys.exit(1)
+    bulk_mode(con, rebuild=full_rebuild)
+
+    # ── Diferença entre docs/ e o índice (por hash de conteúdo) ──────────────
+    indexed = file_hashes(con, collection_filter)
+    current = {_source_path(p): (p, _file_hash(p)) for p in markdowns + images}
+
+    pending = [
+        (path, file, digest)
+        for path, (file, digest) in current.items()
+        if rebuild or indexed.get(path) != digest
+    ]
+    removed = sorted(set(indexed) - set(current))
+
+    # Arquivos cujos chunks foram descartados como duplicatas de um arquivo
+    # alterado ou removido precisam ser reprocessados junto
+    changed = {path for path, _, _ in pending} | set(removed)
+    dependents = sorted(p for p in dependent_files(con, changed) - changed if p in current)
+    pending += [(path, *current[path]) for path in dependents]
+
+    logger.info(
+        f"Inalterados: {len(current) - len(pending)}  |  "
+        f"novos/alterados: {len(pending) - len(dependents)}  |  removidos: {len(removed)}"
+        + (f"  |  dependentes de duplicatas: {len(dependents)}" if dependents else "")
+    )
 
-    logger.info(f"\nTotal de chunks antes do embedding: {len(all_chunks)}")
-
-    # ── Embeddings ───────────────────────────────────────────────────────────
-    logger.info("Gerando embeddings...")
-    all_chunks = embed_chunks(all_chunks)
-
-    # ── Índice ───────────────────────────────────────────────────────────────
-    logger.info("Construindo índice sqlite-vec...")
-    build_index(all_chunks)
+    # A matriz de vetores exportada deixa de valer assim que os chunks mudam;
+    # o servidor volta ao vec0 até a nova exportação, no fim da ingestão
+    if pending or removed:
+        matrix_index.invalidate(con)
+
+    # ── Pipeline em streaming: arquivos → chunks → embeddings → índice ──────
+    # Só um arquivo (chunking) e um lote (embeddings) ficam em memória por vez.
+    writer = IndexWriter(
+        con,
+        replacing={path for path, _, _ in pending} | set(removed),
+        dedup_threshold=DEDUP_THRESHOLD if dedup else 0,
+    )
+    reused_total = 0
+
+    def file_units():
+        """Gera (path, arquivo, hash, chunks) para cada arquivo novo ou alterado."""
+        for path, file, digest in pending:
+            if file.suffix.lower() in IMAGE_EXTENSIONS:
+                continue
+            chunks = chunk_markdown(file)
+            logger.info(f"  [md] {path} → {len(chunks)} chunks")
+            yield path, file, digest, chunks
+
+        pending_images = {
+            file: (path, digest)
+            for path, file, digest in pending
+            if file.suffix.lower() in IMAGE_EXTENSIONS
+        }
+        if pending_images:
+            logger.info(f"Descrevendo {len(pending_images)} imagens ({image_workers} em paralelo)...")
+        for file, result in describe_images(pending_images, concurrency=image_workers):
+            path, digest = pending_images[file]
+            if isinstance(result, Exception):
+                # Mantém a versão anterior no índice; a imagem é reprocessada na próxima execução
+                logger.warning(f"  [img] {path} ✗ Falha ao descrever imagem: {result}")
+                continue
+            logger.info(f"  [img] {path} → descrição gerada ({len(result['text'])} chars)")
+            yield path, file, digest, [result]
+
+    def chunk_stream():
+        """Achata os arquivos em chunks, reaproveitando embeddings de textos já indexados."""
+        nonlocal reused_total
+        for path, file, digest, chunks in file_units():
+            for chunk in chunks:
+                chunk["content_hash"] = chunk_hash(chunk["text"])
+            reused = cached_embeddings(con, [c["content_hash"] for c in chunks])
+            for chunk in chunks:
+                if chunk["content_hash"] in reused:
+                    chunk["embedding"] = reused[chunk["content_hash"]]
+            reused_total += sum(c["content_hash"] in reused for c in chunks)
+
+            is_image = file.suffix.lower() in IMAGE_EXTENSIONS
+            writer.expect_file(
+                path,
+                file.parent.parent.name if is_image else file.parent.name,
+                file.name,
+                "image_description" if is_image else "markdown",
+                digest,
+                len(chunks),
+            )
+            yield from chunks
+
+    logger.info(
+        f"Gerando embeddings (workers={embed_workers}, batch={embed_batch_size}, "
+        f"threads={embed_threads or 'auto'}) e atualizando o índice sqlite-vec..."
+    )
+    stream = embed_stream(chunk_stream(), embed_batch_size, embed_workers, embed_threads)
+    for batch, vectors in stream:
+        writer.write_batch(batch, vectors)
+        logger.info(
+            f"  {writer.written} chunks gravados ({reused_total} com embedding reaproveitado, "
+            f"{writer.duplicates} duplicatas descartadas)"
+        )
+
+    for path in removed:
+        n = remove_file(con, path)
+        logger.info(f"  [removido] {path} ({n} chunks)")
+    con.commit()
+    if pending or removed:
+        finalize_index(con, ann)
+    elif matrix_index.current_stamp(con) is None or (ann and ann != ann_index(con)):
+        export_vectors(con, ann)
+    # Sem mudanças, nenhum shard é regravado (ver export_shards)
+    export_shards(con, shards)
+    con.close()
 
     elapsed = time.perf_counter() - start
 
@@ -121,7 +251,8 @@ def _run_ingest(collection_filter: str | None) -> None:
 
 
 def _show_stats() -> None:
-    from ingest.index_builder import DB_PATH, index_stats
+    from ingest.index_builder import DB_PATH, _connect, index_stats, vector_format
+    from src import embedding
 
     if not DB_PATH.exists():
         print("Índice não encontrado. Execute 'python ingest/ingest.py' primeiro.")
@@ -137,7 +268,13 @@ def _show_stats() -> None:
     for s in stats:
         print(f"  {s['collection']:<28} {s['total']:>4} chunks")
     print(f"  {'TOTAL':<28} {sum(s['total'] for s in stats):>4} chunks")
+    con = _connect()
+    fmt = vector_format(con)
+    model, dim = embedding.index_model(con)
+    con.close()
     print(f"\n  Arquivo: {DB_PATH}")
+    print(f"  Modelo:  {model} ({dim} dims)")
+    print(f"  Vetores: {fmt}")
     print(f"  Tamanho: {DB_PATH.stat().st_size / 1024 / 1024:.1f} MB")
     print("─" * 40)
 
@@ -151,6 +288,59 @@ def main() -> None:
         metavar="NOME",
         help="Processa apenas a coleção especificada (nome da pasta em docs/)",
     )
+    parser.add_argument(
+        "--rebuild",
+        action="store_true",
+        help="Reconstrói o índice do zero, reprocessando todos os arquivos",
+    )
+    parser.add_argument(
+        "--image-workers",
+        type=int,
+        metavar="N",
+        help="Descrições de imagem simultâneas na API (padrão: IMAGE_CONCURRENCY ou 4)",
+    )
+    parser.add_argument(
+        "--embed-workers",
+        type=int,
+        metavar="N",
+        help="Processos de embedding em paralelo; 0 = todos os núcleos (padrão: EMBED_WORKERS ou 1)",
+    )
+    parser.add_argument(
+        "--embed-batch-size",
+        type=int,
+        metavar="N",
+        help="Textos por lote do modelo de embedding (padrão: EMBED_BATCH_SIZE ou 100)",
+    )
+    parser.add_argument(
+        "--embed-threads",
+        type=int,
+        metavar="N",
+        help="Threads intra-op do ONNX Runtime (padrão: EMBED_THREADS ou automático). "
+        "Só vale com --embed-workers 1: os processos de trabalho do fastembed usam 1 thread cada",
+    )
+    parser.add_argument(
+        "--vector-format",
+        choices=["float", "int8", "bit"],
+        help="Formato dos vetores no índice (padrão: mantém o atual; float num índice novo). "
+        "int8/bit reduzem o tamanho do índice; mudar o formato força rebuild",
+    )
+    parser.add_argument(
+        "--no-dedup",
+        action="store_true",
+        help="Grava também chunks quase idênticos a outros da mesma coleção (padrão: descarta, ver DEDUP_THRESHOLD)",
+    )
+    parser.add_argument(
+        "--ann",
+        choices=["none", "ivf"],
+        help="Índice aproximado exportado com a matriz de vetores: ivf acelera a busca em "
+        "corpora grandes (padrão: mantém o atual; ANN_INDEX ou none num índice novo)",
+    )
+    parser.add_argument(
+        "--shards",
+        choices=["on", "off"],
+        help="Grava também um arquivo por coleção em src/data/shards, consultado pelo servidor "
+        "no lugar do index.db (padrão: mantém o atual; INDEX_SHARDS ou off num índice novo)",
+    )
     parser.add_argument(
         "--stats",
         action="store_true",
@@ -162,7 +352,24 @@ def main() -> None:
         _show_stats()
         return
 
-    _run_ingest(args.collection)
+    if args.embed_threads:
+        from ingest.embedder import WORKERS
+
+        if (WORKERS if args.embed_workers is None else args.embed_workers) != 1:
+            parser.error("--embed-threads só vale com --embed-workers 1 (cada processo de trabalho usa 1 thread)")
+
+    _run_ingest(
+        args.collection,
+        rebuild=args.rebuild,
+        image_workers=args.image_workers,
+        embed_workers=args.embed_workers,
+        embed_batch_size=args.embed_batch_size,
+        embed_threads=args.embed_threads,
+        vector_format=args.vector_format,
+        dedup=not args.no_dedup,
+        ann=args.ann,
+        shards=None if args.shards is None else args.shards == "on",
+    )
 
 
 if __name__ == "__main__":
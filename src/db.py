@@ -0,0 +1,149 @@
+"""
+Camada de acesso ao índice — pool de conexões somente leitura.
+
+Cada conexão é aberta uma única vez, com a extensão sqlite-vec já carregada
+e PRAGMAs ajustados para leitura via mmap. As queries são mantidas como
+strings constantes para aproveitar o cache de statements do módulo sqlite3.
+"""
+
+import importlib.util
+import logging
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
+
+logger = logging.getLogger(__name__)
+
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "4"))
+MMAP_SIZE = 256 * 1024 * 1024  # o índice inteiro cabe no mmap
+CACHE_SIZE_KB = 16 * 1024
+CACHED_STATEMENTS = 128
+
+
+def _load_sqlite_vec(con: sqlite3.Connection) -> None:
+    """Carrega a extensão sqlite-vec sem importar o pacote Python.
+
+    `import sqlite_vec` importa numpy (≈60ms); aqui só localizamos a
+    biblioteca nativa que acompanha o pacote (mesmo caminho de
+    `sqlite_vec.loadable_path()`).
+    """
+    spec = importlib.util.find_spec("sqlite_vec")
+    if spec is None or spec.origin is None:
+        raise ModuleNotFoundError("Pacote 'sqlite-vec' não encontrado.")
+    con.load_extension(str(Path(spec.origin).parent / "vec0"))
+
+
+class ConnectionPool:
+    """Pool de conexões somente leitura, reaproveitadas entre chamadas das tools."""
+
+    def __init__(self, db_path: Path, size: int = POOL_SIZE) -> None:
+        self.db_path = db_path
+        self.size = max(1, size)
+        self._idle: queue.LifoQueue[sqlite3.Connection] = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._inode: int | None = None
+        self._generation = 0
+        self._born: dict[int, int] = {}  # id(conexão) → geração do arquivo
+
+    def _connect(self) -> sqlite3.Connection:
+        con = sqlite3.connect(
+            f"{self.db_path.resolve().as_uri()}?mode=ro",
+            uri=True,
+            check_same_thread=False,
+            cached_statements=CACHED_STATEMENTS,
+        )
+        con.enable_load_extension(True)
+        _load_sqlite_vec(con)
+        con.enable_load_extension(False)
+
+        con.execute("PRAGMA query_only = ON")
+        con.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+        con.execute(f"PRAGMA cache_size = -{CACHE_SIZE_KB}")
+        con.execute("PRAGMA temp_store = MEMORY")
+        return con
+
+    def _check_replaced(self) -> None:
+        """Descarta as conexões ociosas se o arquivo do índice foi recriado (rebuild)."""
+        inode = self.db_path.stat().st_ino
+        if self._inode is None:
+            self._inode = inode
+            return
+        if inode == self._inode:
+            return
+
+        logger.info("Índice recriado em disco — reabrindo conexões.")
+        self._inode = inode
+        self._generation += 1
+        self._drain()
+
+    def _drain(self) -> None:
+        while True:
+            try:
+                con = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(con)
+
+    def _discard(self, con: sqlite3.Connection) -> None:
+        self._born.pop(id(con), None)
+        con.close()
+        self._created -= 1
+
+    def _acquire(self) -> sqlite3.Connection:
+        while True:
+            with self._lock:
+                self._check_replaced()
+                try:
+                    return self._idle.get_nowait()
+                except queue.Empty:
+                    pass
+                create = self._created < self.size
+                if create:
+                    self._created += 1
+                    generation = self._generation
+
+            if create:
+                break
+            # Pool esgotado: espera uma devolução (com timeout, pois uma
+            # conexão descartada libera vaga sem passar pela fila)
+            try:
+                return self._idle.get(timeout=0.05)
+            except queue.Empty:
+                continue
+
+        try:
+            con = self._connect()
+        except Exception:
+            with self._lock:
+                self._created -= 1
+            raise
+        with self._lock:
+            self._born[id(con)] = generation
+        return con
+
+    def _release(self, con: sqlite3.Connection) -> None:
+        with self._lock:
+            if self._born.get(id(con)) != self._generation:
+                # Conexão aberta sobre um arquivo que já foi substituído
+                self._discard(con)
+                return
+        self._idle.put(con)
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """Empresta uma conexão do pool pelo tempo do bloco `with`."""
+        con = self._acquire()
+        try:
+            yield con
+        finally:
+            self._release(con)
+
+    def close(self) -> None:
+        """Fecha todas as conexões ociosas."""
+        with self._lock:
+            self._drain()
@@ -0,0 +1,167 @@
+"""
+Modelo de embedding compartilhado pelo servidor (queries) e pela ingestão (chunks).
+
+Define o modelo e a dimensão dos vetores, onde o fastembed guarda os
+arquivos baixados e os parâmetros da sessão do ONNX Runtime que ele aceita:
+
+  EMBED_CACHE_DIR       diretório do cache de modelos (padrão: o do fastembed, em /tmp)
+  EMBED_OFFLINE=1       não acessa a rede: usa só os arquivos já presentes no cache
+  EMBED_THREADS         threads da sessão (o fastembed aplica o valor a intra e inter-op); sem
+                        efeito na ingestão com EMBED_WORKERS != 1, em que cada processo usa 1 thread
+  EMBED_PROVIDERS       execution providers do ONNX Runtime, separados por vírgula
+  EMBED_QUERY_MODEL     "default" ou "quantized": variante int8 do mesmo modelo para as
+                        queries do servidor, mais rápida em CPU (a ingestão usa sempre a padrão)
+
+O modelo faz mean pooling sem normalizar; normalize() leva os vetores à
+norma 1 nos dois lados (chunks na ingestão, queries no servidor). Com
+vetores unitários a distância L2 do KNN ordena como o cosseno
+(d² = 2 − 2·cos), o rótulo de similaridade é exato e os componentes ficam
+em [-1, 1], a faixa que a quantização int8 (src/vectors.py) supõe.
+
+O índice registra o modelo e a dimensão na tabela meta, e o servidor confere
+antes da busca semântica: vetores de modelos diferentes não são comparáveis.
+A variante quantizada é o mesmo modelo com os pesos em int8 e o mesmo
+pós-processamento (mean pooling, depois normalize()): suas queries caem no
+espaço dos vetores do índice gerado pelo modelo padrão, mas não coincidem
+com eles — o erro da quantização custa recall, que deve ser medido com
+bench/bench_search.py --quantized-query antes de ativá-la.
+
+fastembed (e com ele onnxruntime) só é importado ao carregar o modelo.
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import numpy as np
+    from fastembed import TextEmbedding
+
+logger = logging.getLogger(__name__)
+
+MODEL_NAME = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+EMBEDDING_DIM = 384
+# Export ONNX quantizado (int8) do mesmo modelo, registrado no fastembed como modelo customizado
+QUANTIZED_MODEL_NAME = "Xenova/paraphrase-multilingual-MiniLM-L12-v2"
+QUANTIZED_MODEL_FILE = "onnx/model_quantized.onnx"
+VARIANTS = ("default", "quantized")
+
+CACHE_DIR = os.getenv("EMBED_CACHE_DIR") or None
+OFFLINE = os.getenv("EMBED_OFFLINE", "0") == "1"
+# Vazio = padrão do onnxruntime
+THREADS = int(os.getenv("EMBED_THREADS") or 0) or None
+PROVIDERS = [p.strip() for p in os.getenv("EMBED_PROVIDERS", "").split(",") if p.strip()] or None
+QUERY_MODEL = os.getenv("EMBED_QUERY_MODEL", "default")
+
+_models: dict[str, "TextEmbedding"] = {}
+_lock = threading.Lock()
+
+
+def model_id(variant: str = "default") -> str:
+    """Identificador do modelo efetivamente carregado (chave do cache de queries)."""
+    return QUANTIZED_MODEL_NAME + ":int8" if variant == "quantized" else MODEL_NAME
+
+
+def vectors_id(variant: str = "default") -> str:
+    """Identificador dos vetores produzidos (modelo + normalização): chave do cache de queries."""
+    return model_id(variant) + ":l2"
+
+
+def normalize(vectors: "np.ndarray") -> "np.ndarray":
+    """Vetores (um ou uma matriz, por linha) com norma L2 unitária, em float32."""
+    import numpy as np
+
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def loaded(variant: str = "default") -> bool:
+    return variant in _models
+
+
+def get_model(
+    variant: str = "default", threads: int | None = THREADS, lazy_load: bool = False
+) -> "TextEmbedding":
+    """Modelo da variante pedida, carregado uma vez por processo.
+
+    `lazy_load` adia o carregamento da sessão ONNX (usado quando o fastembed
+    distribui o trabalho entre processos, cada um com o próprio modelo).
+    """
+    model = _models.get(variant)
+    if model is not None:
+        return model
+    # Se outra thread (o warm-up do servidor) estiver carregando, espera por ela
+    with _lock:
+        if variant not in _models:
+            _models[variant] = _load(variant, threads, lazy_load)
+    return _models[variant]
+
+
+def _load(variant: str, threads: int | None, lazy_load: bool) -> "TextEmbedding":
+    if variant not in VARIANTS:
+        raise ValueError(f"Variante de modelo inválida: {variant}. Use: {VARIANTS}")
+    from fastembed import TextEmbedding
+
+    name = MODEL_NAME
+    if variant == "quantized":
+        _register_quantized()
+        name = QUANTIZED_MODEL_NAME
+
+    t0 = time.perf_counter()
+    logger.info(f"Carregando modelo de embedding: {model_id(variant)}" + (" (offline)" if OFFLINE else ""))
+    options = {"cache_dir": CACHE_DIR, "providers": PROVIDERS, "lazy_load": lazy_load}
+    if OFFLINE:
+        options["local_files_only"] = True
+    # Com lazy_load, as sessões são criadas nos processos de trabalho do fastembed, que
+    # fixam 1 thread cada (threads não chega a eles)
+    model = TextEmbedding(model_name=name, threads=threads, **options)
+    logger.info(f"Modelo carregado em {time.perf_counter() - t0:.1f}s.")
+    return model
+
+
+def _register_quantized() -> None:
+    from fastembed import TextEmbedding
+
+    if not hasattr(TextEmbedding, "add_custom_model"):
+        raise RuntimeError("A variante quantizada requer fastembed >= 0.6 (TextEmbedding.add_custom_model).")
+    if any(m["model"] == QUANTIZED_MODEL_NAME for m in TextEmbedding.list_supported_models()):
+        return
+    from fastembed.common.model_description import ModelSource, PoolingType
+
+    # Como o modelo padrão no fastembed: mean pooling sem normalização (feita por normalize())
+    TextEmbedding.add_custom_model(
+        model=QUANTIZED_MODEL_NAME,
+        pooling=PoolingType.MEAN,
+        normalization=False,
+        sources=ModelSource(hf=QUANTIZED_MODEL_NAME),
+        dim=EMBEDDING_DIM,
+        model_file=QUANTIZED_MODEL_FILE,
+    )
+
+
+def record_model(con: sqlite3.Connection) -> None:
+    """Registra em meta o modelo e a dimensão dos vetores do índice."""
+    con.executemany(
+        "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+        [("embedding_model", MODEL_NAME), ("embedding_dim", str(EMBEDDING_DIM))],
+    )
+
+
+def index_model(con: sqlite3.Connection) -> tuple[str, int]:
+    """(modelo, dimensão) do índice; índices anteriores a este registro usam o modelo atual."""
+    rows = dict(con.execute("SELECT key, value FROM meta WHERE key IN ('embedding_model', 'embedding_dim')"))
+    return rows.get("embedding_model", MODEL_NAME), int(rows.get("embedding_dim", EMBEDDING_DIM))
+
+
+def check_index(con: sqlite3.Connection) -> None:
+    """Levanta ValueError se o índice foi gerado por um modelo diferente do das queries."""
+    model, dim = index_model(con)
+    if (model, dim) != (MODEL_NAME, EMBEDDING_DIM):
+        raise ValueError(
+            f"índice gerado com {model} ({dim} dimensões), mas as queries usam {MODEL_NAME} "
+            f"({EMBEDDING_DIM} dimensões). Refaça a ingestão com --rebuild."
+        )
@@ -0,0 +1,115 @@
+"""
+Índice IVF (inverted file) sobre a matriz de vetores de src/matrix_index.py.
+
+A busca exata custa um produto com todas as linhas da matriz, linear no
+número de chunks. O IVF agrupa os vetores em `nlist` listas por k-means
+esférico (cosseno) na ingestão; na consulta, só as `nprobe` listas com
+centróides mais próximos da query são varridas. nprobe maior = recall
+maior e busca mais lenta; nprobe = nlist equivale à busca exata.
+
+Com o IVF, a matriz é gravada ordenada por lista (e, dentro da lista, por
+coleção e tipo): cada lista é uma faixa contígua de linhas, varrida com um
+único produto matricial, sem cópia. O arquivo index.ivf.npz guarda:
+  centroids  float32 [nlist, dim], normalizados
+  offsets    int64 [nlist + 1] — linhas offsets[i]:offsets[i + 1] da matriz são a lista i
+"""
+
+import math
+import os
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# Listas do IVF; 0 = automático (≈ √n)
+NLIST = int(os.getenv("IVF_NLIST", "0"))
+# Listas varridas por consulta; 64 dá recall@10 ≈ 0,96 com 200k vetores (bench/bench_ann.py)
+NPROBE = int(os.getenv("IVF_NPROBE", "64"))
+# Abaixo disso (coleção filtrada pequena, índice pequeno) a busca exata é mais barata
+MIN_ROWS = int(os.getenv("IVF_MIN_ROWS", "20000"))
+
+TRAIN_ITERATIONS = 20
+TRAIN_POINTS_PER_LIST = 128  # amostra de treino do k-means: nlist * 128 vetores
+_BATCH = 16384  # linhas por bloco na atribuição às listas (limita a memória)
+
+
+def ivf_path(db_path: Path) -> Path:
+    stem = db_path.with_suffix("")
+    return stem.with_name(f"{stem.name}.ivf.npz")
+
+
+def default_nlist(n: int) -> int:
+    return max(1, NLIST or round(math.sqrt(n)))
+
+
+def assign(matrix: "np.ndarray", centroids: "np.ndarray") -> "np.ndarray":
+    """Lista (centróide de maior cosseno) de cada linha, em blocos."""
+    import numpy as np
+
+    labels = np.empty(len(matrix), dtype=np.int32)
+    for start in range(0, len(matrix), _BATCH):
+        block = np.asarray(matrix[start : start + _BATCH], dtype=np.float32)
+        labels[start : start + _BATCH] = (block @ centroids.T).argmax(axis=1)
+    return labels
+
+
+def train(matrix: "np.ndarray", nlist: int | None = None, seed: int = 0) -> "np.ndarray":
+    """Centróides por k-means esférico numa amostra da matriz (linhas normalizadas)."""
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    n = len(matrix)
+    nlist = min(nlist or default_nlist(n), n)
+    sample_size = min(n, nlist * TRAIN_POINTS_PER_LIST)
+    sample = np.asarray(matrix[np.sort(rng.choice(n, sample_size, replace=False))], dtype=np.float32)
+    centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+
+    for _ in range(TRAIN_ITERATIONS):
+        labels = assign(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, sample)
+        counts = np.bincount(labels, minlength=nlist)
+        # Lista vazia recebe um ponto qualquer da amostra, para não desperdiçar o centróide
+        empty = np.flatnonzero(counts == 0)
+        sums[empty] = sample[rng.choice(sample_size, len(empty), replace=False)]
+        centroids = sums / np.maximum(np.linalg.norm(sums, axis=1, keepdims=True), 1e-12)
+    return centroids.astype(np.float32)
+
+
+def save(path: Path, centroids: "np.ndarray", labels: "np.ndarray") -> None:
+    """Grava o índice; `labels` é a lista de cada linha da matriz já ordenada por lista."""
+    import numpy as np
+
+    offsets = np.zeros(len(centroids) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(labels, minlength=len(centroids)), out=offsets[1:])
+    tmp = path.with_name(path.name + ".tmp")
+    with tmp.open("wb") as fh:
+        np.savez(fh, centroids=centroids, offsets=offsets)
+    os.replace(tmp, path)
+
+
+class IVFIndex:
+    def __init__(self, centroids: "np.ndarray", offsets: "np.ndarray") -> None:
+        self.centroids = centroids
+        self.offsets = offsets
+
+    @classmethod
+    def load(cls, path: Path) -> "IVFIndex":
+        import numpy as np
+
+        with np.load(path) as data:
+            return cls(data["centroids"], data["offsets"])
+
+    @property
+    def nlist(self) -> int:
+        return len(self.centroids)
+
+    def probe(self, query: "np.ndarray", nprobe: int) -> list[tuple[int, int]]:
+        """Faixas de linhas [início, fim) das `nprobe` listas mais próximas da query."""
+        import numpy as np
+
+        nprobe = max(1, min(nprobe, self.nlist))
+        scores = self.centroids @ query
+        lists = np.argpartition(-scores, nprobe - 1)[:nprobe]
+        return [(int(self.offsets[i]), int(self.offsets[i + 1])) for i in np.sort(lists)]
@@ -0,0 +1,300 @@
+"""
+Busca KNN por força bruta numa matriz float32 mapeada em memória.
+
+Com alguns milhares de vetores de 384 dimensões, um único produto matriz ×
+vetor sobre um bloco contíguo é mais rápido que o scan por consulta do
+vec0. A ingestão exporta, ao lado do index.db:
+
+  index.vectors.npy   float32 [n, dim], normalizados, ordenados por (coleção, tipo)
+  index.rows.npy      id do chunk e códigos de coleção/tipo de cada linha
+  index.vectors.json  coleções, tipos, faixas de linhas por coleção e o carimbo
+  index.ivf.npz       opcional (--ann ivf): listas do índice IVF, ver src/ivf.py
+
+O carimbo também fica na tabela meta do índice: a ingestão o apaga antes de
+escrever e grava um novo depois de exportar, então o servidor só usa a
+matriz quando ela corresponde ao conteúdo atual do banco — caso contrário,
+a busca volta para o vec0.
+
+VECTOR_SIDECAR=auto (padrão) só exporta a matriz de índices float: nos
+formatos int8 e bit ela teria 4 bytes por dimensão e anularia a economia de
+espaço do índice. VECTOR_SIDECAR=1 exporta em qualquer formato, 0 desativa
+a exportação e o uso no servidor.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import uuid
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from src import embedding, ivf
+
+if TYPE_CHECKING:
+    import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SIDECAR = os.getenv("VECTOR_SIDECAR", "auto")
+ENABLED = SIDECAR != "0"
+META_KEY = "vectors_sidecar"
+# Índice aproximado exportado junto da matriz: "none" (busca exata) ou "ivf"
+ANN_TYPES = ("none", "ivf")
+# id do chunk e códigos de coleção/tipo de cada linha da matriz
+_ROW_FIELDS = [("id", "<i8"), ("collection", "<i4"), ("type", "<i2")]
+
+
+def export_enabled(fmt: str) -> bool:
+    """A ingestão exporta a matriz para um índice no formato `fmt`?"""
+    if SIDECAR == "auto":
+        return fmt == "float"
+    return ENABLED
+
+
+def sidecar_paths(db_path: Path) -> tuple[Path, Path, Path]:
+    """(matriz, linhas, manifesto) do índice em `db_path`."""
+    stem = db_path.with_suffix("")
+    return (
+        stem.with_name(f"{stem.name}.vectors.npy"),
+        stem.with_name(f"{stem.name}.rows.npy"),
+        stem.with_name(f"{stem.name}.vectors.json"),
+    )
+
+
+def current_stamp(con: sqlite3.Connection) -> str | None:
+    """Carimbo da matriz válida para o conteúdo atual do índice (None = sem matriz)."""
+    try:
+        row = con.execute("SELECT value FROM meta WHERE key = ?", (META_KEY,)).fetchone()
+    except sqlite3.OperationalError:
+        return None
+    return row[0] if row else None
+
+
+def invalidate(con: sqlite3.Connection) -> None:
+    """Marca a matriz exportada como desatualizada (antes de alterar os chunks)."""
+    con.execute("DELETE FROM meta WHERE key = ?", (META_KEY,))
+    con.commit()
+
+
+def _replace(path: Path, write) -> None:
+    tmp = path.with_name(path.name + ".tmp")
+    with tmp.open("wb") as fh:
+        write(fh)
+    os.replace(tmp, path)
+
+
+def export(
+    con: sqlite3.Connection,
+    db_path: Path,
+    ids: list[int],
+    collections: list[str],
+    types: list[str],
+    vectors: "np.ndarray",
+    ann: str = "none",
+) -> str:
+    """Grava a matriz e os metadados das linhas; registra o novo carimbo em meta.
+
+    Com ann="ivf", treina também o índice IVF e grava a matriz ordenada por
+    lista do IVF em vez de por coleção.
+    """
+    import numpy as np
+
+    collection_names = sorted(set(collections))
+    type_names = sorted(set(types))
+    collection_codes = {name: i for i, name in enumerate(collection_names)}
+    type_codes = {name: i for i, name in enumerate(type_names)}
+    rows = np.empty(len(ids), dtype=_ROW_FIELDS)
+    rows["id"] = ids
+    rows["collection"] = [collection_codes[c] for c in collections]
+    rows["type"] = [type_codes[t] for t in types]
+
+    matrix = embedding.normalize(vectors)
+    use_ivf = ann == "ivf" and len(matrix) > 0
+    if use_ivf:
+        centroids = ivf.train(matrix)
+        labels = ivf.assign(matrix, centroids)
+        order = np.lexsort((rows["type"], rows["collection"], labels))
+    else:
+        # Cada coleção vira uma faixa contígua: o filtro por coleção é um slice, sem cópia
+        order = np.lexsort((rows["type"], rows["collection"]))
+    rows = rows[order]
+    matrix = matrix[order]
+
+    stamp = uuid.uuid4().hex
+    manifest = {
+        "stamp": stamp,
+        "dim": int(matrix.shape[1]) if matrix.ndim == 2 else 0,
+        "count": len(rows),
+        "collections": collection_names,
+        "types": type_names,
+    }
+    ivf_file = ivf.ivf_path(db_path)
+    if use_ivf:
+        ivf.save(ivf_file, centroids, labels[order])
+        manifest["ann"] = {"type": "ivf", "nlist": len(centroids)}
+    else:
+        ivf_file.unlink(missing_ok=True)
+        bounds = np.searchsorted(rows["collection"], np.arange(len(collection_names) + 1))
+        manifest["ranges"] = {
+            name: [int(bounds[i]), int(bounds[i + 1])] for i, name in enumerate(collection_names)
+        }
+
+    matrix_path, rows_path, manifest_path = sidecar_paths(db_path)
+    _replace(matrix_path, lambda fh: np.save(fh, matrix))
+    _replace(rows_path, lambda fh: np.save(fh, rows))
+    _replace(manifest_path, lambda fh: fh.write(json.dumps(manifest).encode("utf-8")))
+
+    con.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (META_KEY, stamp))
+    con.commit()
+    return stamp
+
+
+class VectorMatrix:
+    """Matriz de vetores normalizados (mmap) com os ids e filtros de cada linha."""
+
+    def __init__(
+        self,
+        matrix: "np.ndarray",
+        rows: "np.ndarray",
+        manifest: dict,
+        ivf_index: "ivf.IVFIndex | None" = None,
+    ) -> None:
+        import numpy as np
+
+        self.matrix = matrix
+        self.ivf = ivf_index
+        self.ids = rows["id"]
+        self.collections = rows["collection"]
+        self.types = rows["type"]
+        self.stamp: str = manifest["stamp"]
+        self._collection_codes = {name: i for i, name in enumerate(manifest["collections"])}
+        self._type_codes = {name: i for i, name in enumerate(manifest["types"])}
+        # Layout por coleção: faixas contíguas; layout do IVF: linhas de cada coleção
+        self._ranges = {name: tuple(r) for name, r in manifest.get("ranges", {}).items()}
+        self._members: dict[str, "np.ndarray"] = {}
+        if "ranges" not in manifest:
+            order = np.argsort(self.collections, kind="stable")
+            bounds = np.searchsorted(self.collections[order], np.arange(len(manifest["collections"]) + 1))
+            for i, name in enumerate(manifest["collections"]):
+                self._members[name] = order[bounds[i] : bounds[i + 1]]
+
+    @classmethod
+    def load(cls, db_path: Path, stamp: str) -> "VectorMatrix | None":
+        """Mapeia a matriz exportada; None se faltar algum arquivo ou o carimbo não bater."""
+        import numpy as np
+
+        matrix_path, rows_path, manifest_path = sidecar_paths(db_path)
+        try:
+            manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+            if manifest.get("stamp") != stamp:
+                return None
+            matrix = np.load(matrix_path, mmap_mode="r")
+            rows = np.load(rows_path)
+        except (OSError, ValueError) as exc:
+            logger.warning(f"Matriz de vetores indisponível, usando o vec0: {exc}")
+            return None
+        if len(rows) != len(matrix) or len(matrix) != manifest["count"]:
+            return None
+
+        ivf_index = None
+        if manifest.get("ann", {}).get("type") == "ivf":
+            try:
+                ivf_index = ivf.IVFIndex.load(ivf.ivf_path(db_path))
+            except (OSError, ValueError, KeyError) as exc:
+                # Sem as listas, a matriz ordenada pelo IVF ainda serve à busca exata
+                logger.warning(f"Índice IVF indisponível, usando a busca exata: {exc}")
+        return cls(matrix, rows, manifest, ivf_index)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def search(
+        self,
+        query: "np.ndarray",
+        k: int,
+        collection: str | None = None,
+        doc_type: str | None = None,
+        nprobe: int | None = None,
+    ) -> list[tuple[int, float]]:
+        """k vizinhos mais próximos como (id do chunk, distância L2), em ordem.
+
+        A matriz é normalizada na exportação e a query aqui, então a distância
+        sai do cosseno: d = √(2 − 2·cos), a mesma escala das distâncias do
+        vec0 com vetores unitários (ver embedding.normalize). Com o IVF
+        carregado e pelo menos ivf.MIN_ROWS linhas no filtro, só as `nprobe`
+        listas mais próximas são varridas (nprobe=0 força a busca exata).
+        """
+        import numpy as np
+
+        # Sem normalizar, o produto escalar não é o cosseno e a distância sai de escala
+        query = embedding.normalize(query)
+        collection_code = type_code = None
+        if collection:
+            collection_code = self._collection_codes.get(collection)
+            if collection_code is None:
+                return []
+        if doc_type:
+            type_code = self._type_codes.get(doc_type)
+            if type_code is None:
+                return []
+
+        start, stop, members = 0, len(self.ids), None
+        if collection_code is not None:
+            if collection in self._ranges:
+                start, stop = self._ranges[collection]
+            else:
+                members = self._members[collection]
+        size = stop - start if members is None else len(members)
+
+        nprobe = ivf.NPROBE if nprobe is None else nprobe
+        if self.ivf is not None and nprobe > 0 and size >= ivf.MIN_ROWS:
+            found = self._search_ivf(query, k, nprobe, collection_code, type_code)
+            # Listas com menos de k candidatos: cai para a busca exata
+            if found is not None:
+                return found
+
+        if members is None and type_code is None:
+            return self._top(self.matrix[start:stop] @ query, k, start=start)
+        rows = np.arange(start, stop) if members is None else members
+        if type_code is not None:
+            rows = rows[self.types[rows] == type_code]
+        return self._top(self.matrix[rows] @ query, k, rows=rows)
+
+    def _search_ivf(
+        self, query: "np.ndarray", k: int, nprobe: int, collection_code, type_code
+    ) -> list[tuple[int, float]] | None:
+        import numpy as np
+
+        scores, rows = [], []
+        for start, stop in self.ivf.probe(query, nprobe):
+            block_scores = self.matrix[start:stop] @ query
+            block_rows = np.arange(start, stop)
+            if collection_code is not None or type_code is not None:
+                mask = np.ones(stop - start, dtype=bool)
+                if collection_code is not None:
+                    mask &= self.collections[start:stop] == collection_code
+                if type_code is not None:
+                    mask &= self.types[start:stop] == type_code
+                block_scores, block_rows = block_scores[mask], block_rows[mask]
+            scores.append(block_scores)
+            rows.append(block_rows)
+        all_rows = np.concatenate(rows)
+        if len(all_rows) < k:
+            return None
+        return self._top(np.concatenate(scores), k, rows=all_rows)
+
+    def _top(
+        self, scores: "np.ndarray", k: int, rows: "np.ndarray | None" = None, start: int = 0
+    ) -> list[tuple[int, float]]:
+        """Os k maiores scores como (id, distância); `rows` (ou `start`) mapeia para linhas da matriz."""
+        import numpy as np
+
+        k = min(k, len(scores))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        distances = np.sqrt(np.maximum(2.0 - 2.0 * scores[top], 0.0))
+        matrix_rows = top + start if rows is None else rows[top]
+        return list(zip(self.ids[matrix_rows].tolist(), distances.tolist()))
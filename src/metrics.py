@@ -0,0 +1,140 @@
+"""
+Métricas de latência do servidor: histogramas por etapa da busca (carga do
+modelo, embedding, abertura de conexão, KNN, busca textual, fusão,
+formatação) e contadores (buscas, resultados vazios, timeouts...).
+
+Os histogramas usam buckets em escala logarítmica (ms), então o custo por
+medição é constante e a memória não cresce com o número de buscas.
+Com SEARCH_METRICS=0, timer() devolve um context manager vazio.
+"""
+
+import bisect
+import json
+import logging
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import ContextManager, Iterator
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.getenv("SEARCH_METRICS", "1") != "0"
+# Intervalo (segundos) do dump periódico; 0 = desligado
+DUMP_INTERVAL = float(os.getenv("METRICS_DUMP_INTERVAL", "0"))
+# Arquivo JSON-lines do dump; vazio = uma linha de log em stderr
+DUMP_PATH = os.getenv("METRICS_DUMP_PATH", "")
+
+# Limites superiores dos buckets, em ms: 0.05ms … ~105s, fator √2
+_BOUNDS = [0.05 * math.sqrt(2) ** i for i in range(43)]
+_NULL = nullcontext()
+
+
+class Histogram:
+    """Histograma de latências (ms) com percentis aproximados pelos buckets."""
+
+    def __init__(self) -> None:
+        self.buckets = [0] * (len(_BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, ms: float) -> None:
+        self.buckets[bisect.bisect_left(_BOUNDS, ms)] += 1
+        self.count += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+
+    def percentile(self, p: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = p / 100 * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= rank and n:
+                return min(_BOUNDS[i] if i < len(_BOUNDS) else self.max, self.max)
+        return self.max
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count, 3) if self.count else 0.0,
+            "p50_ms": round(self.percentile(50), 3),
+            "p95_ms": round(self.percentile(95), 3),
+            "p99_ms": round(self.percentile(99), 3),
+            "max_ms": round(self.max, 3),
+        }
+
+
+class Metrics:
+    def __init__(self, enabled: bool = ENABLED) -> None:
+        self.enabled = enabled
+        self.started = time.time()
+        self._stages: dict[str, Histogram] = {}
+        self._counters: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, ms: float) -> None:
+        with self._lock:
+            hist = self._stages.get(stage)
+            if hist is None:
+                hist = self._stages[stage] = Histogram()
+            hist.record(ms)
+
+    def timer(self, stage: str) -> ContextManager:
+        """Context manager que mede o bloco e registra no histograma da etapa."""
+        if not self.enabled:
+            return _NULL
+        return self._timed(stage)
+
+    @contextmanager
+    def _timed(self, stage: str) -> Iterator[None]:
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, (time.perf_counter() - t0) * 1000)
+
+    def count(self, name: str, n: int = 1) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "timestamp": round(time.time(), 3),
+                "uptime_s": round(time.time() - self.started, 1),
+                "stages": {name: h.summary() for name, h in sorted(self._stages.items())},
+                "counters": dict(sorted(self._counters.items())),
+            }
+
+    def start_dump(self, interval: float = DUMP_INTERVAL, path: str = DUMP_PATH, extra=None) -> None:
+        """Grava o snapshot a cada `interval` segundos (JSON-lines em `path`, ou log em stderr).
+
+        `extra` é uma função opcional cujo dict é incluído em cada snapshot.
+        """
+        if not self.enabled or interval <= 0:
+            return
+
+        def loop() -> None:
+            while True:
+                time.sleep(interval)
+                snap = self.snapshot()
+                if extra is not None:
+                    snap.update(extra())
+                line = json.dumps(snap, ensure_ascii=False)
+                if path:
+                    with Path(path).open("a", encoding="utf-8") as fh:
+                        fh.write(line + "\n")
+                else:
+                    logger.info(f"métricas: {line}")
+
+        threading.Thread(target=loop, name="metrics-dump", daemon=True).start()
+
+
+metrics = Metrics()
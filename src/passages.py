@@ -0,0 +1,118 @@
+"""
+Montagem dos trechos devolvidos por search_docs e get_context: junção de
+chunks vizinhos e corte dentro de um orçamento de tokens.
+
+Chunks vizinhos do mesmo arquivo (chunk_index consecutivos) viram uma única
+passagem: o chunker repete o header da seção e os últimos parágrafos do
+chunk anterior (CHUNK_OVERLAP) no início do seguinte, e essa sobreposição
+é removida na junção. Depois as passagens são cortadas, em ordem de
+relevância, até caber em max_tokens.
+
+A contagem de tokens é uma estimativa por caracteres — o servidor não
+carrega o tokenizer, e o orçamento serve para limitar o custo do LLM que
+consome o resultado, não precisa ser exato.
+"""
+
+import math
+import re
+
+# Caracteres por token do cl100k_base em texto técnico em português,
+# arredondado para baixo: a estimativa tende a sobrar, não a estourar
+CHARS_PER_TOKEN = 3.2
+# Abaixo disso não vale a pena incluir uma passagem cortada
+MIN_PASSAGE_TOKENS = 40
+
+_PARAGRAPH_SEP = "\n\n"
+_HEADER_RE = re.compile(r"^#{1,3} ")
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimativa rápida (O(1)) do número de tokens de `text`."""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def _join(previous: str, following: str) -> str:
+    """Junta dois chunks consecutivos removendo o header repetido e a sobreposição."""
+    prev_paras = previous.split(_PARAGRAPH_SEP)
+    next_paras = following.split(_PARAGRAPH_SEP)
+
+    overlap = _overlap(prev_paras, next_paras)
+    # O chunker prefixa o header da seção quando o chunk não começa por ele
+    header = next_paras[0]
+    if not overlap and len(next_paras) > 1 and _HEADER_RE.match(header) and header in prev_paras:
+        next_paras = next_paras[1:]
+        overlap = _overlap(prev_paras, next_paras)
+    return _PARAGRAPH_SEP.join(prev_paras + next_paras[overlap:])
+
+
+def _overlap(prev_paras: list[str], next_paras: list[str]) -> int:
+    """Maior n tal que os n últimos parágrafos de prev são os n primeiros de next."""
+    for n in range(min(len(prev_paras), len(next_paras)), 0, -1):
+        if prev_paras[-n:] == next_paras[:n]:
+            return n
+    return 0
+
+
+def merge_adjacent(hits: list[dict]) -> list[dict]:
+    """Agrupa hits do mesmo arquivo com chunk_index consecutivos em passagens.
+
+    Cada passagem ocupa a posição do seu melhor hit e herda o score dele;
+    `chunks` guarda os chunk_index cobertos. Hits sem chunk_index passam intactos.
+    """
+    groups: dict[tuple, list[dict]] = {}
+    for hit in hits:
+        if hit.get("chunk_index") is None:
+            continue
+        groups.setdefault((hit.get("source_path") or hit["source_file"], hit["type"]), []).append(hit)
+
+    # id do melhor hit de cada sequência → sequência ordenada por chunk_index
+    runs: dict[int, list[dict]] = {}
+    absorbed: set[int] = set()
+    rank = {hit["id"]: i for i, hit in enumerate(hits)}
+    for members in groups.values():
+        members.sort(key=lambda h: h["chunk_index"])
+        run = [members[0]]
+        for hit in members[1:]:
+            if hit["chunk_index"] == run[-1]["chunk_index"] + 1:
+                run.append(hit)
+                continue
+            _close(run, rank, runs, absorbed)
+            run = [hit]
+        _close(run, rank, runs, absorbed)
+
+    passages = []
+    for hit in hits:
+        if hit["id"] in absorbed:
+            continue
+        run = runs.get(hit["id"])
+        if run is None:
+            passages.append(hit)
+            continue
+        text = run[0]["text"]
+        for following in run[1:]:
+            text = _join(text, following["text"])
+        passages.append({**hit, "text": text, "chunks": [h["chunk_index"] for h in run]})
+    return passages
+
+
+def _close(run: list[dict], rank: dict, runs: dict, absorbed: set) -> None:
+    if len(run) < 2:
+        return
+    # Vizinhos trazidos só como contexto não dão posição nem score à passagem
+    best = min(run, key=lambda h: (h.get("context", False), rank[h["id"]]))
+    runs[best["id"]] = run
+    absorbed.update(h["id"] for h in run if h is not best)
+
+
+def truncate(text: str, max_tokens: int) -> str:
+    """Corta `text` para caber em max_tokens, preferindo fronteiras de parágrafo e linha."""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    limit = max(0, int(max_tokens * CHARS_PER_TOKEN) - 1)
+    cut = text[:limit]
+    for sep in (_PARAGRAPH_SEP, "\n", ". ", " "):
+        pos = cut.rfind(sep)
+        if pos > limit // 2:
+            cut = cut[: pos + (1 if sep == ". " else 0)]
+            break
+    return cut.rstrip() + "…"
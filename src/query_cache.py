@@ -0,0 +1,165 @@
+"""
+Cache LRU de embeddings de query, com camada opcional em disco.
+
+A chave é o texto normalizado da query (Unicode NFC, espaços colapsados) e o
+valor é o vetor já serializado no formato do sqlite-vec. A camada em disco é
+um arquivo SQLite separado do índice — o index.db é aberto somente leitura.
+"""
+
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "1024"))
+CACHE_PATH = os.getenv("QUERY_CACHE_PATH", "")  # vazio = sem camada em disco
+DISK_MAX_ENTRIES = int(os.getenv("QUERY_CACHE_DISK_MAX", "50000"))
+_PRUNE_EVERY = 200  # inserções entre podas da camada em disco
+
+_WS_RE = re.compile(r"\s+")
+
+
+def normalize_query(text: str) -> str:
+    """Normaliza a query para uso como chave (e como texto a ser embedado)."""
+    return _WS_RE.sub(" ", unicodedata.normalize("NFC", text)).strip()
+
+
+class QueryCache:
+    """Cache LRU em memória de vetores de query, com persistência opcional em disco."""
+
+    def __init__(self, model_name: str, maxsize: int = CACHE_SIZE, path: str | Path | None = None) -> None:
+        self.model_name = model_name
+        self.maxsize = maxsize
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._mem: OrderedDict[str, bytes] = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk: sqlite3.Connection | None = None
+        self._puts = 0
+        # last_used das entradas lidas do disco, gravado em lote (ver _flush_touched)
+        self._touched: dict[str, float] = {}
+
+        if path:
+            try:
+                self._disk = self._open_disk(Path(path).expanduser())
+            except Exception as exc:
+                logger.warning(f"Cache de queries em disco indisponível ({path}): {exc}")
+
+    def _open_disk(self, path: Path) -> sqlite3.Connection:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        con = sqlite3.connect(path, check_same_thread=False)
+        con.execute("PRAGMA journal_mode = WAL")
+        con.execute("PRAGMA synchronous = NORMAL")
+        con.execute("""
+            CREATE TABLE IF NOT EXISTS query_vectors (
+                model     TEXT NOT NULL,
+                query     TEXT NOT NULL,
+                embedding BLOB NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model, query)
+            )
+        """)
+        con.commit()
+        logger.info(f"Cache de queries em disco: {path}")
+        return con
+
+    def get(self, key: str) -> bytes | None:
+        """Retorna o vetor em cache para a query normalizada, ou None."""
+        with self._lock:
+            vec = self._mem.get(key)
+            if vec is not None:
+                self._mem.move_to_end(key)
+                self.hits += 1
+                return vec
+
+            if self._disk is not None:
+                row = self._disk.execute(
+                    "SELECT embedding FROM query_vectors WHERE model = ? AND query = ?",
+                    (self.model_name, key),
+                ).fetchone()
+                if row is not None:
+                    # Sem escrita no caminho do hit: o last_used vai para o disco em lote
+                    self._touched[key] = time.time()
+                    if len(self._touched) >= _PRUNE_EVERY:
+                        self._flush_touched()
+                        self._disk.commit()
+                    self._remember(key, row[0])
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return row[0]
+
+            self.misses += 1
+            return None
+
+    def put(self, key: str, vec: bytes) -> None:
+        with self._lock:
+            self._remember(key, vec)
+            if self._disk is None:
+                return
+            self._disk.execute(
+                "INSERT OR REPLACE INTO query_vectors (model, query, embedding, last_used) VALUES (?, ?, ?, ?)",
+                (self.model_name, key, vec, time.time()),
+            )
+            self._touched.pop(key, None)
+            self._puts += 1
+            if self._puts % _PRUNE_EVERY == 0:
+                self._flush_touched()
+                self._prune_disk()
+            self._disk.commit()
+
+    def _remember(self, key: str, vec: bytes) -> None:
+        self._mem[key] = vec
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.maxsize:
+            self._mem.popitem(last=False)
+
+    def _flush_touched(self) -> None:
+        """Grava os last_used acumulados pelos hits do disco (sem commit)."""
+        if self._touched:
+            self._disk.executemany(
+                "UPDATE query_vectors SET last_used = ? WHERE model = ? AND query = ?",
+                [(used, self.model_name, key) for key, used in self._touched.items()],
+            )
+            self._touched.clear()
+
+    def _prune_disk(self) -> None:
+        self._disk.execute(
+            """
+            DELETE FROM query_vectors WHERE rowid IN (
+                SELECT rowid FROM query_vectors ORDER BY last_used DESC LIMIT -1 OFFSET ?
+            )
+            """,
+            (DISK_MAX_ENTRIES,),
+        )
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._mem),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hit_rate, 4),
+            "disk": self._disk is not None,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            if self._disk is not None:
+                self._flush_touched()
+                self._disk.commit()
+                self._disk.close()
+                self._disk = None
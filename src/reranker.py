@@ -0,0 +1,113 @@
+"""
+Re-ranking com cross-encoder local (fastembed TextCrossEncoder).
+
+O cross-encoder lê query e trecho juntos e dá uma nota de relevância bem
+mais precisa que a distância do bi-encoder, mas custa uma inferência por
+candidato. Por isso os candidatos são avaliados em lotes, na ordem da busca,
+até acabar o orçamento de latência; os que não couberem mantêm a ordem
+original, depois dos avaliados.
+
+O modelo é carregado no warm-up do servidor (RERANK_ENABLED=1) ou, se uma
+busca pedir re-ranking antes disso, em segundo plano: a requisição não
+espera a carga e volta na ordem da busca.
+"""
+
+import logging
+import math
+import os
+import threading
+import time
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from fastembed.rerank.cross_encoder import TextCrossEncoder
+
+logger = logging.getLogger(__name__)
+
+# Multilíngue (a documentação é em português); os ms-marco são menores, mas só em inglês
+MODEL_NAME = os.getenv("RERANK_MODEL", "jinaai/jina-reranker-v2-base-multilingual")
+ENABLED = os.getenv("RERANK_ENABLED", "0") == "1"
+# Candidatos trazidos pela busca para o re-ranking
+CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "20"))
+# Orçamento de latência do re-ranking por query (ms). O modelo padrão (XLM-R base) leva
+# dezenas de ms por candidato em CPU: o padrão comporta os CANDIDATES=20 em ~5 lotes
+BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", "1500"))
+BATCH_SIZE = 4  # lotes pequenos: o orçamento é conferido entre um lote e outro
+
+_model: "TextCrossEncoder | None" = None
+_model_lock = threading.Lock()
+_loading = False
+
+
+def loaded() -> bool:
+    return _model is not None
+
+
+def load_in_background() -> None:
+    """Carrega o modelo numa thread, se ninguém estiver carregando; falhas ficam no log."""
+    global _loading
+    with _model_lock:
+        if _model is not None or _loading:
+            return
+        _loading = True
+
+    def load() -> None:
+        global _loading
+        try:
+            get_model()
+        except Exception as exc:
+            logger.warning(f"Falha ao carregar o cross-encoder: {exc}")
+        finally:
+            _loading = False
+
+    threading.Thread(target=load, name="rerank-load", daemon=True).start()
+
+
+def get_model() -> "TextCrossEncoder":
+    global _model
+    if _model is not None:
+        return _model
+    with _model_lock:
+        if _model is None:
+            t0 = time.perf_counter()
+            logger.info(f"Carregando cross-encoder: {MODEL_NAME}")
+            from fastembed.rerank.cross_encoder import TextCrossEncoder
+
+            _model = TextCrossEncoder(model_name=MODEL_NAME)
+            logger.info(f"Cross-encoder carregado em {time.perf_counter() - t0:.1f}s.")
+    return _model
+
+
+def _sigmoid(x: float) -> float:
+    if x >= 0:
+        return 1 / (1 + math.exp(-x))
+    z = math.exp(x)
+    return z / (1 + z)
+
+
+def rerank(query: str, hits: list[dict], budget_ms: float = BUDGET_MS) -> tuple[list[dict], bool]:
+    """Reordena os hits pela nota do cross-encoder, dentro do orçamento de latência.
+
+    Cada hit avaliado ganha 'rerank' (probabilidade de relevância, 0–1).
+    Retorna (hits reordenados, True se todos couberam no orçamento).
+    """
+    model = get_model()
+    start = time.perf_counter()
+    deadline = start + budget_ms / 1000
+    scored: list[dict] = []
+    batch_time = 0.0
+
+    for i in range(0, len(hits), BATCH_SIZE):
+        now = time.perf_counter()
+        # Para antes de um lote que provavelmente estouraria o orçamento
+        if scored and now + batch_time > deadline:
+            break
+        batch = hits[i : i + BATCH_SIZE]
+        logits = model.rerank(query, [h["text"] for h in batch], batch_size=BATCH_SIZE)
+        for hit, logit in zip(batch, logits):
+            scored.append({**hit, "rerank": _sigmoid(logit)})
+        batch_time = time.perf_counter() - now
+
+    complete = len(scored) == len(hits)
+    scored.sort(key=lambda h: h["rerank"], reverse=True)
+    return scored + hits[len(scored) :], complete
@@ -0,0 +1,406 @@
+"""
+Consultas de recuperação sobre o índice: KNN vetorial (sqlite-vec), busca
+textual BM25 (FTS5) e fusão das duas listas por reciprocal rank fusion.
+
+As funções recebem uma conexão já aberta e devolvem hits como dicts com:
+  id, text, source_file, collection, type, chunk_index, source_path
+  (+ distance / bm25 / rrf)
+"""
+
+import functools
+import math
+import re
+import sqlite3
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import numpy as np
+
+    from src.matrix_index import VectorMatrix
+
+RRF_K = 60  # constante padrão do RRF (Cormack et al., 2009)
+# Nos formatos quantizados, a busca grossa traz k * fator candidatos para o re-ranking
+RESCORE_OVERSAMPLE = {"int8": 2, "bit": 10}
+# MMR: peso da relevância frente à redundância (1 = só relevância)
+MMR_LAMBDA = 0.7
+# Redundância mínima atribuída a dois trechos do mesmo arquivo, para espalhar os resultados
+SAME_FILE_SIMILARITY = 0.5
+
+_VECTOR_SQL = """
+    SELECT c.id, c.text, c.source_file, c.collection, c.type, c.chunk_index, c.source_path,
+           e.distance{embedding}
+    FROM (
+        SELECT rowid, distance{embedding}
+        FROM embeddings
+        WHERE embedding MATCH {constructor}(:vec)
+          AND k = :k
+          {filters}
+        ORDER BY distance
+    ) e
+    JOIN chunks c ON c.id = e.rowid
+    ORDER BY e.distance
+"""
+
+_LEXICAL_SQL = """
+    SELECT c.id, c.text, c.source_file, c.collection, c.type, c.chunk_index, c.source_path,
+           bm25(chunks_fts) AS score
+    FROM chunks_fts
+    JOIN chunks c ON c.id = chunks_fts.rowid
+    WHERE chunks_fts MATCH :match
+      {filters}
+    ORDER BY score
+    LIMIT :k
+"""
+
+# Chunks vizinhos no mesmo arquivo: busca por intervalo no índice chunks_position
+_RANGE_SQL = """
+    SELECT id, text, source_file, collection, type, chunk_index, source_path
+    FROM chunks
+    WHERE collection = ? AND source_file = ? AND chunk_index BETWEEN ? AND ?
+    ORDER BY chunk_index
+"""
+
+_BY_ID_SQL = """
+    SELECT id, text, source_file, collection, type, chunk_index, source_path
+    FROM chunks
+    WHERE id IN ({placeholders})
+"""
+
+_FIELDS = ("id", "text", "source_file", "collection", "type", "chunk_index", "source_path")
+_N = len(_FIELDS)
+
+# Códigos e identificadores do Sankhya: CODPROD, NUNOTA, TGFCAB.CODPROD, ORA-01403...
+_IDENTIFIER_RE = re.compile(r"^(?=.*[A-Z])[A-Z0-9_]+(?:[.\-:][A-Z0-9_]+)*$")
+_MAX_IDENTIFIER_TOKENS = 4
+_WORD_RE = re.compile(r"\w", re.UNICODE)
+
+
+@functools.cache
+def _vector_sql(vector_format: str, by_collection: bool, by_type: bool) -> str:
+    """Monta (uma vez por combinação) a query KNN com os filtros de metadados do vec0."""
+    from src.vectors import sql_constructor
+
+    filters = []
+    if by_collection:
+        filters.append("AND collection = :collection")
+    if by_type:
+        filters.append("AND type = :type")
+    return _VECTOR_SQL.format(
+        constructor=sql_constructor(vector_format),
+        # No int8 o próprio vetor da coluna vec0 serve ao re-ranking
+        embedding=", embedding" if vector_format == "int8" else "",
+        filters="\n          ".join(filters),
+    )
+
+
+def vector_format(con: sqlite3.Connection) -> str:
+    """Formato dos vetores gravado pela ingestão (float, int8 ou bit)."""
+    try:
+        row = con.execute("SELECT value FROM meta WHERE key = 'vector_format'").fetchone()
+    except sqlite3.OperationalError:
+        return "float"  # índice anterior à tabela meta
+    return row[0] if row else "float"
+
+
+@functools.cache
+def _lexical_sql(by_collection: bool, by_type: bool) -> str:
+    filters = []
+    if by_collection:
+        filters.append("AND c.collection = :collection")
+    if by_type:
+        filters.append("AND c.type = :type")
+    return _LEXICAL_SQL.format(filters="\n      ".join(filters))
+
+
+def looks_like_identifier(query: str) -> bool:
+    """True se a query é só código(s)/identificador(es) — ex.: 'CODPROD', 'TGFCAB NUNOTA'."""
+    tokens = query.split()
+    if not tokens or len(tokens) > _MAX_IDENTIFIER_TOKENS:
+        return False
+    return all(len(t) >= 3 and _IDENTIFIER_RE.match(t) for t in tokens)
+
+
+def fts_query(query: str, match_all: bool = False) -> str | None:
+    """Converte texto livre numa expressão FTS5 segura (cada termo entre aspas).
+
+    Termos com pontuação interna viram frases ("TGFCAB.CODPROD" → TGFCAB CODPROD).
+    Retorna None se a query não tiver nenhum termo pesquisável.
+    """
+    quoted = fts_terms(query)
+    if not quoted:
+        return None
+    return (" AND " if match_all else " OR ").join(quoted)
+
+
+def fts_terms(query: str) -> list[str]:
+    """Termos da query como frases FTS5 entre aspas (uma por palavra pesquisável)."""
+    return ['"' + t.replace('"', '""') + '"' for t in query.split() if _WORD_RE.search(t)]
+
+
+def vector_search(
+    con: sqlite3.Connection,
+    query_vec: bytes,
+    k: int,
+    collection: str | None = None,
+    doc_type: str | None = None,
+    matrix: "VectorMatrix | None" = None,
+) -> list[dict]:
+    """K vizinhos mais próximos, com os filtros aplicados dentro do vec0.
+
+    `query_vec` é sempre o embedding float32 da query. Em índices quantizados
+    (int8/bit) a busca grossa traz mais candidatos, que são re-ranqueados
+    pelo cosseno exato entre a query em float e os vetores int8.
+    Com `matrix` (a matriz exportada pela ingestão), o KNN é um produto
+    matricial em memória e o SQLite só devolve o texto dos chunks.
+
+    Em todos os caminhos a distância é d = √(2 − 2·cos) entre vetores
+    unitários, então resultados de shards diferentes (um com a matriz,
+    outro pelo vec0) podem ser juntados pela distância.
+    """
+    import numpy as np
+
+    from src.embedding import normalize
+
+    query = normalize(np.frombuffer(query_vec, dtype=np.float32))
+    if matrix is not None:
+        return _matrix_knn(con, matrix, query, k, collection, doc_type)
+
+    fmt = vector_format(con)
+    if fmt == "float":
+        # Chunks gravados com norma 1: a L2 do vec0 já é √(2 − 2·cos)
+        return _knn(con, fmt, query.tobytes(), k, collection, doc_type)
+
+    from src.vectors import dequantize_int8, quantize
+
+    candidates = _knn(
+        con, fmt, quantize(query, fmt).tobytes(), k * RESCORE_OVERSAMPLE[fmt], collection, doc_type
+    )
+    if not candidates:
+        return []
+
+    if fmt == "int8":
+        stored = [hit.pop("embedding") for hit in candidates]
+    else:
+        ids = [hit["id"] for hit in candidates]
+        placeholders = ",".join("?" * len(ids))
+        by_id = dict(
+            con.execute(f"SELECT id, embedding FROM vectors_int8 WHERE id IN ({placeholders})", ids)
+        )
+        stored = [by_id[i] for i in ids]
+
+    # Renormalizados: a quantização altera a norma, e a distância deve sair na escala da matriz
+    matrix = normalize(np.vstack([dequantize_int8(blob) for blob in stored]))
+    distances = np.sqrt(np.maximum(2.0 - 2.0 * (matrix @ query), 0.0))
+    for hit, distance in zip(candidates, distances.tolist()):
+        hit["distance"] = distance
+
+    candidates.sort(key=lambda h: (h["distance"], h["id"]))
+    return candidates[:k]
+
+
+def _matrix_knn(
+    con: sqlite3.Connection,
+    matrix: "VectorMatrix",
+    query: "np.ndarray",
+    k: int,
+    collection: str | None,
+    doc_type: str | None,
+) -> list[dict]:
+    neighbours = matrix.search(query, k, collection, doc_type)
+    if not neighbours:
+        return []
+    ids = [i for i, _ in neighbours]
+    placeholders = ",".join("?" * len(ids))
+    rows = con.execute(_BY_ID_SQL.format(placeholders=placeholders), ids)
+    by_id = {row[0]: dict(zip(_FIELDS, row)) for row in rows}
+    return [{**by_id[i], "distance": d} for i, d in neighbours if i in by_id]
+
+
+def _knn(
+    con: sqlite3.Connection,
+    fmt: str,
+    query_blob: bytes,
+    k: int,
+    collection: str | None,
+    doc_type: str | None,
+) -> list[dict]:
+    sql = _vector_sql(fmt, bool(collection), bool(doc_type))
+    params = {"vec": query_blob, "k": k, "collection": collection, "type": doc_type}
+    hits = []
+    for row in con.execute(sql, params):
+        hit = {**dict(zip(_FIELDS, row[:_N])), "distance": row[_N]}
+        if len(row) > _N + 1:
+            hit["embedding"] = row[_N + 1]
+        hits.append(hit)
+    return hits
+
+
+def lexical_search(
+    con: sqlite3.Connection,
+    query: str,
+    k: int,
+    collection: str | None = None,
+    doc_type: str | None = None,
+    match_all: bool = False,
+) -> list[dict]:
+    """Melhores k trechos por BM25 no índice FTS5."""
+    match = fts_query(query, match_all)
+    if match is None:
+        return []
+    sql = _lexical_sql(bool(collection), bool(doc_type))
+    params = {"match": match, "k": k, "collection": collection, "type": doc_type}
+    return [
+        {**dict(zip(_FIELDS, row[:_N])), "bm25": row[_N]}
+        for row in con.execute(sql, params)
+    ]
+
+
+def _fts5_idf(total: int, hits: int) -> float:
+    """IDF do bm25() do FTS5 para um termo presente em `hits` de `total` linhas."""
+    idf = math.log((total - hits + 0.5) / (hits + 0.5))
+    return idf if idf > 0 else 1e-6
+
+
+def lexical_stats(con: sqlite3.Connection, query: str, hits: list[dict]) -> dict:
+    """Estatísticas do BM25 de um shard para recalcular os scores com o IDF global.
+
+    O bm25() do FTS5 é a soma, por termo, de IDF × peso do termo no chunk; o
+    IDF depende do total de linhas e de quantas contêm o termo — contados só
+    dentro do shard. Devolve esses totais e o peso de cada termo em cada hit
+    (a contribuição do termo dividida pelo IDF local), para merge_lexical.
+    """
+    terms = fts_terms(query)
+    total = con.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+    ids = [hit["id"] for hit in hits]
+    placeholders = ",".join("?" * len(ids))
+    frequencies: list[int] = []
+    weights = {i: [0.0] * len(terms) for i in ids}
+    for j, term in enumerate(terms):
+        (hits_count,) = con.execute(
+            "SELECT COUNT(*) FROM chunks_fts WHERE chunks_fts MATCH ?", (term,)
+        ).fetchone()
+        frequencies.append(hits_count)
+        if not ids or not hits_count:
+            continue
+        idf = _fts5_idf(total, hits_count)
+        rows = con.execute(
+            f"SELECT rowid, bm25(chunks_fts) FROM chunks_fts "
+            f"WHERE chunks_fts MATCH ? AND rowid IN ({placeholders})",
+            (term, *ids),
+        )
+        for rowid, score in rows:
+            weights[rowid][j] = score / idf
+    return {"total": total, "frequencies": frequencies, "weights": weights}
+
+
+def merge_lexical(results: list[tuple[list[dict], dict]], k: int) -> list[dict]:
+    """Junta os hits BM25 de vários shards, com o IDF calculado sobre todos eles.
+
+    `results` traz (hits, lexical_stats) de cada shard. O comprimento médio
+    dos chunks, usado na normalização do BM25, continua sendo o de cada shard.
+    """
+    total = sum(stats["total"] for _, stats in results)
+    frequencies = [sum(column) for column in zip(*(stats["frequencies"] for _, stats in results))]
+    idf = [_fts5_idf(total, n) for n in frequencies]
+    merged = [
+        {**hit, "bm25": sum(w * i for w, i in zip(stats["weights"][hit["id"]], idf))}
+        for hits, stats in results
+        for hit in hits
+    ]
+    return sorted(merged, key=lambda h: h["bm25"])[:k]
+
+
+def chunk_range(
+    con: sqlite3.Connection, collection: str, source_file: str, first: int, last: int
+) -> list[dict]:
+    """Chunks de um arquivo com chunk_index entre first e last (inclusive), em ordem."""
+    rows = con.execute(_RANGE_SQL, (collection, source_file, first, last))
+    return [dict(zip(_FIELDS, row)) for row in rows]
+
+
+def expand_hits(con: sqlite3.Connection, hits: list[dict], radius: int) -> list[dict]:
+    """Acrescenta, logo após cada hit, os `radius` chunks vizinhos de cada lado.
+
+    Os vizinhos entram sem score (marcados com "context") e cada chunk aparece
+    uma vez só, na posição do primeiro hit que o trouxe.
+    """
+    seen = {hit["id"] for hit in hits}
+    expanded = []
+    for hit in hits:
+        expanded.append(hit)
+        if hit.get("chunk_index") is None:
+            continue
+        index = hit["chunk_index"]
+        for neighbour in chunk_range(
+            con, hit["collection"], hit["source_file"], index - radius, index + radius
+        ):
+            if neighbour["id"] not in seen:
+                seen.add(neighbour["id"])
+                expanded.append({**neighbour, "context": True})
+    return expanded
+
+
+def rrf_merge(*rankings: list[dict], k: int = RRF_K) -> list[dict]:
+    """Funde listas ordenadas por reciprocal rank fusion: score = Σ 1 / (k + posição)."""
+    merged: dict[int, dict] = {}
+    for ranking in rankings:
+        for rank, hit in enumerate(ranking, 1):
+            entry = merged.setdefault(hit["id"], {**hit, "rrf": 0.0})
+            entry.update({key: value for key, value in hit.items() if key not in entry})
+            entry["rrf"] += 1.0 / (k + rank)
+    return sorted(merged.values(), key=lambda h: h["rrf"], reverse=True)
+
+
+def chunk_vectors(con: sqlite3.Connection, ids: list[int]) -> dict:
+    """Vetores float32 (dequantizados, nos formatos int8/bit) dos chunks indicados."""
+    import numpy as np
+
+    from src.vectors import dequantize_int8
+
+    fmt = vector_format(con)
+    if fmt == "bit":
+        placeholders = ",".join("?" * len(ids))
+        rows = con.execute(f"SELECT id, embedding FROM vectors_int8 WHERE id IN ({placeholders})", ids)
+    else:
+        rows = (
+            (i, con.execute("SELECT embedding FROM embeddings WHERE rowid = ?", (i,)).fetchone()[0])
+            for i in ids
+        )
+    if fmt == "float":
+        return {i: np.frombuffer(blob, dtype=np.float32) for i, blob in rows}
+    return {i: dequantize_int8(blob) for i, blob in rows}
+
+
+def mmr(hits: list[dict], vectors: dict, k: int, lambda_: float = MMR_LAMBDA) -> list[dict]:
+    """Maximal marginal relevance: escolhe k hits equilibrando relevância e novidade.
+
+    A relevância vem da posição na lista (já ordenada pela busca ou pelo
+    re-ranking). A redundância é o maior cosseno com os hits já escolhidos,
+    reescalado entre o menor cosseno do conjunto de candidatos (0) e 1 —
+    os embeddings têm um piso de similaridade alto, que sem isso penalizaria
+    todos os candidatos por igual. Dois trechos do mesmo arquivo contam
+    pelo menos SAME_FILE_SIMILARITY.
+    """
+    import numpy as np
+
+    if len(hits) <= 1:
+        return hits[:k]
+    matrix = np.stack([vectors[hit["id"]] for hit in hits]).astype(np.float32)
+    matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+    sim = matrix @ matrix.T
+    floor = float(sim.min())
+    sim = (sim - floor) / max(1.0 - floor, 1e-6)
+    files = np.array([hit["source_file"] for hit in hits])
+    sim = np.where(files[:, None] == files[None, :], np.maximum(sim, SAME_FILE_SIMILARITY), sim)
+
+    relevance = 1 - np.arange(len(hits)) / len(hits)
+    redundancy = np.zeros(len(hits))
+    available = np.ones(len(hits), dtype=bool)
+    order: list[int] = []
+    while len(order) < min(k, len(hits)):
+        score = np.where(available, lambda_ * relevance - (1 - lambda_) * redundancy, -np.inf)
+        best = int(score.argmax())
+        order.append(best)
+        available[best] = False
+        redundancy = np.maximum(redundancy, sim[best])
+    return [hits[i] for i in order]
@@ -1,19 +1,62 @@
 """
-Servidor MCP para documentação do Sankhya — transporte STDIO.
+Servidor MCP para documentação do Sankhya.
+
+Transporte STDIO por padrão (um processo por editor). Com --transport
+streamable-http (ou sse) um único processo, com o modelo carregado uma vez,
+atende toda a equipe pela rede.
 
 IMPORTANTE: nunca usar print() — corrompe o protocolo JSON-RPC.
 Todo output de log vai para sys.stderr.
 """
 
-import logging
-import sqlite3
-import struct
-import sys
-from pathlib import Path
+import time
+
+# Marcado antes dos demais imports para medir o tempo de import no log
+_START = time.perf_counter()
+
+import argparse  # noqa: E402
+import contextlib  # noqa: E402
+import contextvars  # noqa: E402
+import functools  # noqa: E402
+import logging  # noqa: E402
+import os  # noqa: E402
+import signal  # noqa: E402
+import sys  # noqa: E402
+import threading  # noqa: E402
+from concurrent.futures import ThreadPoolExecutor  # noqa: E402
+from pathlib import Path  # noqa: E402
+from typing import TYPE_CHECKING, Awaitable, Callable, TypeVar  # noqa: E402
+
+# Garante que o root do projeto está no path ao rodar como script direto
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from mcp.server.fastmcp import FastMCP  # noqa: E402
+
+from src import embedding, ivf, reranker, worker  # noqa: E402
+from src.metrics import metrics  # noqa: E402
+from src.passages import MIN_PASSAGE_TOKENS, estimate_tokens, merge_adjacent, truncate  # noqa: E402
+from src.query_cache import CACHE_PATH, QueryCache, normalize_query  # noqa: E402
+from src.search import (  # noqa: E402
+    chunk_range,
+    chunk_vectors,
+    expand_hits,
+    lexical_search,
+    lexical_stats,
+    looks_like_identifier,
+    merge_lexical,
+    mmr,
+    rrf_merge,
+    vector_search,
+)
+from src.shards import Shard, ShardSet, shards_dir  # noqa: E402
 
-import sqlite_vec
-from fastembed import TextEmbedding
-from mcp.server.fastmcp import FastMCP
+if TYPE_CHECKING:
+    from fastembed import TextEmbedding
+
+    from starlette.requests import Request
+    from starlette.responses import Response
+
+_IMPORT_TIME = time.perf_counter() - _START
 
 # ── Logging ──────────────────────────────────────────────────────────────────
 logging.basicConfig(
@@ -25,136 +68,656 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # ── Constantes ───────────────────────────────────────────────────────────────
-DB_PATH = Path(__file__).parent / "data" / "index.db"
-MODEL_NAME = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
-EMBEDDING_DIM = 384
+DB_PATH = Path(os.getenv("SANKHYA_DB_PATH") or Path(__file__).parent / "data" / "index.db")
+SEARCH_MODES = ("auto", "hybrid", "vector", "lexical")
+FUSION_DEPTH = 4  # no modo híbrido, cada lista contribui com top_k * FUSION_DEPTH candidatos
+MAX_BATCH_QUERIES = 10  # limite de queries por chamada a search_docs_many
+# Com diversify, a busca traz top_k * fator candidatos para o MMR escolher
+DIVERSIFY_OVERSAMPLE = 3
+MAX_CONTEXT_CHUNKS = 5  # limite de vizinhos por lado em expand / get_context
+# Threads que consultam os shards em paralelo numa busca sem filtro de coleção
+SHARD_WORKERS = int(os.getenv("SHARD_WORKERS", "4"))
+
+# ── Transporte de rede (--transport streamable-http | sse) ────────────────────
+TRANSPORTS = ("stdio", "streamable-http", "sse")
+HTTP_HOST = os.getenv("MCP_HOST", "127.0.0.1")
+HTTP_PORT = int(os.getenv("MCP_PORT", "8000"))
+# Conexões HTTP simultâneas; acima disso o servidor responde 503
+HTTP_MAX_CONNECTIONS = int(os.getenv("MCP_MAX_CONNECTIONS", "64"))
+# Segundos para concluir as requisições em andamento ao receber SIGINT/SIGTERM
+HTTP_SHUTDOWN_TIMEOUT = int(os.getenv("MCP_SHUTDOWN_TIMEOUT", "10"))
+_LOOPBACK_HOSTS = ("127.0.0.1", "localhost", "::1")
 
-# ── Modelo de embedding (carregado sob demanda) ───────────────────────────────
-_model: TextEmbedding | None = None
+# ── Modelo de embedding (carregado sob demanda ou pelo warm-up) ─────────────
+# fastembed (e com ele numpy/onnxruntime) só é importado ao carregar o modelo
+# (src/embedding.py), para que o servidor suba — e list_collections
+# responda — sem pagar esse custo.
+def _get_model() -> "TextEmbedding":
+    if embedding.loaded(embedding.QUERY_MODEL):
+        return embedding.get_model(embedding.QUERY_MODEL)
+    with metrics.timer("model_load"):
+        return embedding.get_model(embedding.QUERY_MODEL)
 
 
-def _get_model() -> TextEmbedding:
-    global _model
-    if _model is None:
-        logger.info(f"Carregando modelo de embedding: {MODEL_NAME}")
-        _model = TextEmbedding(model_name=MODEL_NAME)
-        logger.info("Modelo carregado.")
-    return _model
+def _model_loaded() -> bool:
+    return embedding.loaded(embedding.QUERY_MODEL)
+
+
+# A chave inclui a variante: vetores da variante quantizada não servem para a padrão
+_query_cache = QueryCache(embedding.vectors_id(embedding.QUERY_MODEL), path=CACHE_PATH or None)
 
 
 def _embed_query(text: str) -> bytes:
-    """Gera o embedding da query e serializa para bytes (formato sqlite-vec)."""
-    model = _get_model()
-    vectors = list(model.embed([text]))
-    vec = vectors[0].tolist()
-    return struct.pack(f"{len(vec)}f", *vec)
+    """Gera o embedding da query e serializa para bytes (formato sqlite-vec).
+
+    Queries repetidas (após normalização) são servidas pelo cache.
+    """
+    return _embed_queries([text])[0]
+
+
+def _embed_queries(texts: list[str]) -> list[bytes]:
+    """Embeddings de várias queries, com uma única chamada a model.embed para as que faltam no cache."""
+    keys = [normalize_query(t) for t in texts]
+    blobs: dict[str, bytes] = {}
+    missing: list[str] = []
+    for key in keys:
+        if key in blobs or key in missing:
+            continue
+        cached = _query_cache.get(key)
+        if cached is not None:
+            blobs[key] = cached
+        else:
+            missing.append(key)
+
+    if missing:
+        worker.check_cancelled()
+        model = _get_model()
+        with metrics.timer("embed"):
+            vectors = embedding.normalize(list(model.embed(missing, batch_size=len(missing))))
+        for key, vector in zip(missing, vectors):
+            blob = vector.tobytes()
+            _query_cache.put(key, blob)
+            blobs[key] = blob
+
+    return [blobs[key] for key in keys]
+
+
+# ── Índice (pools de conexões somente leitura) ────────────────────────────────
+# O index.db inteiro ou, quando a ingestão exportou shards, um arquivo por
+# coleção aberto sob demanda (src/shards.py). Cada um tem sua matriz de vetores.
+_index = Shard(DB_PATH)
+_shards = ShardSet(shards_dir(DB_PATH))
+_fan_out_executor: ThreadPoolExecutor | None = None
+_executor_lock = threading.Lock()
+
+T = TypeVar("T")
+
+
+def _sharded() -> bool:
+    return _shards.available()
+
+
+def _index_exists() -> bool:
+    return _sharded() or DB_PATH.exists()
+
+
+def _targets(collection: str | None = None) -> list[Shard]:
+    """Arquivos que uma consulta (opcionalmente filtrada por coleção) precisa ler."""
+    if _sharded():
+        return _shards.select(collection)
+    return [_index]
+
+
+def _open_shards() -> list[Shard]:
+    return _shards.loaded() if _sharded() else [_index]
+
+
+@contextlib.contextmanager
+def _connection(shard: Shard):
+    """Conexão do pool que pode ser interrompida se a requisição expirar."""
+    with contextlib.ExitStack() as stack:
+        with metrics.timer("db_open"):
+            con = stack.enter_context(worker.connection(shard.pool))
+        yield con
+
+
+def _fan_out(shards: list[Shard], fn: Callable[..., T]) -> list[T]:
+    """fn(con, shard) em cada shard — em paralelo quando há mais de um.
+
+    As threads herdam o contexto da requisição, então as consultas delas
+    também são interrompidas se a requisição expirar.
+    """
+
+    def call(shard: Shard) -> T:
+        with _connection(shard) as con:
+            return fn(con, shard)
+
+    if len(shards) <= 1:
+        return [call(shard) for shard in shards]
+    global _fan_out_executor
+    with _executor_lock:
+        if _fan_out_executor is None:
+            _fan_out_executor = ThreadPoolExecutor(SHARD_WORKERS, thread_name_prefix="shard")
+    futures = [
+        _fan_out_executor.submit(contextvars.copy_context().run, call, shard) for shard in shards
+    ]
+    return [future.result() for future in futures]
+
+
+def _merge_nearest(results: list[list[dict]], k: int) -> list[dict]:
+    """Junta os vizinhos de cada shard pela distância e fica com os k mais próximos.
+
+    vector_search devolve a mesma métrica em todos os caminhos (matriz, vec0,
+    re-ranking dos quantizados); empates ficam na ordem do id do chunk.
+    """
+    if len(results) == 1:
+        return results[0]
+    hits = (hit for shard_hits in results for hit in shard_hits)
+    return sorted(hits, key=lambda h: (h["distance"], h["id"]))[:k]
+
+
+def _by_shard(hits: list[dict]) -> dict[Shard, list[dict]]:
+    """Agrupa hits pelo arquivo de onde vieram, mantendo a ordem dentro de cada grupo."""
+    if not _sharded():
+        return {_index: hits}
+    groups: dict[Shard, list[dict]] = {}
+    for hit in hits:
+        for shard in _shards.select(hit["collection"]):
+            groups.setdefault(shard, []).append(hit)
+    return groups
+
+
+_COLLECTIONS_SQL = (
+    "SELECT collection, COUNT(*) as total FROM chunks GROUP BY collection ORDER BY collection"
+)
+_FILE_COLLECTIONS_SQL = "SELECT DISTINCT collection FROM files WHERE source_file = ?"
+
+
+# ── Warm-up e tempo até a primeira resposta ──────────────────────────────────
+_first_response_logged = False
+
+
+def _warm_up() -> None:
+    """Abre o índice e carrega o modelo em background enquanto o cliente inicializa."""
+    t0 = time.perf_counter()
+    try:
+        for shard in _targets() if _index_exists() else []:
+            with shard.pool.connection() as con:
+                con.execute("SELECT COUNT(*) FROM chunks").fetchone()
+                embedding.check_index(con)
+                shard.vector_matrix(con)
+        # Um embed de aquecimento inicializa a sessão ONNX por completo
+        list(_get_model().embed(["aquecimento"]))
+        if reranker.ENABLED:
+            list(reranker.get_model().rerank("aquecimento", ["aquecimento"]))
+    except Exception as exc:
+        logger.warning(f"Warm-up falhou (o carregamento será refeito sob demanda): {exc}")
+        return
+    logger.info(f"Warm-up concluído em {time.perf_counter() - t0:.1f}s.")
 
 
-def _get_db() -> sqlite3.Connection:
-    con = sqlite3.connect(DB_PATH)
-    con.enable_load_extension(True)
-    sqlite_vec.load(con)
-    con.enable_load_extension(False)
-    return con
+def _log_first_response(fn: Callable[..., Awaitable[str]]) -> Callable[..., Awaitable[str]]:
+    """Registra em stderr o tempo desde o início do processo até a primeira resposta."""
+
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs) -> str:
+        global _first_response_logged
+        try:
+            return await fn(*args, **kwargs)
+        finally:
+            if not _first_response_logged:
+                _first_response_logged = True
+                elapsed = time.perf_counter() - _START
+                logger.info(f"Primeira resposta ({fn.__name__}) em {elapsed:.2f}s após o início.")
+
+    return wrapper
 
 
 # ── FastMCP ───────────────────────────────────────────────────────────────────
 mcp = FastMCP("sankhya-docs")
 
 
-@mcp.tool()
-def search_docs(query: str, collection: str | None = None, top_k: int = 5) -> str:
-    """Busca documentação do Sankhya ERP com base em uma query semântica.
+_SEPARATOR = "\n\n---\n\n"
+_OMITTED_NOTE_TOKENS = 20  # reserva para a nota de resultados omitidos
 
-    Use esta ferramenta quando o usuário perguntar sobre funcionalidades,
-    configurações, erros, fluxos de trabalho ou qualquer aspecto do sistema
-    Sankhya. Retorna os trechos de documentação mais relevantes.
 
-    Args:
-        query: Pergunta ou termo a buscar (em português ou inglês).
-        collection: Nome da coleção para filtrar resultados (opcional).
-                    Use list_collections() para ver as coleções disponíveis.
-        top_k: Número de resultados a retornar (padrão: 5).
+def _format_results(
+    query: str, hits: list[dict], max_tokens: int | None = None, merge: bool = False
+) -> str:
+    """Formata os hits em markdown.
+
+    Com max_tokens (ou merge), chunks vizinhos do mesmo arquivo viram uma
+    passagem só, sem o texto sobreposto; com max_tokens a saída é cortada
+    para caber no orçamento.
     """
-    if not DB_PATH.exists():
-        return "Índice de documentação não encontrado. Execute o pipeline de ingestão primeiro."
+    if max_tokens or merge:
+        hits = merge_adjacent(hits)
+    title = f"## Resultados para: {query}\n"
+    parts: list[str] = [title]
+    budget = max_tokens - estimate_tokens(title) if max_tokens else None
+
+    for i, hit in enumerate(hits, 1):
+        type_label = "📷 Imagem" if hit["type"] == "image_description" else "📄 Documento"
+        if "rerank" in hit:
+            score_label = f"{hit['rerank'] * 100:.1f}% relevância"
+        elif "distance" in hit:
+            # Chunks e queries com norma 1 (embedding.normalize): distância L2 d → cosseno 1 - d²/2
+            similarity = 1 - hit["distance"] ** 2 / 2
+            score_label = f"{similarity * 100:.1f}% similaridade"
+        elif hit.get("context"):
+            score_label = "contexto"
+        else:
+            score_label = "correspondência textual"
+        if len(hit.get("chunks", ())) > 1:
+            score_label += f", trechos {hit['chunks'][0] + 1}–{hit['chunks'][-1] + 1}"
+        elif hit.get("chunk_index") is not None:
+            score_label += f", trecho {hit['chunk_index'] + 1}"
+        header = f"### [{i}] {hit['source_file']} — {hit['collection']} ({type_label}, {score_label})"
+        text = hit["text"]
+
+        if budget is not None:
+            # Separador, header e a nota de omissão entram na conta
+            available = budget - estimate_tokens(_SEPARATOR + header) - _OMITTED_NOTE_TOKENS
+            if estimate_tokens(text) > available:
+                if available < MIN_PASSAGE_TOKENS:
+                    omitted = len(hits) - i + 1
+                    parts.append(f"_{omitted} resultado(s) omitido(s) pelo limite de {max_tokens} tokens._")
+                    break
+                text = truncate(text, available)
+            budget -= estimate_tokens(_SEPARATOR + header) + estimate_tokens(text)
+
+        parts.append(f"{header}\n\n{text}")
+
+    return _SEPARATOR.join(parts)
+
+
+def _resolve_mode(query: str, mode: str) -> tuple[str, bool]:
+    """Resolve o modo "auto" e indica se a query vai pelo atalho de identificador."""
+    # Atalho: query que é só identificador dispensa o modelo de embedding
+    fast_path = mode == "auto" and looks_like_identifier(query)
+    if mode == "auto":
+        mode = "lexical" if fast_path else "hybrid"
+    return mode, fast_path
+
+
+def _lexical_stage(
+    shards: list[Shard],
+    query: str,
+    mode: str,
+    fast_path: bool,
+    top_k: int,
+    collection: str | None,
+    doc_type: str | None,
+) -> tuple[str, list[dict]]:
+    """Executa a busca textual quando o modo pede; devolve (modo efetivo, hits)."""
+    if mode not in ("lexical", "hybrid"):
+        return mode, []
+    depth = top_k if mode == "lexical" else top_k * FUSION_DEPTH
+
+    def search(con, shard: Shard) -> tuple[list[dict], dict | None]:
+        found = lexical_search(con, query, depth, collection, doc_type, match_all=fast_path)
+        # Com mais de um shard, o score é recalculado com o IDF de todos eles
+        return found, lexical_stats(con, query, found) if len(shards) > 1 else None
+
+    with metrics.timer("lexical"):
+        results = _fan_out(shards, search)
+        if len(results) > 1:
+            hits = merge_lexical(results, depth)
+        else:
+            hits = results[0][0] if results else []
+    if fast_path and not hits:
+        logger.info(f"  busca textual sem resultados para '{query}' — recorrendo à busca semântica")
+        return "vector", hits
+    return mode, hits
+
+
+def _vector_stage(
+    shards: list[Shard],
+    query_vec: bytes,
+    mode: str,
+    lexical_hits: list[dict],
+    top_k: int,
+    collection: str | None,
+    doc_type: str | None,
+) -> list[dict]:
+    """Executa a busca semântica e, no modo híbrido, funde com os hits textuais."""
+    depth = top_k if mode == "vector" else top_k * FUSION_DEPTH
 
-    logger.info(f"search_docs: query='{query}' collection={collection!r} top_k={top_k}")
+    def search(con, shard: Shard) -> list[dict]:
+        # Vetores de outro modelo não são comparáveis com o da query
+        embedding.check_index(con)
+        return vector_search(con, query_vec, depth, collection, doc_type, shard.vector_matrix(con))
 
+    with metrics.timer("knn"):
+        results = _fan_out(shards, search)
+        vector_hits = _merge_nearest(results, depth)
+    if mode != "hybrid":
+        return vector_hits
+    with metrics.timer("fusion"):
+        return rrf_merge(vector_hits, lexical_hits)
+
+
+def _rerank_enabled(flag: bool | None) -> bool:
+    return reranker.ENABLED if flag is None else flag
+
+
+def _rerank_stage(query: str, hits: list[dict]) -> list[dict]:
+    """Re-ranking por cross-encoder; se o orçamento acabar, o restante fica na ordem da busca.
+
+    Sem o modelo carregado (warm-up em andamento ou desligado), dispara a carga
+    em segundo plano e devolve os hits na ordem da busca.
+    """
+    if len(hits) < 2:
+        return hits
+    if not reranker.loaded():
+        # A carga do cross-encoder leva segundos: fica fora da requisição
+        reranker.load_in_background()
+        metrics.count("rerank.model_loading")
+        logger.info("  re-ranking: cross-encoder ainda carregando — mantida a ordem da busca")
+        return hits
     try:
-        query_vec = _embed_query(query)
+        with metrics.timer("rerank"):
+            hits, complete = reranker.rerank(query, hits)
     except Exception as exc:
-        logger.error(f"Erro ao gerar embedding: {exc}")
-        return f"Erro ao processar a query: {exc}"
+        logger.warning(f"Re-ranking indisponível, mantendo a ordem da busca: {exc}")
+        metrics.count("rerank.errors")
+        return hits
+    if not complete:
+        metrics.count("rerank.budget_exhausted")
+        logger.info(f"  re-ranking: orçamento de {reranker.BUDGET_MS:g}ms esgotado")
+    return hits
+
+
+def _diversify_stage(hits: list[dict], top_k: int) -> list[dict]:
+    """MMR sobre os candidatos: troca trechos quase repetidos por outros relevantes."""
+    if len(hits) <= top_k:
+        return hits
+    try:
+        with metrics.timer("diversify"):
+            groups = _by_shard(hits)
+            vectors: dict = {}
+            for found in _fan_out(
+                list(groups), lambda con, shard: chunk_vectors(con, [hit["id"] for hit in groups[shard]])
+            ):
+                vectors.update(found)
+            return mmr(hits, vectors, top_k)
+    except Exception as exc:
+        logger.warning(f"Diversificação indisponível, mantendo a ordem da busca: {exc}")
+        return hits
+
+
+def _expand_stage(hits: list[dict], radius: int) -> list[dict]:
+    """expand_hits em cada shard; os vizinhos seguem o hit que os trouxe."""
+    groups = _by_shard(hits)
+    results = _fan_out(list(groups), lambda con, shard: expand_hits(con, groups[shard], radius))
+    if len(results) == 1:
+        return results[0]
+    following: dict[int, list[dict]] = {}
+    for expanded in results:
+        # Cada lista começa por um hit da busca, seguido dos seus vizinhos
+        current = expanded[0]["id"] if expanded else None
+        for hit in expanded:
+            if hit.get("context"):
+                following[current].append(hit)
+            else:
+                current = hit["id"]
+                following[current] = [hit]
+    return [entry for hit in hits for entry in following.get(hit["id"], [hit])]
+
+
+def _no_results(query: str, collection: str | None, doc_type: str | None) -> str:
+    msg = f"Nenhum resultado encontrado para '{query}'"
+    if collection:
+        msg += f" na coleção '{collection}'"
+    if doc_type:
+        msg += f" do tipo '{doc_type}'"
+    return msg
+
+
+def _search_docs(
+    query: str,
+    collection: str | None = None,
+    top_k: int = 5,
+    doc_type: str | None = None,
+    mode: str = "auto",
+    rerank: bool | None = None,
+    diversify: bool = False,
+    max_tokens: int | None = None,
+    expand: int = 0,
+) -> str:
+    if not _index_exists():
+        return "Índice de documentação não encontrado. Execute o pipeline de ingestão primeiro."
+
+    mode = mode.lower()
+    if mode not in SEARCH_MODES:
+        return f"Modo de busca inválido: '{mode}'. Use um de: {', '.join(SEARCH_MODES)}."
+
+    use_rerank = _rerank_enabled(rerank)
+    logger.info(
+        f"search_docs: query='{query}' collection={collection!r} doc_type={doc_type!r} "
+        f"top_k={top_k} mode={mode} rerank={use_rerank} diversify={diversify} "
+        f"max_tokens={max_tokens} expand={expand}"
+    )
+
+    mode, fast_path = _resolve_mode(query, mode)
+    # Com re-ranking, a busca traz mais candidatos para o cross-encoder escolher
+    depth = max(top_k, reranker.CANDIDATES) if use_rerank else top_k
+    if diversify:
+        depth = max(depth, top_k * DIVERSIFY_OVERSAMPLE)
+
+    shards = _targets(collection)
+    lexical_hits: list[dict] = []
+    if mode in ("lexical", "hybrid"):
+        try:
+            mode, lexical_hits = _lexical_stage(
+                shards, query, mode, fast_path, depth, collection, doc_type
+            )
+        except Exception as exc:
+            logger.error(f"Erro na busca textual: {exc}")
+            return f"Erro ao consultar o índice: {exc}"
+
+    hits = lexical_hits
+    if mode in ("vector", "hybrid"):
+        try:
+            query_vec = _embed_query(query)
+        except Exception as exc:
+            logger.error(f"Erro ao gerar embedding: {exc}")
+            return f"Erro ao processar a query: {exc}"
+
+        logger.info(f"  cache de queries: {_query_cache.hit_rate:.0%} de acertos")
+
+        try:
+            hits = _vector_stage(shards, query_vec, mode, lexical_hits, depth, collection, doc_type)
+        except Exception as exc:
+            logger.error(f"Erro na consulta ao índice: {exc}")
+            return f"Erro ao consultar o índice: {exc}"
+
+    if use_rerank:
+        hits = _rerank_stage(query, hits)
+    if diversify:
+        hits = _diversify_stage(hits, top_k)
+    hits = hits[:top_k]
 
+    metrics.count(f"mode.{mode}")
+    if not hits:
+        metrics.count("empty_results")
+        return _no_results(query, collection, doc_type)
+
+    expand = min(max(expand, 0), MAX_CONTEXT_CHUNKS)
+    if expand:
+        try:
+            with metrics.timer("context"):
+                hits = _expand_stage(hits, expand)
+        except Exception as exc:
+            logger.warning(f"Falha ao buscar trechos vizinhos, seguindo sem eles: {exc}")
+
+    with metrics.timer("format"):
+        return _format_results(query, hits, max_tokens, merge=bool(expand))
+
+
+def _search_docs_many(
+    queries: list[str],
+    collection: str | None = None,
+    top_k: int = 5,
+    doc_type: str | None = None,
+    mode: str = "auto",
+    rerank: bool | None = None,
+) -> str:
+    if not _index_exists():
+        return "Índice de documentação não encontrado. Execute o pipeline de ingestão primeiro."
+
+    mode = mode.lower()
+    if mode not in SEARCH_MODES:
+        return f"Modo de busca inválido: '{mode}'. Use um de: {', '.join(SEARCH_MODES)}."
+
+    # Queries vazias ou repetidas (após normalização) são descartadas
+    unique: dict[str, str] = {}
+    for query in queries:
+        if query.strip():
+            unique.setdefault(normalize_query(query), query)
+    queries = list(unique.values())
+    if not queries:
+        return "Nenhuma query informada."
+    if len(queries) > MAX_BATCH_QUERIES:
+        return f"Máximo de {MAX_BATCH_QUERIES} queries por chamada (recebidas: {len(queries)})."
+
+    use_rerank = _rerank_enabled(rerank)
+    logger.info(
+        f"search_docs_many: {len(queries)} queries collection={collection!r} "
+        f"doc_type={doc_type!r} top_k={top_k} mode={mode} rerank={use_rerank}"
+    )
+
+    # Folga de candidatos para completar top_k depois de remover os repetidos
+    depth = top_k * 2
+    if use_rerank:
+        depth = max(depth, reranker.CANDIDATES)
+    plans = [_resolve_mode(query, mode) for query in queries]
+    shards = _targets(collection)
+    results: list[list[dict]] = []
     try:
-        con = _get_db()
-
-        # Busca os k mais próximos (ampliado para filtrar por coleção depois)
-        candidates = top_k * 10 if collection else top_k
-
-        rows = con.execute(
-            """
-            SELECT c.text, c.source_file, c.collection, c.type, e.distance
-            FROM (
-                SELECT rowid, distance
-                FROM embeddings
-                WHERE embedding MATCH ?
-                  AND k = ?
-                ORDER BY distance
-            ) e
-            JOIN chunks c ON c.id = e.rowid
-            """,
-            (query_vec, candidates),
-        ).fetchall()
-
-        con.close()
+        lexical = [
+            _lexical_stage(shards, query, query_mode, fast_path, depth, collection, doc_type)
+            for query, (query_mode, fast_path) in zip(queries, plans)
+        ]
+
+        semantic = [i for i, (query_mode, _) in enumerate(lexical) if query_mode != "lexical"]
+        try:
+            vectors = _embed_queries([queries[i] for i in semantic]) if semantic else []
+        except Exception as exc:
+            logger.error(f"Erro ao gerar embedding: {exc}")
+            return f"Erro ao processar as queries: {exc}"
+        query_vecs = dict(zip(semantic, vectors))
+
+        for i, (query_mode, lexical_hits) in enumerate(lexical):
+            if i in query_vecs:
+                results.append(
+                    _vector_stage(
+                        shards, query_vecs[i], query_mode, lexical_hits, depth, collection, doc_type
+                    )
+                )
+            else:
+                results.append(lexical_hits)
     except Exception as exc:
         logger.error(f"Erro na consulta ao índice: {exc}")
         return f"Erro ao consultar o índice: {exc}"
 
-    # Filtra por coleção se solicitado
-    if collection:
-        rows = [r for r in rows if r[2] == collection]
+    if use_rerank:
+        results = [_rerank_stage(query, hits) for query, hits in zip(queries, results)]
 
-    rows = rows[:top_k]
+    seen: set[int] = set()
+    sections: list[str] = []
+    for query, hits, (query_mode, _) in zip(queries, results, lexical):
+        fresh = [h for h in hits if h["id"] not in seen][:top_k]
+        repeated = sum(1 for h in hits[:top_k] if h["id"] in seen)
+        seen.update(h["id"] for h in fresh)
 
-    if not rows:
-        msg = f"Nenhum resultado encontrado para '{query}'"
-        if collection:
-            msg += f" na coleção '{collection}'"
-        return msg
-
-    # Formata a resposta
-    parts: list[str] = [f"## Resultados para: {query}\n"]
-
-    for i, (text, source_file, coll, doc_type, distance) in enumerate(rows, 1):
-        similarity = round((1 - distance) * 100, 1)
-        type_label = "📷 Imagem" if doc_type == "image_description" else "📄 Documento"
-        parts.append(
-            f"### [{i}] {source_file} — {coll} ({type_label}, {similarity}% relevância)\n\n{text}"
-        )
+        metrics.count(f"mode.{query_mode}")
+        if fresh:
+            with metrics.timer("format"):
+                section = _format_results(query, fresh)
+        elif repeated:
+            section = f"## Resultados para: {query}\n"
+        else:
+            metrics.count("empty_results")
+            section = _no_results(query, collection, doc_type)
+        if repeated:
+            section += f"\n\n_{repeated} trecho(s) já exibido(s) acima omitido(s)._"
+        sections.append(section)
 
-    return "\n\n---\n\n".join(parts)
+    return "\n\n═════\n\n".join(sections)
 
 
-@mcp.tool()
-def list_collections() -> str:
-    """Lista todas as coleções de documentação do Sankhya disponíveis no índice.
+def _get_context(
+    source_file: str,
+    chunk: int,
+    collection: str | None = None,
+    before: int = 1,
+    after: int = 2,
+) -> str:
+    if not _index_exists():
+        return "Índice de documentação não encontrado. Execute o pipeline de ingestão primeiro."
 
-    Use esta ferramenta antes de search_docs quando quiser restringir a busca
-    a uma área específica do sistema, ou para dar ao usuário uma visão geral
-    do que está documentado.
-    """
-    if not DB_PATH.exists():
+    before = min(max(before, 0), MAX_CONTEXT_CHUNKS)
+    after = min(max(after, 0), MAX_CONTEXT_CHUNKS)
+    logger.info(
+        f"get_context: source_file={source_file!r} chunk={chunk} collection={collection!r} "
+        f"before={before} after={after}"
+    )
+    try:
+        with metrics.timer("context"):
+            if collection is None:
+                # Sem a coleção, o arquivo é procurado em todos os shards
+                found = _fan_out(
+                    _targets(),
+                    lambda con, shard: [
+                        row[0]
+                        for row in con.execute(_FILE_COLLECTIONS_SQL, (source_file,))
+                    ],
+                )
+                collections = sorted({name for names in found for name in names})
+                if len(collections) > 1:
+                    return (
+                        f"O arquivo '{source_file}' existe em mais de uma coleção "
+                        f"({', '.join(collections)}). Informe o parâmetro collection."
+                    )
+                collection = collections[0] if collections else ""
+            # O número do trecho exibido nos resultados é 1-based
+            index = chunk - 1
+            rows = [
+                row
+                for found in _fan_out(
+                    _targets(collection),
+                    lambda con, shard: chunk_range(
+                        con, collection, source_file, index - before, index + after
+                    ),
+                )
+                for row in found
+            ]
+    except Exception as exc:
+        logger.error(f"Erro na consulta ao índice: {exc}")
+        return f"Erro ao consultar o índice: {exc}"
+
+    if not rows:
+        return f"Nenhum trecho encontrado para '{source_file}' (trecho {chunk})."
+    with metrics.timer("format"):
+        return _format_results(
+            f"{source_file}, trecho {chunk}",
+            [{**row, "context": True} for row in rows],
+            merge=True,
+        )
+
+
+def _list_collections() -> str:
+    if not _index_exists():
         return "Índice de documentação não encontrado. Execute o pipeline de ingestão primeiro."
 
     try:
-        con = sqlite3.connect(DB_PATH)
-        rows = con.execute(
-            "SELECT collection, COUNT(*) as total FROM chunks GROUP BY collection ORDER BY collection"
-        ).fetchall()
-        con.close()
+        if _sharded():
+            # Contagens do manifesto: listar as coleções não abre nenhum shard
+            rows = list(_shards.collections().items())
+        else:
+            with _connection(_index) as con:
+                rows = con.execute(_COLLECTIONS_SQL).fetchall()
     except Exception as exc:
         logger.error(f"Erro ao consultar coleções: {exc}")
         return f"Erro ao consultar o índice: {exc}"
@@ -173,10 +736,324 @@ def list_collections() -> str:
     return "\n".join(lines)
 
 
+# ── Tools MCP ─────────────────────────────────────────────────────────────────
+# Os handlers são assíncronos: embedding e sqlite rodam no pool de threads de
+# src.worker, então uma busca lenta não bloqueia as demais requisições.
+async def _run_tool(fn: Callable[..., str], *args) -> str:
+    name = fn.__name__.lstrip("_")
+    metrics.count(f"calls.{name}")
+    try:
+        # Inclui a espera por uma thread livre no pool
+        with metrics.timer(f"total.{name}"):
+            return await worker.run_blocking(fn, *args)
+    except TimeoutError:
+        metrics.count("timeouts")
+        logger.warning(f"{name}: tempo limite de {worker.TIMEOUT:g}s excedido")
+        return (
+            f"A consulta excedeu o tempo limite de {worker.TIMEOUT:g}s. "
+            "Tente novamente ou use uma query mais específica."
+        )
+
+
+@mcp.tool()
+@_log_first_response
+async def search_docs(
+    query: str,
+    collection: str | None = None,
+    top_k: int = 5,
+    doc_type: str | None = None,
+    mode: str = "auto",
+    rerank: bool | None = None,
+    diversify: bool = False,
+    max_tokens: int | None = None,
+    expand: int = 0,
+) -> str:
+    """Busca documentação do Sankhya ERP com base em uma query semântica.
+
+    Use esta ferramenta quando o usuário perguntar sobre funcionalidades,
+    configurações, erros, fluxos de trabalho ou qualquer aspecto do sistema
+    Sankhya. Retorna os trechos de documentação mais relevantes.
+
+    Args:
+        query: Pergunta ou termo a buscar (em português ou inglês).
+        collection: Nome da coleção para filtrar resultados (opcional).
+                    Use list_collections() para ver as coleções disponíveis.
+        top_k: Número de resultados a retornar (padrão: 5).
+        doc_type: Filtra pelo tipo de trecho: "markdown" (documentos) ou
+                  "image_description" (descrições de prints de tela). Opcional.
+        mode: Estratégia de busca (padrão: "auto").
+              "hybrid" combina busca semântica e textual (BM25);
+              "vector" usa só a busca semântica; "lexical" só a textual,
+              ideal para códigos exatos como nomes de tabela/campo (CODPROD,
+              TGFCAB) e mensagens de erro. "auto" usa a busca textual quando a
+              query é só um código/identificador e a híbrida nos demais casos.
+        rerank: Reordena os candidatos com um cross-encoder, mais preciso que a
+                busca sozinha; permite pedir um top_k pequeno (ex.: 3) e
+                ainda receber os melhores trechos. Padrão: RERANK_ENABLED.
+                Enquanto o modelo carrega, os resultados vêm na ordem da busca.
+        diversify: Evita trechos repetidos ou do mesmo arquivo nos resultados,
+                   trocando-os pelos próximos mais relevantes (MMR). Útil em
+                   perguntas abertas que pedem uma visão geral.
+        max_tokens: Limite aproximado de tokens da resposta (opcional). Trechos
+                    vizinhos do mesmo arquivo são unidos sem texto repetido e
+                    os menos relevantes são cortados para caber no limite.
+        expand: Inclui, junto de cada resultado, N trechos vizinhos de cada
+                lado no mesmo arquivo (padrão: 0, máx. 5). Use quando a
+                resposta for um procedimento que continua além do trecho.
+    """
+    return await _run_tool(
+        _search_docs,
+        query,
+        collection,
+        top_k,
+        doc_type,
+        mode,
+        rerank,
+        diversify,
+        max_tokens,
+        expand,
+    )
+
+
+@mcp.tool()
+@_log_first_response
+async def search_docs_many(
+    queries: list[str],
+    collection: str | None = None,
+    top_k: int = 5,
+    doc_type: str | None = None,
+    mode: str = "auto",
+    rerank: bool | None = None,
+) -> str:
+    """Busca várias perguntas relacionadas de uma vez na documentação do Sankhya ERP.
+
+    Prefira esta ferramenta a várias chamadas de search_docs quando a dúvida
+    do usuário se divide em sub-perguntas (ex.: "como cadastrar o produto",
+    "como definir o preço", "como emitir a nota"). Os resultados vêm
+    agrupados por query; um trecho que já apareceu para uma query anterior
+    não é repetido nas seguintes.
+
+    Args:
+        queries: Lista de perguntas ou termos a buscar (até 10).
+        collection: Nome da coleção para filtrar resultados (opcional).
+        top_k: Número de resultados por query (padrão: 5).
+        doc_type: "markdown" ou "image_description" (opcional).
+        mode: Estratégia de busca, como em search_docs (padrão: "auto").
+        rerank: Reordena os candidatos de cada query com um cross-encoder,
+                como em search_docs.
+    """
+    return await _run_tool(_search_docs_many, queries, collection, top_k, doc_type, mode, rerank)
+
+
+@mcp.tool()
+@_log_first_response
+async def get_context(
+    source_file: str,
+    chunk: int,
+    collection: str | None = None,
+    before: int = 1,
+    after: int = 2,
+) -> str:
+    """Lê os trechos vizinhos de um resultado de search_docs no mesmo arquivo.
+
+    Use quando o melhor resultado for só um fragmento (ex.: o começo de um
+    passo a passo) e o restante estiver nos trechos seguintes — é bem mais
+    barato que refazer a busca.
+
+    Args:
+        source_file: Nome do arquivo, como aparece no resultado (ex.: "reabrir-op.md").
+        chunk: Número do trecho, como aparece no resultado ("trecho 3").
+        collection: Coleção do arquivo; necessária só se o nome se repetir
+                    em mais de uma coleção.
+        before: Quantos trechos anteriores incluir (padrão: 1, máx. 5).
+        after: Quantos trechos seguintes incluir (padrão: 2, máx. 5).
+    """
+    return await _run_tool(_get_context, source_file, chunk, collection, before, after)
+
+
+@mcp.tool()
+@_log_first_response
+async def list_collections() -> str:
+    """Lista todas as coleções de documentação do Sankhya disponíveis no índice.
+
+    Use esta ferramenta antes de search_docs quando quiser restringir a busca
+    a uma área específica do sistema, ou para dar ao usuário uma visão geral
+    do que está documentado.
+    """
+    return await _run_tool(_list_collections)
+
+
+def _matrices() -> list:
+    return [shard.matrix for shard in _open_shards() if shard.matrix is not None]
+
+
+def _stats_extra() -> dict:
+    matrices = _matrices()
+    return {
+        "query_cache": _query_cache.stats(),
+        "model_loaded": _model_loaded(),
+        "vector_matrix": sum(len(m) for m in matrices) if matrices else None,
+        "shards_open": len(_shards.loaded()) if _sharded() else None,
+    }
+
+
+def _knn_backend() -> str:
+    matrices = _matrices()
+    if not matrices:
+        return "pelo vec0"
+    indexes = [m.ivf for m in matrices if m.ivf is not None]
+    if not indexes:
+        return "pela matriz em memória"
+    return f"pelo IVF ({sum(i.nlist for i in indexes)} listas, nprobe={ivf.NPROBE})"
+
+
+def _index_layout() -> str:
+    if not _sharded():
+        return "índice único"
+    return f"{len(_shards.collections())} shards ({len(_shards.loaded())} abertos)"
+
+
+def _server_stats() -> str:
+    if not metrics.enabled:
+        return "Métricas desativadas (SEARCH_METRICS=0)."
+
+    snap = metrics.snapshot()
+    cache = _query_cache.stats()
+    lines = [
+        "## Estatísticas do servidor\n",
+        f"Ativo há {snap['uptime_s']:.0f}s — modelo {'carregado' if _model_loaded() else 'não carregado'}, "
+        f"KNN {_knn_backend()}, {_index_layout()}.\n",
+        "| Etapa | Chamadas | Média (ms) | p50 | p95 | p99 | Máx |",
+        "|---|---:|---:|---:|---:|---:|---:|",
+    ]
+    for stage, h in snap["stages"].items():
+        lines.append(
+            f"| {stage} | {h['count']} | {h['mean_ms']:.2f} | {h['p50_ms']:.2f} | "
+            f"{h['p95_ms']:.2f} | {h['p99_ms']:.2f} | {h['max_ms']:.2f} |"
+        )
+    lines.append("\n**Contadores**\n")
+    lines += [f"- {name}: {value}" for name, value in snap["counters"].items()] or ["- (nenhum)"]
+    lines.append(
+        f"\n**Cache de queries:** {cache['hit_rate']:.0%} de acertos "
+        f"({cache['hits'] - cache['disk_hits']} memória, {cache['disk_hits']} disco, {cache['misses']} falhas; "
+        f"{cache['entries']}/{cache['maxsize']} entradas)"
+    )
+    return "\n".join(lines)
+
+
+@mcp.tool()
+async def server_stats() -> str:
+    """Mostra métricas de desempenho do servidor de documentação.
+
+    Latência por etapa da busca (carga do modelo, embedding, conexão, KNN,
+    busca textual, fusão, formatação e total por ferramenta) com percentis,
+    contadores de buscas e de resultados vazios, e a taxa de acerto do
+    cache de queries. Útil para diagnosticar lentidão.
+    """
+    return _server_stats()
+
+
+@mcp.custom_route("/health", methods=["GET"])
+async def health(request: "Request") -> "Response":
+    """Health check do transporte HTTP: 200 quando o índice está disponível."""
+    from starlette.responses import JSONResponse
+
+    ready = _index_exists()
+    return JSONResponse(
+        {
+            "status": "ok" if ready else "no_index",
+            "model_loaded": _model_loaded(),
+            "uptime_s": round(time.perf_counter() - _START, 1),
+        },
+        status_code=200 if ready else 503,
+    )
+
+
 # ── Entry point ───────────────────────────────────────────────────────────────
+def _serve_http(transport: str, host: str, port: int, max_connections: int) -> None:
+    """Serve o MCP via HTTP com uvicorn: limite de conexões e shutdown gracioso."""
+    import anyio
+    import uvicorn
+    from mcp.server.transport_security import TransportSecuritySettings
+
+    mcp.settings.host = host
+    mcp.settings.port = port
+    if host not in _LOOPBACK_HOSTS:
+        # Servidor compartilhado: os clientes usam o nome/IP da máquina, não localhost
+        mcp.settings.transport_security = TransportSecuritySettings(
+            enable_dns_rebinding_protection=False
+        )
+    app = mcp.sse_app() if transport == "sse" else mcp.streamable_http_app()
+
+    config = uvicorn.Config(
+        app,
+        host=host,
+        port=port,
+        limit_concurrency=max_connections,
+        timeout_graceful_shutdown=HTTP_SHUTDOWN_TIMEOUT,
+        log_level="info",
+    )
+    logger.info(f"Servindo via {transport} em http://{host}:{port} (health: /health)")
+    # O uvicorn trata SIGINT/SIGTERM (para de aceitar conexões e aguarda as
+    # requisições em andamento) e depois repropaga o sinal: sem este handler o
+    # SIGTERM mataria o processo antes da limpeza em main()
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        anyio.run(uvicorn.Server(config).serve)
+    except KeyboardInterrupt:
+        pass
+
+
 def main() -> None:
+    parser = argparse.ArgumentParser(description="Servidor MCP sankhya-docs")
+    parser.add_argument(
+        "--no-warmup",
+        action="store_true",
+        help="Não carrega o modelo em background na inicialização (carrega na primeira busca)",
+    )
+    parser.add_argument(
+        "--transport",
+        choices=TRANSPORTS,
+        default=os.getenv("MCP_TRANSPORT", "stdio"),
+        help="stdio (padrão, um processo por cliente) ou streamable-http/sse (servidor compartilhado)",
+    )
+    parser.add_argument(
+        "--host",
+        default=HTTP_HOST,
+        help="Endereço de escuta no modo HTTP (padrão: MCP_HOST ou 127.0.0.1; use 0.0.0.0 para a rede)",
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=HTTP_PORT,
+        help="Porta no modo HTTP (padrão: MCP_PORT ou 8000)",
+    )
+    parser.add_argument(
+        "--max-connections",
+        type=int,
+        default=HTTP_MAX_CONNECTIONS,
+        metavar="N",
+        help="Conexões HTTP simultâneas antes de responder 503 (padrão: MCP_MAX_CONNECTIONS ou 64)",
+    )
+    args = parser.parse_args()
+
     logger.info(f"Iniciando servidor sankhya-docs (DB: {DB_PATH})")
-    mcp.run(transport="stdio")
+    logger.info(f"Imports concluídos em {_IMPORT_TIME * 1000:.0f}ms.")
+
+    if not args.no_warmup:
+        threading.Thread(target=_warm_up, name="warmup", daemon=True).start()
+    metrics.start_dump(extra=_stats_extra)
+
+    try:
+        if args.transport == "stdio":
+            mcp.run(transport="stdio")
+        else:
+            _serve_http(args.transport, args.host, args.port, args.max_connections)
+    finally:
+        _index.close()
+        _shards.close()
+        logger.info(f"Cache de queries: {_query_cache.stats()}")
+        _query_cache.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,174 @@
+"""
+Índice dividido em um arquivo por coleção (shards).
+
+Com INDEX_SHARDS=1 (ou python ingest/ingest.py --shards on), a ingestão
+grava, além do index.db, um banco por coleção de docs/ em src/data/shards/:
+
+  <coleção>.db          mesmo schema do index.db, só com os chunks da coleção
+  <coleção>.vectors.*   matriz de vetores da coleção (src/matrix_index.py)
+  manifest.json         formato dos vetores e, por coleção, arquivo, nº de chunks e digest
+
+Um shard só é regravado quando o conteúdo da coleção muda (digest), então a
+atualização de uma coleção produz um único arquivo novo para distribuir.
+Os ids dos chunks são os do index.db, únicos entre os shards: os shards
+derivam do index.db que a ingestão mantém e só se combinam com shards da
+mesma origem. Os pacotes levam só os shards (hatch_build.py, e o .npmignore
+que a ingestão grava em src/data).
+
+Quando o manifesto existe, o servidor consulta os shards em vez do index.db
+e abre cada um só na primeira busca que precisa dele: uma busca filtrada por
+coleção lê apenas o shard da coleção; uma busca sem filtro consulta todos em
+paralelo e junta os resultados.
+"""
+
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from src import matrix_index
+from src.db import ConnectionPool
+from src.metrics import metrics
+
+if TYPE_CHECKING:
+    from src.matrix_index import VectorMatrix
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = "manifest.json"
+
+
+def shards_dir(db_path: Path) -> Path:
+    """Diretório dos shards do índice em `db_path`."""
+    return db_path.parent / "shards"
+
+
+def shard_path(directory: Path, collection: str) -> Path:
+    return directory / f"{collection}.db"
+
+
+def read_manifest(directory: Path) -> dict | None:
+    try:
+        return json.loads((directory / MANIFEST_NAME).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+def write_manifest(directory: Path, manifest: dict) -> None:
+    path = directory / MANIFEST_NAME
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(manifest, indent=2, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+class Shard:
+    """Um arquivo de índice (o index.db inteiro ou uma coleção), com seu pool e sua matriz."""
+
+    def __init__(self, db_path: Path, collection: str | None = None) -> None:
+        self.db_path = db_path
+        self.collection = collection
+        self.pool = ConnectionPool(db_path)
+        self.matrix: "VectorMatrix | None" = None
+        self._matrix_missing: str | None = None  # carimbo cuja matriz não pôde ser carregada
+        self._matrix_lock = threading.Lock()
+
+    def vector_matrix(self, con) -> "VectorMatrix | None":
+        """Matriz válida para o conteúdo atual do arquivo, ou None (a busca usa o vec0).
+
+        O carimbo em meta muda a cada ingestão; a matriz é remapeada quando ele muda.
+        """
+        if not matrix_index.ENABLED:
+            return None
+        stamp = matrix_index.current_stamp(con)
+        if stamp is None or stamp == self._matrix_missing:
+            return None
+        matrix = self.matrix
+        if matrix is not None and matrix.stamp == stamp:
+            return matrix
+        with self._matrix_lock:
+            if self.matrix is None or self.matrix.stamp != stamp:
+                with metrics.timer("matrix_load"):
+                    loaded = matrix_index.VectorMatrix.load(self.db_path, stamp)
+                if loaded is None:
+                    self._matrix_missing = stamp
+                    logger.info(f"Matriz de vetores de {self.db_path.name} ausente ou desatualizada — KNN pelo vec0.")
+                    return None
+                self.matrix = loaded
+                logger.info(f"Matriz de vetores de {self.db_path.name} mapeada em memória: {len(loaded)} vetores.")
+        return self.matrix
+
+    def close(self) -> None:
+        self.pool.close()
+
+
+class ShardSet:
+    """Shards descritos pelo manifesto, abertos sob demanda.
+
+    O manifesto é relido quando muda em disco (nova ingestão); shards de
+    coleções removidas são fechados, e os regravados são reabertos pelo
+    próprio pool de conexões, que detecta a troca do arquivo.
+    """
+
+    def __init__(self, directory: Path) -> None:
+        self.directory = directory
+        self._manifest_path = directory / MANIFEST_NAME
+        self._mtime: int | None = None
+        self._entries: dict[str, dict] = {}
+        self._shards: dict[str, Shard] = {}
+        self._lock = threading.Lock()
+
+    def _refresh(self) -> None:
+        try:
+            mtime = self._manifest_path.stat().st_mtime_ns
+        except OSError:
+            mtime = None
+        if mtime == self._mtime:
+            return
+        with self._lock:
+            if mtime == self._mtime:
+                return
+            manifest = read_manifest(self.directory) if mtime is not None else None
+            entries = manifest.get("collections", {}) if manifest else {}
+            for name in self._shards.keys() - entries.keys():
+                self._shards.pop(name).close()
+            # Entradas antes do mtime: quem vê o mtime novo já vê as entradas novas
+            self._entries = entries
+            self._mtime = mtime
+            if entries:
+                logger.info(f"Manifesto de shards carregado: {len(entries)} coleções.")
+
+    def available(self) -> bool:
+        """Há um manifesto com ao menos um shard."""
+        self._refresh()
+        return bool(self._entries)
+
+    def collections(self) -> dict[str, int]:
+        """{coleção: nº de chunks}, pelo manifesto — sem abrir os shards."""
+        self._refresh()
+        return {name: entry["chunks"] for name, entry in sorted(self._entries.items())}
+
+    def select(self, collection: str | None = None) -> list[Shard]:
+        """O shard da coleção (lista vazia se ela não existe) ou, sem filtro, todos."""
+        self._refresh()
+        names = [collection] if collection else sorted(self._entries)
+        return [self._shard(name) for name in names if name in self._entries]
+
+    def loaded(self) -> list[Shard]:
+        """Shards já abertos por alguma busca."""
+        return list(self._shards.values())
+
+    def _shard(self, name: str) -> Shard:
+        shard = self._shards.get(name)
+        if shard is not None:
+            return shard
+        with self._lock:
+            if name not in self._shards:
+                self._shards[name] = Shard(self.directory / self._entries[name]["file"], name)
+            return self._shards[name]
+
+    def close(self) -> None:
+        with self._lock:
+            for shard in self._shards.values():
+                shard.close()
@@ -0,0 +1,50 @@
+"""
+Formatos de armazenamento dos vetores no índice — compartilhado entre a
+ingestão (que grava) e o servidor (que consulta).
+
+  float — FLOAT[384], 1536 bytes por chunk (busca exata)
+  int8  — INT8[384],   384 bytes por chunk; KNN em int8 e re-ranking dos
+          candidatos com a query em float contra os vetores int8 dequantizados
+  bit   — BIT[384],     48 bytes por chunk para a busca grossa (Hamming) e
+          uma cópia int8 (tabela vectors_int8) para o re-ranking
+"""
+
+import numpy as np
+
+VECTOR_FORMATS = ("float", "int8", "bit")
+INT8_SCALE = 127.0  # embeddings normalizados: componentes em [-1, 1]
+
+_COLUMN_TYPES = {"float": "FLOAT", "int8": "INT8", "bit": "BIT"}
+_SQL_CONSTRUCTORS = {"float": "vec_f32", "int8": "vec_int8", "bit": "vec_bit"}
+
+
+def column_type(vector_format: str, dim: int) -> str:
+    """Tipo da coluna vec0 para o formato (ex: 'INT8[384]')."""
+    return f"{_COLUMN_TYPES[vector_format]}[{dim}]"
+
+
+def sql_constructor(vector_format: str) -> str:
+    """Função do sqlite-vec que interpreta o blob no formato (vec_f32/vec_int8/vec_bit)."""
+    return _SQL_CONSTRUCTORS[vector_format]
+
+
+def quantize_int8(vectors: np.ndarray) -> np.ndarray:
+    return np.clip(np.rint(vectors * INT8_SCALE), -INT8_SCALE, INT8_SCALE).astype(np.int8)
+
+
+def quantize_bit(vectors: np.ndarray) -> np.ndarray:
+    """Um bit por dimensão (sinal do componente), empacotado em bytes."""
+    return np.packbits(vectors > 0, axis=-1)
+
+
+def quantize(vectors: np.ndarray, vector_format: str) -> np.ndarray:
+    """Converte vetores float32 (1 ou 2 dimensões) para o formato de armazenamento."""
+    if vector_format == "int8":
+        return quantize_int8(vectors)
+    if vector_format == "bit":
+        return quantize_bit(vectors)
+    return np.ascontiguousarray(vectors, dtype=np.float32)
+
+
+def dequantize_int8(blob: bytes) -> np.ndarray:
+    return np.frombuffer(blob, dtype=np.int8).astype(np.float32) / INT8_SCALE
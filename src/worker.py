@@ -0,0 +1,137 @@
+"""
+Execução das tools fora do event loop do MCP.
+
+O trabalho bloqueante (embedding e consultas sqlite) roda num pool limitado
+de threads, com tempo limite por requisição. Quando a requisição expira ou
+é cancelada pelo cliente, as consultas em andamento são interrompidas
+(Connection.interrupt) e a thread desiste do restante do trabalho.
+
+A resposta de uma requisição expirada sai na hora, mas a vaga no pool só é
+devolvida quando a thread termina: o embedding (ONNX) e o cross-encoder não
+são interrompíveis, e liberar a vaga antes deixaria mais de WORKERS threads
+ocupando a CPU sob timeouts repetidos.
+"""
+
+import contextvars
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Callable, Iterator, TypeVar
+
+import anyio
+
+from src.db import ConnectionPool
+
+# Threads que executam buscas ao mesmo tempo; as demais requisições aguardam na fila
+WORKERS = int(os.getenv("SEARCH_WORKERS", "4"))
+# Tempo limite por requisição (segundos), incluindo a espera na fila
+TIMEOUT = float(os.getenv("SEARCH_TIMEOUT", "30"))
+
+T = TypeVar("T")
+
+
+class RequestCancelled(Exception):
+    """A requisição expirou ou foi cancelada; o trabalho restante é descartado."""
+
+
+class _Scope:
+    """Estado de uma requisição: se foi cancelada e quais conexões ela está usando."""
+
+    def __init__(self) -> None:
+        self.cancelled = False
+        self.connections: set[sqlite3.Connection] = set()
+        self.lock = threading.Lock()
+        self.started = False  # a thread começou a executar o trabalho
+        self.released = False  # a vaga no pool já foi devolvida
+
+    def cancel(self) -> None:
+        with self.lock:
+            self.cancelled = True
+            for con in self.connections:
+                con.interrupt()
+
+
+_scope: contextvars.ContextVar[_Scope | None] = contextvars.ContextVar("request_scope", default=None)
+_limiter: anyio.CapacityLimiter | None = None
+
+
+def check_cancelled() -> None:
+    """Levanta RequestCancelled se a requisição corrente já expirou."""
+    scope = _scope.get()
+    if scope is not None and scope.cancelled:
+        raise RequestCancelled()
+
+
+@contextmanager
+def connection(pool: ConnectionPool) -> Iterator[sqlite3.Connection]:
+    """Conexão do pool registrada na requisição corrente, para poder ser interrompida."""
+    scope = _scope.get()
+    with pool.connection() as con:
+        if scope is None:
+            yield con
+            return
+        with scope.lock:
+            if scope.cancelled:
+                raise RequestCancelled()
+            scope.connections.add(con)
+        try:
+            yield con
+        finally:
+            with scope.lock:
+                scope.connections.discard(con)
+
+
+async def run_blocking(fn: Callable[..., T], *args, timeout: float = TIMEOUT) -> T:
+    """Executa fn(*args) no pool de threads, com tempo limite.
+
+    Levanta TimeoutError se o prazo estourar; nesse caso (ou se a requisição
+    for cancelada) as consultas sqlite da thread são interrompidas.
+    """
+    global _limiter
+    if _limiter is None:
+        # Criado sob demanda: precisa existir dentro do event loop
+        _limiter = anyio.CapacityLimiter(WORKERS)
+    limiter = _limiter
+
+    scope = _Scope()
+
+    def release() -> None:
+        with scope.lock:
+            if scope.released:
+                return
+            scope.released = True
+        limiter.release_on_behalf_of(scope)
+
+    def call() -> T:
+        with scope.lock:
+            if scope.released:
+                raise RequestCancelled()
+            scope.started = True
+        try:
+            _scope.set(scope)
+            return fn(*args)
+        finally:
+            # A vaga volta ao pool só agora, mesmo que a requisição já tenha desistido
+            try:
+                anyio.from_thread.run_sync(release)
+            except RuntimeError:
+                pass  # event loop encerrado
+
+    try:
+        with anyio.fail_after(timeout):
+            # A fila de espera fica no event loop; a vaga é da requisição, não da thread
+            await limiter.acquire_on_behalf_of(scope)
+            try:
+                return await anyio.to_thread.run_sync(call, abandon_on_cancel=True)
+            except BaseException:
+                # Se a thread nem começou, a vaga é devolvida aqui (e call desiste ao começar)
+                with scope.lock:
+                    unstarted = not scope.started and not scope.released
+                    scope.released = scope.released or unstarted
+                if unstarted:
+                    limiter.release_on_behalf_of(scope)
+                raise
+    except BaseException:
+        scope.cancel()
+        raise
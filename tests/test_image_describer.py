@@ -0,0 +1,242 @@
+"""
+Testes do image_describer contra um endpoint local compatível com a API da OpenAI.
+
+O servidor fake responde /v1/chat/completions com uma sequência roteirizada
+de respostas (429, 503, 200...) e registra o instante de cada requisição,
+então os testes exercitam o cliente real da openai, sem rede e sem chave.
+
+Uso:
+    pip install -e ".[ingest]" pytest
+    python -m pytest tests
+"""
+
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("openai")
+pytest.importorskip("dotenv")
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from ingest import image_describer  # noqa: E402
+
+
+def _completion(text: str) -> dict:
+    return {
+        "id": "chatcmpl-fake",
+        "object": "chat.completion",
+        "created": 0,
+        "model": image_describer.VISION_MODEL,
+        "choices": [
+            {"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}
+        ],
+        "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+    }
+
+
+class _FakeOpenAI:
+    """Endpoint fake: cada requisição consome a próxima resposta do roteiro."""
+
+    def __init__(self) -> None:
+        self.script: list[tuple[int, dict, dict]] = []
+        self.requests: list[tuple[float, dict]] = []
+        self._lock = threading.Lock()
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self) -> None:
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                with fake._lock:
+                    fake.requests.append((time.monotonic(), body))
+                    status, headers, payload = (
+                        fake.script.pop(0) if fake.script else (200, {}, _completion("descrição"))
+                    )
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args) -> None:
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self._server.server_address[1]}/v1"
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True
+        )
+        self._thread.start()
+
+    def respond(self, status: int, headers: dict | None = None, payload: dict | None = None) -> None:
+        if payload is None:
+            payload = _completion("descrição") if status == 200 else {"error": {"message": str(status)}}
+        self.script.append((status, headers or {}, payload))
+
+    def close(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+
+@pytest.fixture
+def api(monkeypatch, tmp_path):
+    fake = _FakeOpenAI()
+    monkeypatch.setenv("OPENAI_BASE_URL", fake.base_url)
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    # Cliente, cache e backoff novos por teste
+    monkeypatch.setattr(image_describer, "_client", None)
+    monkeypatch.setattr(image_describer, "_cache", image_describer._DescriptionCache(tmp_path / "cache.db"))
+    monkeypatch.setattr(image_describer, "_gate", image_describer._RateLimitGate())
+    monkeypatch.setattr(image_describer.random, "random", lambda: 0.0)
+    yield fake
+    fake.close()
+
+
+@pytest.fixture
+def image(tmp_path) -> Path:
+    path = tmp_path / "docs" / "dashboards-html5" / "images" / "tela.png"
+    path.parent.mkdir(parents=True)
+    path.write_bytes(b"\x89PNG fake")
+    return path
+
+
+def _create():
+    return image_describer._create_with_retry(model=image_describer.VISION_MODEL, messages=[], max_tokens=8)
+
+
+# ── _create_with_retry e _RateLimitGate ──────────────────────────────────────
+def test_retry_after_429_waits_retry_after(api):
+    api.respond(429, {"retry-after": "0.3"})
+    api.respond(200, payload=_completion("ok"))
+
+    response = _create()
+
+    assert response.choices[0].message.content == "ok"
+    assert len(api.requests) == 2
+    assert api.requests[1][0] - api.requests[0][0] >= 0.3
+
+
+def test_429_without_retry_after_uses_exponential_backoff(api, monkeypatch):
+    pauses = []
+    monkeypatch.setattr(image_describer._gate, "pause", pauses.append)
+    for _ in range(3):
+        api.respond(429)
+    api.respond(200)
+
+    _create()
+
+    assert pauses == [1.0, 2.0, 4.0]
+    assert len(api.requests) == 4
+
+
+def test_429_pauses_every_thread(api):
+    api.respond(429, {"retry-after": "0.4"})
+    first = threading.Thread(target=_create)
+    first.start()
+    # Espera a primeira thread receber o 429 e acionar a pausa
+    while image_describer._gate._until <= time.monotonic():
+        time.sleep(0.005)
+    # Outra thread que começa durante a pausa não chega a chamar a API antes do fim dela
+    second = threading.Thread(target=_create)
+    second.start()
+    first.join()
+    second.join()
+
+    times = [t for t, _ in api.requests]
+    assert len(times) == 3
+    assert min(times[1:]) - times[0] >= 0.4
+
+
+def test_gate_wait_blocks_until_pause_ends():
+    gate = image_describer._RateLimitGate()
+    gate.pause(0.2)
+    gate.pause(0.05)  # uma pausa menor não encurta a que já está valendo
+    t0 = time.monotonic()
+    gate.wait()
+    assert time.monotonic() - t0 >= 0.19
+
+
+def test_server_error_retries_with_backoff(api, monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(image_describer.time, "sleep", sleeps.append)
+    api.respond(503)
+    api.respond(500)
+    api.respond(200)
+
+    _create()
+
+    assert sleeps == [1.0, 2.0]
+    assert len(api.requests) == 3
+
+
+def test_gives_up_after_max_retries(api, monkeypatch):
+    monkeypatch.setattr(image_describer, "MAX_RETRIES", 2)
+    for _ in range(5):
+        api.respond(429, {"retry-after": "0"})
+
+    t0 = time.monotonic()
+    with pytest.raises(image_describer.openai.RateLimitError):
+        _create()
+    assert len(api.requests) == 3
+    # Retry-After: 0 vale como "tente já", não como ausência do cabeçalho
+    assert time.monotonic() - t0 < 1.0
+
+
+# ── _DescriptionCache ────────────────────────────────────────────────────────
+def test_cache_hit_skips_api(api, image):
+    api.respond(200, payload=_completion("  tela de boletos  "))
+
+    first = image_describer.describe_image(image)
+    second = image_describer.describe_image(image)
+
+    assert first["text"] == second["text"] == "tela de boletos"
+    assert first["collection"] == "dashboards-html5"
+    assert len(api.requests) == 1
+
+
+def test_cache_is_keyed_by_content(api, image):
+    image_describer.describe_image(image)
+    copy = image.with_name("copia.png")
+    copy.write_bytes(image.read_bytes())
+    image_describer.describe_image(copy)
+    assert len(api.requests) == 1
+
+    image.write_bytes(b"\x89PNG outra imagem")
+    image_describer.describe_image(image)
+    assert len(api.requests) == 2
+
+
+def test_cache_is_keyed_by_prompt_version(api, image, monkeypatch):
+    version = image_describer.PROMPT_VERSION
+    api.respond(200, payload=_completion("v1"))
+    api.respond(200, payload=_completion("v2"))
+    assert image_describer.describe_image(image)["text"] == "v1"
+
+    monkeypatch.setattr(image_describer, "PROMPT_VERSION", "outra-versao")
+    assert image_describer.describe_image(image)["text"] == "v2"
+    # A versão original continua em cache
+    monkeypatch.setattr(image_describer, "PROMPT_VERSION", version)
+    assert image_describer.describe_image(image)["text"] == "v1"
+    assert len(api.requests) == 2
+
+
+def test_cache_persists_across_instances(tmp_path):
+    path = tmp_path / "cache.db"
+    image_describer._DescriptionCache(path).put("abc", "descrição")
+    assert image_describer._DescriptionCache(path).get("abc") == "descrição"
+    assert image_describer._DescriptionCache(path).get("def") is None
+
+
+def test_describe_images_reports_failures(api, image, monkeypatch):
+    monkeypatch.setattr(image_describer, "MAX_RETRIES", 0)
+    api.respond(400)
+    results = dict(image_describer.describe_images([image]))
+    assert isinstance(results[image], image_describer.openai.BadRequestError)